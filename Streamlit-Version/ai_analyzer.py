@@ -3,151 +3,684 @@ AI塔罗牌分析器
 使用aihubmix API调用LLM进行四季牌阵的深度分析
 """
 
+import hashlib
 import json
-import requests
-from typing import Dict, List, Optional, Any
+import threading
+import time
+import http_client
+import metrics
+from circuit_breaker import CircuitOpenError
+from deadline import Deadline, DeadlineExceeded
+from interpretations import OfflineInterpreter, get_offline_interpreter
+from lazy_imports import lazy_import
+from response_cache import ResponseCache, get_response_cache, make_cache_key
+from provider_router import Provider, ProviderError, ProviderRouter, get_provider_router, is_client_error
+from single_flight import SingleFlight, get_single_flight
+from usage import UsageRecord, UsageTracker, get_usage_tracker
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Any, Iterator, Tuple
 from config import Config
-from 四季牌阵 import Card, MajorArcana, MinorArcana
+from 四季牌阵 import Card, FOUR_SEASONS
 
-class TarotAIAnalyzer:
-    """AI塔罗牌分析器"""
+# 只在 except 子句中用到，出现异常时才会真正加载
+requests = lazy_import("requests")
+
+# 完整分析由三部分组成，键名与 analysis_results 保持一致
+ANALYSIS_PARTS = ("full_analysis", "insight", "seasonal_advice")
+
+# 系统提示词，定义AI的角色和任务
+# 所有请求的系统提示词逐字节相同，且每个用户提示词都是“固定说明在前、卡牌信息在后”，
+# 使相同方法的请求共享尽可能长的前缀，便于命中服务商的提示词前缀缓存
+SYSTEM_PROMPT = """你是一位经验丰富的塔罗牌占卜师和心灵导师，专精于四季牌阵的解读。
+
+你的专业特长包括：
+1. 深度理解塔罗牌的象征意义和灵性内涵
+2. 精通四季牌阵的布局和各位置的含义
+3. 能够将牌面含义与现实生活情况相结合
+4. 提供富有洞察力和启发性的指导建议
+5. 用温暖、智慧的语言与咨询者沟通
+
+四季牌阵说明：
+- 1号位置（权杖牌组）：行动力 - 关于意志、创造与行动层面
+- 2号位置（圣杯牌组）：情感状态 - 关于情绪、感觉与感性层面  
+- 3号位置（宝剑牌组）：理性思维 - 关于理性、思维与关系层面
+- 4号位置（金币牌组）：事业财务 - 关于感官、现实与物质层面
+- 5号位置（大阿尔卡纳）：心灵成长 - 关于灵魂课题和精神成长
+
+请用专业、温暖、富有洞察力的语言进行解读，避免过于绝对化的预言，而是提供启发性的指导。"""
+
+# 进程内共享的分析线程池，避免每次分析都创建线程
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    """获取共享的分析线程池"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=Config.ANALYSIS_WORKERS,
+                    thread_name_prefix="tarot-analysis"
+                )
+    return _executor
+
+# 预先分析专用的线程池：没有点击分析的用户的预先分析不会排在点击分析的请求前面
+_speculation_executor: Optional[ThreadPoolExecutor] = None
+_speculation_pending = 0
+
+def _get_speculation_executor() -> ThreadPoolExecutor:
+    """获取预先分析线程池"""
+    global _speculation_executor
+    if _speculation_executor is None:
+        with _executor_lock:
+            if _speculation_executor is None:
+                _speculation_executor = ThreadPoolExecutor(
+                    max_workers=Config.SPECULATION_WORKERS,
+                    thread_name_prefix="tarot-speculation"
+                )
+    return _speculation_executor
+
+class TarotAnalyzerBase:
+    """
+    分析器公共部分：配置、牌阵、回复缓存、提示词构建和结构化输出解析
     
-    def __init__(self):
-        """初始化分析器"""
-        self.config = Config
+    同步的 TarotAIAnalyzer 和异步的 AsyncTarotAIAnalyzer 共用这些逻辑，
+    只在发送请求的方式上不同。
+    """
+    
+    def __init__(self, plan=FOUR_SEASONS, cache: Optional[ResponseCache] = None,
+                 usage: Optional[UsageTracker] = None, router: Optional[ProviderRouter] = None,
+                 offline: Optional[OfflineInterpreter] = None, config=None):
+        """
+        初始化分析器
         
-    def _make_api_request(self, prompt: str, max_tokens: int = None) -> Optional[str]:
+        Args:
+            plan: 要分析的牌阵（编译后的 DrawPlan），默认为四季牌阵
+            cache: 回复缓存，默认使用进程级共享缓存（Config.CACHE_ENABLED 为False时不缓存）
+            usage: 用量统计，默认使用进程级共享实例
+            router: 服务商路由器，默认使用进程级共享实例（默认服务商 + Config.PROVIDERS）
+            offline: 离线解读器，AI请求失败或超时时用它生成回退文本，默认使用该牌阵的共享实例
+            config: 配置快照（ConfigSnapshot），每个会话传入自己的快照时互不影响；默认使用全局 Config 类
+        """
+        self.config = config if config is not None else Config
+        self.plan = plan
+        self.cache = cache if cache is not None else get_response_cache()
+        self.usage = usage if usage is not None else get_usage_tracker()
+        self.router = router if router is not None else get_provider_router()
+        self.offline = offline if offline is not None else get_offline_interpreter(plan)
+    
+    def _build_request_data(self, prompt: str, max_tokens: int = None,
+                            response_format: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
         """
-        向aihubmix API发送请求
+        构建chat/completions请求体
         
         Args:
             prompt: 发送给AI的提示词
             max_tokens: 最大token数量
+            response_format: 结构化输出格式
             
         Returns:
-            AI的回复内容，失败时返回None
+            请求体字典
         """
         if not self.config.is_configured():
             raise ValueError("API密钥未配置，请先设置aihubmix API密钥")
         
+        data = {
+            "model": self.config.DEFAULT_MODEL,
+            "messages": [
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens or self.config.MAX_TOKENS,
+            "temperature": self.config.TEMPERATURE
+        }
+        if response_format:
+            data["response_format"] = response_format
+        return data
+    
+    def _build_prompt(self, method: str, reading: Dict[int, Card]) -> Tuple[str, str]:
+        """
+        整理卡牌信息并构建指定方法的提示词，耗时记入 tarot_prompt_build_seconds
+        
+        Args:
+            method: 调用方法：full_analysis、insight、seasonal_advice 或 combined
+            reading: 抽牌结果字典
+            
+        Returns:
+            (卡牌信息文本, 提示词)
+        """
+        builders = {
+            "full_analysis": self._build_analysis_prompt,
+            "insight": self._build_insight_prompt,
+            "seasonal_advice": self._build_advice_prompt,
+            "combined": self._build_combined_prompt,
+        }
+        with metrics.PROMPT_BUILD_SECONDS.time(method=method):
+            cards_text = self._format_cards_for_prompt(reading)
+            return cards_text, builders[method](cards_text)
+    
+    def _record_usage(self, method: str, model: str, usage: Optional[Dict[str, Any]], latency: float,
+                      ttfb: Optional[float] = None, streamed: bool = False):
+        """记录一次上游调用的用量（usage 为响应中的 usage 字段）和耗时、首字节时间、生成速度指标"""
+        record = UsageRecord.from_response(method, model, usage, latency)
+        self.usage.record(record)
+        metrics.record_upstream(method, model, latency, record.prompt_tokens, record.completion_tokens,
+                                record.cached_tokens, ttfb, streamed)
+    
+    def _record_cache_hit(self, method: str, data: Dict[str, Any]):
+        """记录一次由本地回复缓存返回、未发往上游的调用"""
+        self.usage.record(UsageRecord(method=method, model=data["model"], from_cache=True))
+    
+    @staticmethod
+    def _record_error(method: str, model: str, kind: str):
+        """记录一次失败的AI请求，kind 取值参见 metrics.ERRORS"""
+        metrics.ERRORS.inc(method=method, model=model, kind=kind)
+    
+    @staticmethod
+    def _observe_request(method: str, data: Dict[str, Any], started: float, succeeded: bool,
+                         from_cache: bool = False):
+        """记录一次AI请求从查缓存到得到结果的耗时，按来源（缓存、上游、回退）区分"""
+        source = "cache" if from_cache else ("upstream" if succeeded else "fallback")
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, method=method, model=data["model"],
+                                        source=source)
+    
+    def _cache_lookup(self, data: Dict[str, Any], method: str) -> Tuple[str, Optional[str]]:
+        """
+        查询回复缓存，启用缓存时把命中与否记入指标
+        
+        Args:
+            data: 请求体（不含 stream 字段）
+            method: 调用方法标签
+            
+        Returns:
+            (请求键, 缓存内容)，请求键同时用于缓存和进行中请求合并；未启用缓存或未命中时缓存内容为None
+        """
+        cache_key = make_cache_key(**data)
+        if self.cache is None:
+            return cache_key, None
+        cached = self.cache.get(cache_key)
+        metrics.record_cache_lookup(method, cached is not None)
+        return cache_key, cached
+    
+    def _flight_key(self, cache_key: str) -> str:
+        """
+        进行中请求合并的键：请求键加上本会话凭据（API地址和密钥）的指纹，
+        使用不同密钥的会话不合并，不会共享彼此的失败、取消和API额度
+        
+        Args:
+            cache_key: 请求键
+            
+        Returns:
+            合并键
+        """
+        credential = f"{self.config.API_BASE_URL}\0{self.config.API_KEY or ''}"
+        return f"{cache_key}:{hashlib.sha256(credential.encode('utf-8')).hexdigest()[:16]}"
+    
+    def _cache_store(self, cache_key: str, content: Optional[str],
+                     cache_ttl: Optional[float] = None):
+        """将非空回复写入缓存"""
+        if content and self.cache is not None:
+            self.cache.set(cache_key, content, cache_ttl)
+    
+    def _get_system_prompt(self) -> str:
+        """获取系统提示词，定义AI的角色和任务"""
+        return SYSTEM_PROMPT
+
+    def _format_cards_for_prompt(self, reading: Dict[int, Card]) -> str:
+        """
+        将抽牌结果格式化为适合AI分析的文本
+        
+        Args:
+            reading: 抽牌结果字典
+            
+        Returns:
+            格式化后的卡牌信息文本
+        """
+        return self.plan.format_prompt(reading)
+    
+    def _build_analysis_prompt(self, cards_text: str) -> str:
+        """构建详细分析的提示词（不再包含用户问题）"""
+        return f"""请对下方的四季牌阵进行深度分析，从以下几个方面分析接下来季节的能量流动：
+
+1. 整体概述：这个牌阵传达的核心信息和季节主题
+2. 逐位解读：每个位置的牌面含义及其对应生活层面的能量指导
+3. 牌面关联：不同位置之间的相互关系和能量流动模式
+4. 实用建议：基于牌阵给出的具体行动建议和注意事项
+5. 灵性指引：这个季度的精神成长方向和内在智慧
+
+请用专业而温暖的语言，为咨询者提供富有启发性的季节性指导。
+
+四季牌阵：
+{cards_text}"""
+    
+    def _build_insight_prompt(self, cards_text: str) -> str:
+        """构建快速洞察的提示词"""
+        return f"""请基于下方的四季牌阵结果给出一句话的核心洞察，用一句富有诗意和启发性的话语来概括这个牌阵的核心信息。
+
+四季牌阵：
+{cards_text}"""
+    
+    def _build_advice_prompt(self, cards_text: str) -> str:
+        """构建季节建议的提示词"""
+        return f"""请基于下方的四季牌阵，为每个生活层面提供简洁的季节性建议。
+
+请分别为以下五个方面给出1-2句具体的行动建议：
+1. 行动力建议
+2. 情感状态建议  
+3. 理性思维建议
+4. 事业财务建议
+5. 心灵成长建议
+
+格式要求：每个建议控制在50字以内，语言温暖而具有指导性。
+
+四季牌阵：
+{cards_text}"""
+    
+    def _build_combined_prompt(self, cards_text: str) -> str:
+        """构建一次性返回三项结果的结构化输出提示词"""
+        return f"""请对下方的四季牌阵进行完整解读，并以JSON对象格式回复。
+
+JSON对象必须包含以下三个字符串字段：
+- "full_analysis"：深度分析，依次包括整体概述、逐位解读、牌面关联、实用建议和灵性指引
+- "insight"：一句富有诗意和启发性的话，概括这个牌阵的核心信息
+- "seasonal_advice"：分别为行动力、情感状态、理性思维、事业财务、心灵成长五个方面给出1-2句建议，每条控制在50字以内
+
+只输出JSON对象，不要输出其他内容。请用专业而温暖的语言，为咨询者提供富有启发性的季节性指导。
+
+四季牌阵：
+{cards_text}"""
+    
+    @staticmethod
+    def _parse_combined_response(content: Optional[str]) -> Dict[str, str]:
+        """
+        解析结构化输出，返回其中有效（非空字符串）的字段
+        
+        Args:
+            content: AI的回复内容
+            
+        Returns:
+            有效字段组成的字典，解析失败时为空字典
+        """
+        if not content:
+            return {}
+        text = content.strip()
+        # 兼容模型把JSON包在 ```json 代码块中的情况
+        if text.startswith("```"):
+            text = text.strip("`")
+            if text.startswith("json"):
+                text = text[len("json"):]
         try:
-            # 准备请求数据
-            data = {
-                "model": self.config.DEFAULT_MODEL,
-                "messages": [
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": max_tokens or self.config.MAX_TOKENS,
-                "temperature": self.config.TEMPERATURE
-            }
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"结构化输出JSON解析错误: {e}")
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        
+        results = {}
+        for part in ANALYSIS_PARTS:
+            value = data.get(part)
+            # 季节建议可能被返回为按层面分组的对象或列表
+            if isinstance(value, dict):
+                value = "\n".join(f"{key}：{advice}" for key, advice in value.items())
+            elif isinstance(value, list):
+                value = "\n".join(str(item) for item in value)
+            if isinstance(value, str) and value.strip():
+                results[part] = value.strip()
+        return results
+
+class TarotAIAnalyzer(TarotAnalyzerBase):
+    """AI塔罗牌分析器"""
+    
+    def __init__(self, plan=FOUR_SEASONS, cache: Optional[ResponseCache] = None,
+                 flight: Optional[SingleFlight] = None, usage: Optional[UsageTracker] = None,
+                 router: Optional[ProviderRouter] = None, config=None):
+        """
+        初始化分析器
+        
+        Args:
+            plan: 要分析的牌阵（编译后的 DrawPlan），默认为四季牌阵
+            cache: 回复缓存，默认使用进程级共享缓存
+            flight: 进行中请求合并器，默认使用进程级共享实例（Config.SINGLE_FLIGHT_ENABLED 为False时不合并）
+            usage: 用量统计，默认使用进程级共享实例
+            router: 服务商路由器，默认使用进程级共享实例
+            config: 配置快照（ConfigSnapshot），默认使用全局 Config 类
+        """
+        super().__init__(plan, cache, usage, router, config=config)
+        self.flight = flight if flight is not None else get_single_flight()
+    
+    def warm_up(self, background: bool = True) -> Optional[bool]:
+        """
+        预热HTTP连接池，让第一个分析请求不必等待DNS、TCP和TLS握手
+        
+        Args:
+            background: 是否在后台线程执行（每个进程只执行一次）
             
-            # 发送请求
-            response = requests.post(
-                f"{self.config.API_BASE_URL}/chat/completions",
-                headers=self.config.get_api_headers(),
-                json=data,
-                timeout=30
-            )
+        Returns:
+            同步执行时返回是否成功建立连接
+        """
+        headers = self.config.get_api_headers() if self.config.is_configured() else None
+        if background:
+            http_client.warm_up_in_background(self.config.API_BASE_URL, headers)
+            return None
+        return http_client.warm_up(self.config.API_BASE_URL, headers, self.config.HTTP_WARM_CONNECTIONS)
+        
+    def _make_api_request(self, prompt: str, max_tokens: int = None,
+                          response_format: Optional[Dict[str, str]] = None,
+                          cache_ttl: Optional[float] = None,
+                          method: str = "full_analysis",
+                          deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        向aihubmix API发送请求，相同的请求优先从缓存返回
+        
+        Args:
+            prompt: 发送给AI的提示词
+            max_tokens: 最大token数量
+            response_format: 结构化输出格式，例如 {"type": "json_object"}
+            cache_ttl: 本次回复的缓存时间（秒），默认 Config.CACHE_TTL_ANALYSIS
+            method: 用量统计中的调用方法标签
+            deadline: 本次解读的总时限，到期后不再等待
             
-            # 检查响应状态
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('choices', [{}])[0].get('message', {}).get('content', '')
-            else:
-                print(f"API请求失败: {response.status_code} - {response.text}")
-                return None
-                
+        Returns:
+            AI的回复内容，失败、熔断或超过总时限时返回None
+        """
+        started = time.perf_counter()
+        data = self._build_request_data(prompt, max_tokens, response_format)
+        
+        # 相同的模型、提示词和参数直接返回缓存的回复
+        cache_key, cached = self._cache_lookup(data, method)
+        if cached is not None:
+            self._record_cache_hit(method, data)
+            self._observe_request(method, data, started, True, from_cache=True)
+            return cached
+        
+        content = None
+        if deadline is not None and deadline.expired():
+            print(f"分析总时限已到，跳过请求: {method}")
+            self._record_error(method, data["model"], "deadline")
+        elif self.flight is None:
+            content = self._send_request(data, cache_key, cache_ttl, method, deadline)
+        else:
+            # 其他会话正在发送完全相同的请求时，等待并共享它的结果（最多等到本次解读的总时限）
+            try:
+                content = self.flight.do(
+                    self._flight_key(cache_key),
+                    lambda: self._send_request(data, cache_key, cache_ttl, method, deadline),
+                    timeout=deadline.remaining() if deadline is not None else None
+                )
+            except TimeoutError:
+                print(f"分析总时限已到，放弃等待: {method}")
+                self._record_error(method, data["model"], "deadline")
+        self._observe_request(method, data, started, bool(content))
+        return content
+    
+    def _send_request(self, data: Dict[str, Any], cache_key: str,
+                      cache_ttl: Optional[float] = None, method: str = "full_analysis",
+                      deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        经服务商路由器发送请求（最快的可用后端 + 对冲 + 故障转移 + 熔断），
+        把成功的回复写入缓存，失败时返回None
+        """
+        try:
+            content = self.router.call(
+                lambda provider: self._post_to_provider(provider, data, method, deadline),
+                kind=method,
+                deadline=deadline,
+                config=self.config
+            )
+            self._cache_store(cache_key, content, cache_ttl)
+            return content
+        
+        except CircuitOpenError as e:
+            print(f"API请求被熔断: {e}")
+            self._record_error(method, data["model"], "circuit_open")
+            return None
+        except DeadlineExceeded as e:
+            print(f"分析总时限已到: {e}")
+            self._record_error(method, data["model"], "deadline")
+            return None
+        except ProviderError as e:
+            print(f"API请求失败: {e}")
+            self._record_error(method, data["model"], "provider")
+            return None
         except requests.exceptions.Timeout:
             print("API请求超时")
+            self._record_error(method, data["model"], "timeout")
             return None
         except requests.exceptions.RequestException as e:
             print(f"API请求异常: {e}")
+            self._record_error(method, data["model"], "network")
             return None
         except json.JSONDecodeError as e:
             print(f"JSON解析错误: {e}")
+            self._record_error(method, data["model"], "parse")
             return None
         except Exception as e:
             print(f"未知错误: {e}")
+            self._record_error(method, data["model"], "unknown")
             return None
     
-    def _get_system_prompt(self) -> str:
-        """获取系统提示词，定义AI的角色和任务"""
-        return """你是一位经验丰富的塔罗牌占卜师和心灵导师，专精于四季牌阵的解读。
-
-你的专业特长包括：
-1. 深度理解塔罗牌的象征意义和灵性内涵
-2. 精通四季牌阵的布局和各位置的含义
-3. 能够将牌面含义与现实生活情况相结合
-4. 提供富有洞察力和启发性的指导建议
-5. 用温暖、智慧的语言与咨询者沟通
-
-四季牌阵说明：
-- 1号位置（权杖牌组）：行动力 - 关于意志、创造与行动层面
-- 2号位置（圣杯牌组）：情感状态 - 关于情绪、感觉与感性层面  
-- 3号位置（宝剑牌组）：理性思维 - 关于理性、思维与关系层面
-- 4号位置（金币牌组）：事业财务 - 关于感官、现实与物质层面
-- 5号位置（大阿尔卡纳）：心灵成长 - 关于灵魂课题和精神成长
-
-请用专业、温暖、富有洞察力的语言进行解读，避免过于绝对化的预言，而是提供启发性的指导。"""
-
-    def _format_cards_for_prompt(self, reading: Dict[int, Card]) -> str:
+    def _before_upstream_attempt(self, data: Dict[str, Any]):
         """
-        将抽牌结果格式化为适合AI分析的文本
+        每次实际向后端发送请求之前调用（包括对冲、故障转移和429/5xx重试），默认不做任何事
         
         Args:
-            reading: 抽牌结果字典
-            
+            data: 请求体
+        """
+    
+    def _post_to_provider(self, provider: Provider, data: Dict[str, Any], method: str,
+                          deadline: Optional[Deadline] = None) -> str:
+        """
+        向指定后端发送一次请求并记录用量（被放弃的对冲请求同样计费，也会记录）
+        
+        指定总时限时请求超时不超过剩余时间，超过总时限被放弃的请求也会很快结束。
+        
         Returns:
-            格式化后的卡牌信息文本
+            回复内容；失败时抛出异常，由路由器决定是否转移到其他后端
         """
-        card_info = []
-        position_names = {
-            1: "1号位置（权杖牌组-行动力）",
-            2: "2号位置（圣杯牌组-情感状态）", 
-            3: "3号位置（宝剑牌组-理性思维）",
-            4: "4号位置（金币牌组-事业财务）",
-            5: "5号位置（大阿尔卡纳-心灵成长）"
-        }
+        started = time.perf_counter()
+        # 通过共享连接池发送请求，429/5xx会自动退避重试
+        try:
+            response = http_client.post_with_retry(
+                f"{provider.resolved_base_url(self.config)}/chat/completions",
+                headers=provider.headers(self.config),
+                payload={**data, "model": provider.resolved_model(self.config)},
+                timeout=self.config.REQUEST_TIMEOUT,
+                before_attempt=lambda: self._before_upstream_attempt(data),
+                deadline=deadline
+            )
+        except requests.exceptions.Timeout:
+            # 超时被总时限截短时，不算作后端变慢
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded(f"{provider.name}: 请求超过分析总时限")
+            raise
+        if response.status_code != 200:
+            raise ProviderError(f"{provider.name}: {response.status_code} - {response.text}", response.status_code)
+        result = response.json()
+        content = result.get('choices', [{}])[0].get('message', {}).get('content', '')
+        # response.elapsed：从发出请求到解析完响应头的时间（最后一次尝试）
+        self._record_usage(method, provider.resolved_model(self.config), result.get('usage'), time.perf_counter() - started,
+                           ttfb=response.elapsed.total_seconds())
+        return content
+    
+    def _stream_api_request(self, prompt: str, max_tokens: int = None,
+                            cache_ttl: Optional[float] = None,
+                            method: str = "full_analysis",
+                            deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """
+        以流式（SSE）方式向aihubmix API发送请求，逐段返回生成的文本
+        
+        命中缓存时一次性返回缓存内容；流完整结束后写入缓存。
+        
+        Args:
+            prompt: 发送给AI的提示词
+            max_tokens: 最大token数量
+            cache_ttl: 本次回复的缓存时间（秒），默认 Config.CACHE_TTL_ANALYSIS
+            method: 用量统计中的调用方法标签
+            deadline: 本次解读的总时限，到期后停止输出（已输出的片段保留）
+            
+        Yields:
+            增量文本片段；请求失败时不产生任何片段
+        """
+        started = time.perf_counter()
+        data = self._build_request_data(prompt, max_tokens)
+        
+        cache_key, cached = self._cache_lookup(data, method)
+        if cached is not None:
+            self._record_cache_hit(method, data)
+            self._observe_request(method, data, started, True, from_cache=True)
+            yield cached
+            return
+        
+        def _upstream():
+            return self._stream_upstream(data, cache_key, cache_ttl, method, deadline)
         
-        for position in [5, 1, 2, 3, 4]:  # 按重要性排序
-            card = reading[position]
-            card_info.append(f"{position_names[position]}：{card.name}")
+        received = False
+        try:
+            if self.flight is None:
+                chunks = _upstream()
+            else:
+                # 相同的流正在进行中时，先补齐已生成的片段，再跟随后续片段
+                chunks = self.flight.stream(
+                    self._flight_key(cache_key), _upstream, timeout=deadline.remaining() if deadline is not None else None
+                )
+            for chunk in chunks:
+                received = True
+                yield chunk
+        except TimeoutError:
+            print("分析总时限已到，停止流式输出")
+            self._record_error(method, data["model"], "deadline")
+        finally:
+            self._observe_request(method, data, started, received)
+    
+    def _stream_upstream(self, data: Dict[str, Any], cache_key: str,
+                         cache_ttl: Optional[float] = None, method: str = "full_analysis",
+                         deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """
+        向当前最快的可用后端发送流式请求并逐段返回文本，流完整结束后写入缓存并记录用量
+        
+        流式请求不做对冲（两个流无法合并），只把成败计入路由器的熔断器。
+        """
+        provider = self.router.pick(method, self.config)
+        if provider is None:
+            print("API流式请求失败: 没有可用的服务商（未配置密钥或已熔断）")
+            self._record_error(method, data["model"], "circuit_open")
+            return
+        model = provider.resolved_model(self.config)
+        chunks = []
+        usage = None
+        started = time.perf_counter()
+        ttfb = None
+        # 调用方提前停止读取或超过总时限时保持None，不计入熔断器
+        succeeded: Optional[bool] = None
+        payload = {**data, "model": model, "stream": True}
+        if provider.stream_usage:
+            # include_usage：最后一个事件携带整次调用的 usage（只发给确认支持的后端）
+            payload["stream_options"] = {"include_usage": True}
+        try:
+            response = http_client.post_with_retry(
+                f"{provider.resolved_base_url(self.config)}/chat/completions",
+                headers=provider.headers(self.config),
+                payload=payload,
+                timeout=self.config.REQUEST_TIMEOUT,
+                before_attempt=lambda: self._before_upstream_attempt(data),
+                deadline=deadline,
+                stream=True
+            )
+            with response:
+                if response.status_code != 200:
+                    # 4xx是本次请求或密钥的问题，不计入熔断器
+                    succeeded = None if is_client_error(response.status_code) else False
+                    print(f"API流式请求失败: {provider.name}: {response.status_code} - {response.text}")
+                    self._record_error(method, model, "provider")
+                    return
+                
+                # chunk_size=None：分块传输时每收到一块就立即处理，不等缓冲区填满；
+                # 按字节分行后再以UTF-8解码（SSE规定UTF-8，部分后端不声明charset）
+                for raw_line in response.iter_lines(chunk_size=None):
+                    line = raw_line.decode("utf-8")
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    event = json.loads(payload)
+                    usage = event.get('usage') or usage
+                    choices = event.get('choices') or [{}]
+                    delta = choices[0].get('delta', {}).get('content')
+                    if delta:
+                        if ttfb is None:
+                            ttfb = time.perf_counter() - started
+                        chunks.append(delta)
+                        yield delta
+                    if deadline is not None and deadline.expired():
+                        print("分析总时限已到，停止流式输出")
+                        self._record_error(method, model, "deadline")
+                        return
+                else:
+                    # 没有收到 [DONE]，说明流被提前中断，不写入缓存
+                    succeeded = False
+                    self._record_error(method, model, "disconnect")
+                    return
+            
+            succeeded = True
+            self._record_usage(method, model, usage, time.perf_counter() - started, ttfb, streamed=True)
+            self._cache_store(cache_key, "".join(chunks), cache_ttl)
         
-        return "\n".join(card_info)
+        except DeadlineExceeded as e:
+            print(f"分析总时限已到: {e}")
+            self._record_error(method, model, "deadline")
+        except requests.exceptions.Timeout:
+            if deadline is not None and deadline.expired():
+                print("分析总时限已到，停止流式输出")
+                self._record_error(method, model, "deadline")
+            else:
+                succeeded = False
+                print("API流式请求超时")
+                self._record_error(method, model, "timeout")
+        except requests.exceptions.RequestException as e:
+            succeeded = False
+            print(f"API流式请求异常: {e}")
+            self._record_error(method, model, "network")
+        except json.JSONDecodeError as e:
+            succeeded = False
+            print(f"流式JSON解析错误: {e}")
+            self._record_error(method, model, "parse")
+        finally:
+            if succeeded is None:
+                self.router.release(provider, method)
+            else:
+                self.router.record(provider, method, None, succeeded)
     
-    def analyze_reading(self, reading: Dict[int, Card], user_question: str = None) -> Dict[str, str]:
+    @staticmethod
+    def _stream_with_fallback(chunks: Iterator[str], fallback: str) -> Iterator[str]:
+        """转发流式片段；一个片段都没有收到时返回回退文本"""
+        received = False
+        for chunk in chunks:
+            received = True
+            yield chunk
+        if not received:
+            yield fallback
+    
+    @metrics.timed_call("analyze_reading")
+    def analyze_reading(self, reading: Dict[int, Card], user_question: str = None,
+                        deadline: Optional[Deadline] = None) -> Dict[str, str]:
         """
         分析四季牌阵并生成详细解读
         
         Args:
             reading: 抽牌结果字典
             user_question: 用户的具体问题（已弃用，保留参数兼容性）
+            deadline: 本次解读的总时限，到期时返回回退文本
             
         Returns:
             包含各种分析结果的字典
         """
-        cards_text = self._format_cards_for_prompt(reading)
-        
-        # 构建分析提示词（不再包含用户问题）
-        question_part = ""
+        cards_text, prompt = self._build_prompt("full_analysis", reading)
         
-        prompt = f"""请对以下四季牌阵进行深度分析：
-
-{cards_text}
-
-请从以下几个方面分析接下来季节的能量流动：
-
-1. 整体概述：这个牌阵传达的核心信息和季节主题
-2. 逐位解读：每个位置的牌面含义及其对应生活层面的能量指导
-3. 牌面关联：不同位置之间的相互关系和能量流动模式
-4. 实用建议：基于牌阵给出的具体行动建议和注意事项
-5. 灵性指引：这个季度的精神成长方向和内在智慧
-
-请用专业而温暖的语言，为咨询者提供富有启发性的季节性指导。"""
-
         # 调用AI获取分析结果
-        analysis = self._make_api_request(prompt)
+        analysis = self._make_api_request(prompt, method="full_analysis", deadline=deadline)
         
         if analysis:
             return {
@@ -157,58 +690,46 @@ class TarotAIAnalyzer:
             }
         else:
             return {
-                "full_analysis": "抱歉，AI分析服务暂时不可用。请检查网络连接和API配置。",
+                "full_analysis": self.offline.full_analysis(reading),
                 "cards_summary": cards_text,
                 "status": "error"
             }
     
-    def get_quick_insight(self, reading: Dict[int, Card]) -> str:
+    @metrics.timed_call("get_quick_insight")
+    def get_quick_insight(self, reading: Dict[int, Card], deadline: Optional[Deadline] = None) -> str:
         """
         获取快速洞察，简短的一句话总结
         
         Args:
             reading: 抽牌结果字典
+            deadline: 本次解读的总时限，到期时返回回退文本
             
         Returns:
             简短的洞察文本
         """
-        cards_text = self._format_cards_for_prompt(reading)
+        _, prompt = self._build_prompt("insight", reading)
         
-        prompt = f"""基于以下四季牌阵结果，请给出一句话的核心洞察：
-
-{cards_text}
-
-请用一句富有诗意和启发性的话语来概括这个牌阵的核心信息。"""
-
-        insight = self._make_api_request(prompt, max_tokens=100)
-        return insight if insight else "静心聆听内在的声音，答案会在适当的时候显现。"
+        insight = self._make_api_request(prompt, max_tokens=100, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                         method="insight", deadline=deadline)
+        return insight if insight else self.offline.insight(reading)
     
-    def get_seasonal_advice(self, reading: Dict[int, Card]) -> Dict[str, str]:
+    @metrics.timed_call("get_seasonal_advice")
+    def get_seasonal_advice(self, reading: Dict[int, Card],
+                            deadline: Optional[Deadline] = None) -> Dict[str, str]:
         """
         获取季节性建议，针对每个生活层面的具体指导
         
         Args:
             reading: 抽牌结果字典
+            deadline: 本次解读的总时限，到期时返回回退文本
             
         Returns:
             包含各个层面建议的字典
         """
-        cards_text = self._format_cards_for_prompt(reading)
+        _, prompt = self._build_prompt("seasonal_advice", reading)
         
-        prompt = f"""基于以下四季牌阵，请为每个生活层面提供简洁的季节性建议：
-
-{cards_text}
-
-请分别为以下五个方面给出1-2句具体的行动建议：
-1. 行动力建议
-2. 情感状态建议  
-3. 理性思维建议
-4. 事业财务建议
-5. 心灵成长建议
-
-格式要求：每个建议控制在50字以内，语言温暖而具有指导性。"""
-
-        advice = self._make_api_request(prompt, max_tokens=800)
+        advice = self._make_api_request(prompt, max_tokens=800, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                        method="seasonal_advice", deadline=deadline)
         
         if advice:
             return {
@@ -217,10 +738,257 @@ class TarotAIAnalyzer:
             }
         else:
             return {
-                "seasonal_advice": "在这个特殊的时刻，相信自己的直觉，跟随内心的指引前行。",
+                "seasonal_advice": self.offline.seasonal_advice(reading),
                 "status": "error"
             }
 
+    def analyze_reading_stream(self, reading: Dict[int, Card],
+                               deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """
+        流式获取详细分析，生成的文本逐段返回，可直接传给 st.write_stream
+        
+        Args:
+            reading: 抽牌结果字典
+            deadline: 本次解读的总时限，到期后停止输出
+            
+        Yields:
+            增量文本片段；请求失败时返回回退文本
+        """
+        _, prompt = self._build_prompt("full_analysis", reading)
+        chunks = self._stream_api_request(prompt, method="full_analysis", deadline=deadline)
+        return self._stream_with_fallback(chunks, self.offline.full_analysis(reading))
+    
+    def get_quick_insight_stream(self, reading: Dict[int, Card],
+                                 deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """流式获取快速洞察，参见 analyze_reading_stream"""
+        _, prompt = self._build_prompt("insight", reading)
+        chunks = self._stream_api_request(prompt, max_tokens=100, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                          method="insight", deadline=deadline)
+        return self._stream_with_fallback(chunks, self.offline.insight(reading))
+    
+    def get_seasonal_advice_stream(self, reading: Dict[int, Card],
+                                   deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """流式获取季节建议，参见 analyze_reading_stream"""
+        _, prompt = self._build_prompt("seasonal_advice", reading)
+        chunks = self._stream_api_request(prompt, max_tokens=800, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                          method="seasonal_advice", deadline=deadline)
+        return self._stream_with_fallback(chunks, self.offline.seasonal_advice(reading))
+    
+    def iter_analysis_parts(self, reading: Dict[int, Card],
+                            parts: Tuple[str, ...] = ANALYSIS_PARTS,
+                            deadline: Optional[Deadline] = None) -> Iterator[Tuple[str, str]]:
+        """
+        并发发送详细分析、快速洞察和季节建议三个请求，哪个先完成就先返回哪个
+        
+        调用时请求立即提交到线程池，总耗时取决于最慢的一个请求，而不是三者之和；
+        所有请求共享同一个总时限，到期后未完成的部分立即返回回退文本。
+        
+        Args:
+            reading: 抽牌结果字典
+            parts: 需要获取的部分，默认为全部三项
+            deadline: 本次解读的总时限（参见 new_reading_deadline），为None时不限制
+            
+        Returns:
+            迭代器，产生 (部分名称, 文本)，部分名称取自 ANALYSIS_PARTS
+        """
+        methods = {
+            "full_analysis": self.analyze_reading,
+            "insight": self.get_quick_insight,
+            "seasonal_advice": self.get_seasonal_advice,
+        }
+        executor = _get_executor()
+        futures = {executor.submit(methods[part], reading, deadline=deadline): part for part in parts}
+        return self._iter_completed(futures)
+    
+    def _analyze_part(self, part: str, reading: Dict[int, Card], deadline: Optional[Deadline] = None) -> str:
+        """在当前线程中获取单个部分的文本，格式与 iter_analysis_parts 相同"""
+        if part == "full_analysis":
+            return self.analyze_reading(reading, deadline=deadline).get("full_analysis", "分析失败")
+        if part == "seasonal_advice":
+            return self.get_seasonal_advice(reading, deadline=deadline).get("seasonal_advice", "建议获取失败")
+        return self.get_quick_insight(reading, deadline=deadline)
+    
+    @staticmethod
+    def _iter_completed(futures) -> Iterator[Tuple[str, str]]:
+        """按完成顺序产生 (部分名称, 文本)"""
+        try:
+            for future in as_completed(futures):
+                part = futures[future]
+                result = future.result()
+                if part == "full_analysis":
+                    yield part, result.get("full_analysis", "分析失败")
+                elif part == "seasonal_advice":
+                    yield part, result.get("seasonal_advice", "建议获取失败")
+                else:
+                    yield part, result
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的请求
+            for future in futures:
+                future.cancel()
+    
+    @metrics.timed_call("analyze_all")
+    def analyze_all(self, reading: Dict[int, Card], deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """
+        并发获取完整的三部分分析结果
+        
+        Args:
+            reading: 抽牌结果字典
+            deadline: 本次解读的总时限（参见 new_reading_deadline），为None时不限制
+            
+        Returns:
+            包含 full_analysis、insight、seasonal_advice 的字典
+        """
+        return dict(self.iter_analysis_parts(reading, deadline=deadline))
+    
+    @metrics.timed_call("analyze_combined")
+    def analyze_combined(self, reading: Dict[int, Card], deadline: Optional[Deadline] = None,
+                         concurrent: bool = True) -> Dict[str, str]:
+        """
+        用一次结构化输出请求同时获取详细分析、快速洞察和季节建议
+        
+        系统提示词和卡牌信息只发送一次，输入token和往返次数约为分别请求的三分之一。
+        返回的JSON缺少某个字段或无法解析时，只对缺失的部分回退到单独请求（共享同一个总时限）。
+        
+        Args:
+            reading: 抽牌结果字典
+            deadline: 本次解读的总时限（参见 new_reading_deadline），为None时不限制
+            concurrent: 回退请求是否提交到共享的分析线程池并发执行；为False时在当前线程中依次请求
+                （预先分析使用，避免占用点击分析的线程）
+            
+        Returns:
+            包含 full_analysis、insight、seasonal_advice 的字典
+        """
+        _, prompt = self._build_prompt("combined", reading)
+        
+        content = self._make_api_request(
+            prompt,
+            max_tokens=self.config.COMBINED_MAX_TOKENS,
+            response_format={"type": "json_object"},
+            method="combined",
+            deadline=deadline
+        )
+        results = self._parse_combined_response(content)
+        
+        # 只为解析失败的字段单独请求
+        missing = tuple(part for part in ANALYSIS_PARTS if part not in results)
+        if missing:
+            print(f"结构化输出缺少字段，单独请求: {', '.join(missing)}")
+            if concurrent:
+                results.update(self.iter_analysis_parts(reading, missing, deadline))
+            else:
+                results.update((part, self._analyze_part(part, reading, deadline)) for part in missing)
+        return {part: results[part] for part in ANALYSIS_PARTS}
+    
+    def speculate(self, reading: Dict[int, Card], deadline: Deadline) -> Optional["SpeculativeAnalysis"]:
+        """
+        抽牌后立即在后台开始完整分析，用户点击分析时直接取用结果
+        
+        按 Config.ANALYSIS_MODE 提交三个并发请求或一次结构化输出请求，调用立即返回。
+        请求在独立的预先分析线程池中执行（结构化输出的回退请求也在同一个线程中完成）；
+        进程中进行中的预先分析已达本会话配置的 SPECULATION_MAX_PENDING 时不再提交。
+        
+        Args:
+            reading: 抽牌结果字典
+            deadline: 本次解读的总时限，重新抽牌时通过 SpeculativeAnalysis.cancel() 取消
+            
+        Returns:
+            进行中的预先分析；预先分析线程池已满时返回None
+        """
+        global _speculation_pending
+        with _executor_lock:
+            if _speculation_pending >= self.config.SPECULATION_MAX_PENDING:
+                metrics.SPECULATIONS.inc(outcome="skipped")
+                return None
+            _speculation_pending += 1
+        
+        executor = _get_speculation_executor()
+        if self.config.ANALYSIS_MODE == "combined":
+            futures = {executor.submit(self.analyze_combined, reading, deadline=deadline, concurrent=False): "combined"}
+        else:
+            methods = {
+                "full_analysis": self.analyze_reading,
+                "insight": self.get_quick_insight,
+                "seasonal_advice": self.get_seasonal_advice,
+            }
+            futures = {executor.submit(methods[part], reading, deadline=deadline): part
+                       for part in ANALYSIS_PARTS}
+        metrics.SPECULATIONS.inc(outcome="started")
+        
+        remaining = [len(futures)]
+        
+        def _finished(_future):
+            # 这次预先分析的请求全部结束（完成、失败或被取消）后释放名额
+            global _speculation_pending
+            with _executor_lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    _speculation_pending -= 1
+        
+        for future in futures:
+            future.add_done_callback(_finished)
+        return SpeculativeAnalysis(self, reading, futures, deadline)
+
+class SpeculativeAnalysis:
+    """
+    抽牌后在后台进行中的分析（参见 TarotAIAnalyzer.speculate）
+    
+    结果只能通过 iter_parts() 取用一次；重新抽牌时调用 cancel()，
+    尚未开始的请求直接取消，进行中的请求在总时限被取消后不再重试或等待。
+    """
+    
+    def __init__(self, analyzer: "TarotAIAnalyzer", reading: Dict[int, Card], futures: Dict[Future, str],
+                 deadline: Deadline):
+        self.analyzer = analyzer
+        self.reading = reading
+        self.futures = futures
+        self.deadline = deadline
+    
+    def done(self) -> bool:
+        """所有部分是否都已完成"""
+        return all(future.done() for future in self.futures)
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.deadline.cancelled
+    
+    @property
+    def expired(self) -> bool:
+        """总时限在全部完成之前已到（未完成的部分只能得到本地解读），点击分析时应重新请求"""
+        return self.deadline.expired() and not self.done()
+    
+    def cancel(self):
+        """放弃这次预先分析"""
+        if not self.cancelled:
+            metrics.SPECULATIONS.inc(outcome="cancelled")
+        self.deadline.cancel()
+        for future in self.futures:
+            future.cancel()
+    
+    def iter_parts(self, deadline: Optional[Deadline] = None) -> Iterator[Tuple[str, str]]:
+        """
+        按完成顺序产生 (部分名称, 文本)，已完成的部分立即返回
+        
+        预先分析失败或超时、只得到本地解读的部分，在其余部分返回后用 deadline 重新请求一次。
+        
+        Args:
+            deadline: 点击分析时新建的总时限，用于重新请求的部分
+            
+        Returns:
+            迭代器，格式与 TarotAIAnalyzer.iter_analysis_parts 相同
+        """
+        metrics.SPECULATIONS.inc(outcome="ready" if self.done() else "pending")
+        offline = self.analyzer.offline.compose(self.reading)
+        retry = []
+        for part, result in TarotAIAnalyzer._iter_completed(self.futures):
+            for name, text in (result.items() if part == "combined" else [(part, result)]):
+                if text == offline[name]:
+                    retry.append(name)
+                else:
+                    yield name, text
+        if retry:
+            metrics.SPECULATIONS.inc(outcome="retried")
+            yield from self.analyzer.iter_analysis_parts(self.reading, tuple(retry), deadline)
+
 # 测试功能
 if __name__ == "__main__":
     # 简单的测试
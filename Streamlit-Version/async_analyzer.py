@@ -0,0 +1,484 @@
+"""
+异步AI塔罗牌分析器
+以协程形式提供与 TarotAIAnalyzer 相同的方法，基于aiohttp的非阻塞连接池，
+单个进程即可同时挂起数百个等待模型回复的分析请求
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import metrics
+from ai_analyzer import ANALYSIS_PARTS, TarotAnalyzerBase
+from circuit_breaker import CircuitOpenError
+from deadline import Deadline, DeadlineExceeded
+from lazy_imports import lazy_import
+from http_client import RETRY_STATUS_CODES, backoff_delay
+from response_cache import ResponseCache
+from provider_router import Provider, ProviderError, ProviderRouter, is_client_error
+from single_flight import AsyncSingleFlight
+from usage import UsageTracker
+from 四季牌阵 import Card, FOUR_SEASONS
+
+# aiohttp 在第一次创建会话时才加载，只使用同步引擎的脚本不必为它付出导入时间
+aiohttp = lazy_import("aiohttp")
+
+
+class AsyncTarotAIAnalyzer(TarotAnalyzerBase):
+    """
+    异步AI塔罗牌分析器
+
+    用法：
+        async with AsyncTarotAIAnalyzer() as analyzer:
+            results = await analyzer.analyze_all(reading)
+    """
+
+    def __init__(self, plan=FOUR_SEASONS, cache: Optional[ResponseCache] = None,
+                 max_connections: int = None, max_concurrency: int = None,
+                 usage: Optional[UsageTracker] = None, router: Optional[ProviderRouter] = None,
+                 config=None):
+        """
+        初始化分析器
+
+        Args:
+            plan: 要分析的牌阵（编译后的 DrawPlan），默认为四季牌阵
+            cache: 回复缓存，默认使用进程级共享缓存
+            max_connections: 连接池大小，默认 Config.ASYNC_MAX_CONNECTIONS
+            max_concurrency: 同时进行中的请求上限，默认 Config.ASYNC_MAX_CONCURRENCY
+            usage: 用量统计，默认使用进程级共享实例
+            router: 服务商路由器，默认使用进程级共享实例
+            config: 配置快照（ConfigSnapshot），默认使用全局 Config 类
+        """
+        super().__init__(plan, cache, usage, router, config=config)
+        self.max_connections = max_connections or self.config.ASYNC_MAX_CONNECTIONS
+        self.max_concurrency = max_concurrency or self.config.ASYNC_MAX_CONCURRENCY
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._flight: Optional[AsyncSingleFlight] = None
+
+    async def __aenter__(self) -> "AsyncTarotAIAnalyzer":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """在当前事件循环中懒加载HTTP会话、并发信号量和请求合并器"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=self._client_timeout(),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            if self.config.SINGLE_FLIGHT_ENABLED:
+                self._flight = AsyncSingleFlight()
+        return self._session
+
+    def _client_timeout(self, deadline: Optional[Deadline] = None) -> "aiohttp.ClientTimeout":
+        """
+        与同步版本的 requests 超时一致：REQUEST_TIMEOUT 限制建立连接和每次读取的等待，
+        不限制整个响应（生成较慢的长流式回复不会被截断）；只有指定总时限时才限制整个响应
+
+        Args:
+            deadline: 本次解读的总时限，已到期时抛出 DeadlineExceeded
+        """
+        if deadline is None:
+            return aiohttp.ClientTimeout(total=None, sock_connect=self.config.REQUEST_TIMEOUT,
+                                         sock_read=self.config.REQUEST_TIMEOUT)
+        per_read = deadline.timeout(self.config.REQUEST_TIMEOUT)
+        return aiohttp.ClientTimeout(total=deadline.remaining(), sock_connect=per_read, sock_read=per_read)
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            self._semaphore = None
+            self._flight = None
+
+    async def _post_with_retry(self, provider: Provider, payload: Dict,
+                               deadline: Optional[Deadline] = None) -> "aiohttp.ClientResponse":
+        """
+        向指定后端发送POST请求，遇到429、5xx或连接失败时按指数退避重试
+
+        每次读取的等待不超过 REQUEST_TIMEOUT；指定总时限时整个响应不超过剩余时间，剩余时间不够退避时不再重试。
+
+        Returns:
+            最后一次请求的响应，调用方负责读取或释放
+        """
+        session = self._get_session()
+        url = f"{provider.resolved_base_url(self.config)}/chat/completions"
+        payload = {**payload, "model": provider.resolved_model(self.config)}
+        max_retries = self.config.HTTP_MAX_RETRIES
+        for attempt in range(max_retries + 1):
+            options = {}
+            if deadline is not None:
+                options["timeout"] = self._client_timeout(deadline)
+            try:
+                response = await session.post(url, headers=provider.headers(self.config), json=payload, **options)
+            except aiohttp.ClientConnectionError:
+                delay = backoff_delay(attempt)
+                if attempt == max_retries or (deadline is not None and delay >= deadline.remaining()):
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status in RETRY_STATUS_CODES and attempt < max_retries:
+                delay = backoff_delay(attempt, response)
+                if deadline is not None and delay >= deadline.remaining():
+                    return response
+                response.release()
+                await asyncio.sleep(delay)
+                continue
+            return response
+        raise AssertionError("unreachable")
+
+    async def _make_api_request(self, prompt: str, max_tokens: int = None,
+                                response_format: Optional[Dict[str, str]] = None,
+                                cache_ttl: Optional[float] = None,
+                                method: str = "full_analysis",
+                                deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        向aihubmix API发送请求，相同的请求优先从缓存返回
+
+        Args:
+            prompt: 发送给AI的提示词
+            max_tokens: 最大token数量
+            response_format: 结构化输出格式，例如 {"type": "json_object"}
+            cache_ttl: 本次回复的缓存时间（秒），默认 Config.CACHE_TTL_ANALYSIS
+            method: 用量统计中的调用方法标签
+            deadline: 本次解读的总时限，到期后不再等待
+
+        Returns:
+            AI的回复内容，失败、熔断或超过总时限时返回None
+        """
+        started = time.perf_counter()
+        data = self._build_request_data(prompt, max_tokens, response_format)
+        cache_key, cached = self._cache_lookup(data, method)
+        if cached is not None:
+            self._record_cache_hit(method, data)
+            self._observe_request(method, data, started, True, from_cache=True)
+            return cached
+
+        self._get_session()
+        if self._flight is None:
+            call = self._send_request(data, cache_key, cache_ttl, method, deadline)
+        else:
+            call = self._flight.do(self._flight_key(cache_key), lambda: self._send_request(data, cache_key, cache_ttl, method, deadline))
+        content = None
+        if deadline is None:
+            content = await call
+        else:
+            # 合并的请求在独立任务中执行，这里超时只放弃等待，不影响其他等待者
+            try:
+                content = await asyncio.wait_for(call, timeout=deadline.remaining())
+            except asyncio.TimeoutError:
+                print(f"分析总时限已到，放弃等待: {method}")
+                self._record_error(method, data["model"], "deadline")
+        self._observe_request(method, data, started, bool(content))
+        return content
+
+    async def _send_request(self, data: Dict, cache_key: str, cache_ttl: Optional[float] = None,
+                            method: str = "full_analysis", deadline: Optional[Deadline] = None) -> Optional[str]:
+        """经服务商路由器发送请求，把成功的回复写入缓存，失败时返回None"""
+        try:
+            content = await self.router.acall(
+                lambda provider: self._post_to_provider(provider, data, method, deadline),
+                kind=method, config=self.config
+            )
+            self._cache_store(cache_key, content, cache_ttl)
+            return content
+        except CircuitOpenError as e:
+            print(f"API请求被熔断: {e}")
+            self._record_error(method, data["model"], "circuit_open")
+            return None
+        except DeadlineExceeded as e:
+            print(f"分析总时限已到: {e}")
+            self._record_error(method, data["model"], "deadline")
+            return None
+        except ProviderError as e:
+            print(f"API请求失败: {e}")
+            self._record_error(method, data["model"], "provider")
+            return None
+        except asyncio.TimeoutError:
+            print("API请求超时")
+            self._record_error(method, data["model"], "timeout")
+            return None
+        except aiohttp.ClientError as e:
+            print(f"API请求异常: {e}")
+            self._record_error(method, data["model"], "network")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"JSON解析错误: {e}")
+            self._record_error(method, data["model"], "parse")
+            return None
+        except Exception as e:
+            # 例如 200 响应的 choices 为空或响应体不是对象：返回None，由调用方显示备用解读
+            print(f"未知错误: {e}")
+            self._record_error(method, data["model"], "unknown")
+            return None
+
+    async def _post_to_provider(self, provider: Provider, data: Dict, method: str,
+                                deadline: Optional[Deadline] = None) -> str:
+        """向指定后端发送一次请求并记录用量，失败时抛出异常"""
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                async with await self._post_with_retry(provider, data, deadline) as response:
+                    # 收到响应头（含重试）
+                    ttfb = time.perf_counter() - started
+                    if response.status != 200:
+                        raise ProviderError(f"{provider.name}: {response.status} - {await response.text()}",
+                                            response.status)
+                    result = await response.json(content_type=None)
+            except asyncio.TimeoutError:
+                # 超时被总时限截短时，不算作后端变慢
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f"{provider.name}: 请求超过分析总时限")
+                raise
+        content = result.get('choices', [{}])[0].get('message', {}).get('content', '')
+        self._record_usage(method, provider.resolved_model(self.config), result.get('usage'), time.perf_counter() - started,
+                           ttfb)
+        return content
+
+    async def _stream_api_request(self, prompt: str, max_tokens: int = None,
+                                  cache_ttl: Optional[float] = None,
+                                  method: str = "full_analysis",
+                                  deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """
+        以流式（SSE）方式发送请求，逐段返回生成的文本
+
+        Yields:
+            增量文本片段；请求失败时不产生任何片段，超过总时限时停止输出
+        """
+        started = time.perf_counter()
+        data = self._build_request_data(prompt, max_tokens)
+        cache_key, cached = self._cache_lookup(data, method)
+        if cached is not None:
+            self._record_cache_hit(method, data)
+            self._observe_request(method, data, started, True, from_cache=True)
+            yield cached
+            return
+
+        def _upstream():
+            return self._stream_upstream(data, cache_key, cache_ttl, method, deadline)
+
+        self._get_session()
+        chunks = _upstream() if self._flight is None else self._flight.stream(self._flight_key(cache_key), _upstream)
+        received = False
+        try:
+            if deadline is None:
+                async for chunk in chunks:
+                    received = True
+                    yield chunk
+                return
+            iterator = chunks.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=deadline.remaining())
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    print("分析总时限已到，停止流式输出")
+                    self._record_error(method, data["model"], "deadline")
+                    return
+                received = True
+                yield chunk
+        finally:
+            self._observe_request(method, data, started, received)
+
+    async def _stream_upstream(self, data: Dict, cache_key: str, cache_ttl: Optional[float] = None,
+                               method: str = "full_analysis",
+                               deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """向当前最快的可用后端发送流式请求并逐段返回文本，流完整结束后写入缓存并记录用量（不对冲）"""
+        provider = self.router.pick(method, self.config)
+        if provider is None:
+            print("API流式请求失败: 没有可用的服务商（未配置密钥或已熔断）")
+            self._record_error(method, data["model"], "circuit_open")
+            return
+        model = provider.resolved_model(self.config)
+        chunks = []
+        usage = None
+        ttfb = None
+        succeeded: Optional[bool] = None
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                payload = {**data, "stream": True}
+                if provider.stream_usage:
+                    # 最后一个事件携带 usage（只发给确认支持的后端）
+                    payload["stream_options"] = {"include_usage": True}
+                async with await self._post_with_retry(provider, payload, deadline) as response:
+                    if response.status != 200:
+                        # 4xx是本次请求或密钥的问题，不计入熔断器
+                        succeeded = None if is_client_error(response.status) else False
+                        print(f"API流式请求失败: {provider.name}: {response.status} - {await response.text()}")
+                        self._record_error(method, model, "provider")
+                        return
+                    completed = False
+                    async for raw_line in response.content:
+                        line = raw_line.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[len("data:"):].strip()
+                        if payload == "[DONE]":
+                            completed = True
+                            break
+                        event = json.loads(payload)
+                        usage = event.get('usage') or usage
+                        choices = event.get('choices') or [{}]
+                        delta = choices[0].get('delta', {}).get('content')
+                        if delta:
+                            if ttfb is None:
+                                ttfb = time.perf_counter() - started
+                            chunks.append(delta)
+                            yield delta
+                succeeded = completed
+                if completed:
+                    self._record_usage(method, model, usage, time.perf_counter() - started, ttfb, streamed=True)
+                    self._cache_store(cache_key, "".join(chunks), cache_ttl)
+                else:
+                    self._record_error(method, model, "disconnect")
+            except DeadlineExceeded as e:
+                print(f"分析总时限已到: {e}")
+                self._record_error(method, model, "deadline")
+            except asyncio.TimeoutError:
+                if deadline is not None and deadline.expired():
+                    print("分析总时限已到，停止流式输出")
+                    self._record_error(method, model, "deadline")
+                else:
+                    succeeded = False
+                    print("API流式请求超时")
+                    self._record_error(method, model, "timeout")
+            except aiohttp.ClientError as e:
+                succeeded = False
+                print(f"API流式请求异常: {e}")
+                self._record_error(method, model, "network")
+            except json.JSONDecodeError as e:
+                succeeded = False
+                print(f"流式JSON解析错误: {e}")
+                self._record_error(method, model, "parse")
+            finally:
+                if succeeded is None:
+                    self.router.release(provider, method)
+                else:
+                    self.router.record(provider, method, None, succeeded)
+
+    @staticmethod
+    async def _stream_with_fallback(chunks: AsyncIterator[str], fallback: str) -> AsyncIterator[str]:
+        """转发流式片段；一个片段都没有收到时返回回退文本"""
+        received = False
+        async for chunk in chunks:
+            received = True
+            yield chunk
+        if not received:
+            yield fallback
+
+    @metrics.timed_call("analyze_reading")
+    async def analyze_reading(self, reading: Dict[int, Card], user_question: str = None,
+                              deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """分析牌阵并生成详细解读，参见 TarotAIAnalyzer.analyze_reading"""
+        cards_text, prompt = self._build_prompt("full_analysis", reading)
+        analysis = await self._make_api_request(prompt, method="full_analysis", deadline=deadline)
+        return {
+            "full_analysis": analysis or self.offline.full_analysis(reading),
+            "cards_summary": cards_text,
+            "status": "success" if analysis else "error"
+        }
+
+    @metrics.timed_call("get_quick_insight")
+    async def get_quick_insight(self, reading: Dict[int, Card], deadline: Optional[Deadline] = None) -> str:
+        """获取一句话的快速洞察，参见 TarotAIAnalyzer.get_quick_insight"""
+        _, prompt = self._build_prompt("insight", reading)
+        insight = await self._make_api_request(prompt, max_tokens=100, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                               method="insight", deadline=deadline)
+        return insight or self.offline.insight(reading)
+
+    @metrics.timed_call("get_seasonal_advice")
+    async def get_seasonal_advice(self, reading: Dict[int, Card],
+                                  deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """获取各生活层面的季节建议，参见 TarotAIAnalyzer.get_seasonal_advice"""
+        _, prompt = self._build_prompt("seasonal_advice", reading)
+        advice = await self._make_api_request(prompt, max_tokens=800, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                              method="seasonal_advice", deadline=deadline)
+        return {
+            "seasonal_advice": advice or self.offline.seasonal_advice(reading),
+            "status": "success" if advice else "error"
+        }
+
+    def analyze_reading_stream(self, reading: Dict[int, Card],
+                               deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """流式获取详细分析，返回异步迭代器"""
+        _, prompt = self._build_prompt("full_analysis", reading)
+        chunks = self._stream_api_request(prompt, method="full_analysis", deadline=deadline)
+        return self._stream_with_fallback(chunks, self.offline.full_analysis(reading))
+
+    def get_quick_insight_stream(self, reading: Dict[int, Card],
+                                 deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """流式获取快速洞察，返回异步迭代器"""
+        _, prompt = self._build_prompt("insight", reading)
+        chunks = self._stream_api_request(prompt, max_tokens=100, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                          method="insight", deadline=deadline)
+        return self._stream_with_fallback(chunks, self.offline.insight(reading))
+
+    def get_seasonal_advice_stream(self, reading: Dict[int, Card],
+                                   deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        """流式获取季节建议，返回异步迭代器"""
+        _, prompt = self._build_prompt("seasonal_advice", reading)
+        chunks = self._stream_api_request(prompt, max_tokens=800, cache_ttl=self.config.CACHE_TTL_BRIEF,
+                                          method="seasonal_advice", deadline=deadline)
+        return self._stream_with_fallback(chunks, self.offline.seasonal_advice(reading))
+
+    async def _get_part(self, part: str, reading: Dict[int, Card],
+                        deadline: Optional[Deadline] = None) -> Tuple[str, str]:
+        """获取单个部分并统一为 (部分名称, 文本)"""
+        if part == "full_analysis":
+            return part, (await self.analyze_reading(reading, deadline=deadline))["full_analysis"]
+        if part == "seasonal_advice":
+            return part, (await self.get_seasonal_advice(reading, deadline))["seasonal_advice"]
+        return part, await self.get_quick_insight(reading, deadline)
+
+    async def iter_analysis_parts(self, reading: Dict[int, Card],
+                                  parts: Tuple[str, ...] = ANALYSIS_PARTS,
+                                  deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        并发请求各部分，按完成顺序产生 (部分名称, 文本)
+
+        Args:
+            reading: 抽牌结果字典
+            parts: 需要获取的部分，默认为全部三项
+            deadline: 各部分共享的总时限，为None时不限制
+        """
+        tasks = [asyncio.ensure_future(self._get_part(part, reading, deadline)) for part in parts]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @metrics.timed_call("analyze_all")
+    async def analyze_all(self, reading: Dict[int, Card], deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """并发获取完整的三部分分析结果，三个请求共享同一个总时限"""
+        return dict(await asyncio.gather(*(self._get_part(part, reading, deadline) for part in ANALYSIS_PARTS)))
+
+    @metrics.timed_call("analyze_combined")
+    async def analyze_combined(self, reading: Dict[int, Card],
+                               deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """用一次结构化输出请求获取三项结果，参见 TarotAIAnalyzer.analyze_combined"""
+        _, prompt = self._build_prompt("combined", reading)
+        content = await self._make_api_request(
+            prompt,
+            max_tokens=self.config.COMBINED_MAX_TOKENS,
+            response_format={"type": "json_object"},
+            method="combined",
+            deadline=deadline
+        )
+        results = self._parse_combined_response(content)
+
+        missing = tuple(part for part in ANALYSIS_PARTS if part not in results)
+        if missing:
+            print(f"结构化输出缺少字段，单独请求: {', '.join(missing)}")
+            results.update(await asyncio.gather(*(self._get_part(part, reading, deadline) for part in missing)))
+        return {part: results[part] for part in ANALYSIS_PARTS}
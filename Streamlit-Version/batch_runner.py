@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+批量离线分析
+从JSONL文件逐行读取牌阵，在每分钟请求数（RPM）和每分钟token数（TPM）的令牌桶限制下并发分析，
+结果逐条追加写入JSONL；结果文件同时作为检查点，任务中断后重新运行会跳过已完成的牌阵，不重复付费调用
+
+输入文件每行一个JSON对象：
+    {"id": "a1", "code": 123456}                           # encode_reading() 的编码
+    {"id": "a2", "cards": {"1": 44, "2": 80, ...}}          # 位置 -> Card.id
+未提供 id 时使用行号；无法解析或牌与位置不符的行记为无效并跳过，不影响其余牌阵
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from ai_analyzer import ANALYSIS_PARTS, TarotAIAnalyzer
+from config import Config
+from deadline import Deadline
+from usage import format_report
+from provider_router import Provider
+from 四季牌阵 import CARD_TABLE, Card, FOUR_SEASONS, card_from_id, decode_reading, encode_reading
+
+class TokenBucket:
+    """线程安全的令牌桶：容量为每分钟额度，按秒匀速补充"""
+
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: 每分钟允许消耗的令牌数
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        阻塞直到桶中有足够的令牌并扣除
+
+        Args:
+            amount: 需要的令牌数，超过容量时按容量计算
+
+        Returns:
+            等待的秒数
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def estimate_tokens(data: Dict[str, Any]) -> int:
+    """
+    粗略估算一次请求占用的token数：中文按每字1个、其他字符按每4个1个计算提示词，再加上 max_tokens
+
+    服务商按 max_tokens 预占TPM额度，因此估算值偏保守。
+    """
+    text = "".join(message["content"] for message in data["messages"])
+    cjk = sum(1 for char in text if "\u4e00" <= char <= "\u9fff")
+    return cjk + (len(text) - cjk) // 4 + data["max_tokens"]
+
+
+class RateLimitedAnalyzer(TarotAIAnalyzer):
+    """
+    每次实际发往上游的尝试（包括对冲、故障转移和429/5xx重试）都先从RPM和TPM令牌桶中取令牌；
+    缓存命中和被合并的请求不占额度。同时记录每个批量任务中实际给出回复的模型（路由器可能选中其他服务商）
+    """
+
+    def __init__(self, requests_bucket: Optional[TokenBucket] = None,
+                 tokens_bucket: Optional[TokenBucket] = None, **kwargs):
+        """
+        Args:
+            requests_bucket: 每分钟请求数令牌桶，为None时不限制
+            tokens_bucket: 每分钟token数令牌桶，为None时不限制
+            **kwargs: 透传给 TarotAIAnalyzer
+        """
+        super().__init__(**kwargs)
+        self.requests_bucket = requests_bucket
+        self.tokens_bucket = tokens_bucket
+        # 请求体 id -> 给出回复的模型；对冲请求在路由器的线程中完成，由发起请求的任务线程取回
+        self._answered: Dict[int, str] = {}
+        self._local = threading.local()
+
+    def _before_upstream_attempt(self, data: Dict[str, Any]):
+        if self.requests_bucket is not None:
+            self.requests_bucket.acquire()
+        if self.tokens_bucket is not None:
+            self.tokens_bucket.acquire(estimate_tokens(data))
+
+    def _post_to_provider(self, provider: Provider, data: Dict[str, Any], method: str,
+                          deadline: Optional[Deadline] = None) -> str:
+        content = super()._post_to_provider(provider, data, method, deadline)
+        self._answered[id(data)] = provider.resolved_model(self.config)
+        return content
+
+    def _send_request(self, data: Dict[str, Any], cache_key: str,
+                      cache_ttl: Optional[float] = None, method: str = "full_analysis",
+                      deadline: Optional[Deadline] = None) -> Optional[str]:
+        try:
+            return super()._send_request(data, cache_key, cache_ttl, method, deadline)
+        finally:
+            model = self._answered.pop(id(data), None)
+            models = getattr(self._local, "models", None)
+            if model is not None and models is not None:
+                models.add(model)
+
+    def start_task(self):
+        """开始在当前线程中记录一个批量任务实际使用的模型"""
+        self._local.models = set()
+
+    def task_models(self) -> List[str]:
+        """当前线程的批量任务中给出回复的模型（全部来自缓存或合并的请求时为空）"""
+        return sorted(getattr(self._local, "models", ()))
+
+
+def parse_reading(record: Dict[str, Any]) -> Dict[int, Card]:
+    """
+    将输入记录还原为牌阵字典
+
+    Raises:
+        ValueError: 字段缺失、位置或牌id超出范围
+    """
+    if not isinstance(record, dict):
+        raise ValueError("记录不是JSON对象")
+    if "code" in record:
+        return decode_reading(int(record["code"]))
+    if "cards" in record:
+        cards = record["cards"]
+        if not isinstance(cards, dict):
+            raise ValueError("cards 字段不是对象")
+        reading = {}
+        for position, card_id in cards.items():
+            card_id = int(card_id)
+            if not 0 <= card_id < len(CARD_TABLE):
+                raise ValueError(f"无效的牌id: {card_id}")
+            reading[int(position)] = card_from_id(card_id)
+        expected = {position.number for position in FOUR_SEASONS.positions}
+        if set(reading) != expected:
+            raise ValueError(f"cards 的位置应为 {sorted(expected)}")
+        return reading
+    raise ValueError("记录缺少 code 或 cards 字段")
+
+
+def iter_readings(path: str, on_invalid: Optional[Callable[[Any, Exception], None]] = None
+                  ) -> Iterator[Tuple[Any, Dict[int, Card], int]]:
+    """
+    逐行读取输入文件，产生 (id, 牌阵字典, 牌阵编码)，不会一次性载入整个文件
+
+    每条记录在产生前编码一次：牌不属于其位置的牌组等无效记录不会发往上游。
+
+    Args:
+        path: 输入JSONL路径
+        on_invalid: 遇到无效行时以 (id, 异常) 调用，之后继续读取下一行；为None时只打印
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            reading_id = line_number
+            try:
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    reading_id = record.get("id", line_number)
+                reading = parse_reading(record)
+                code = encode_reading(reading)
+            except (ValueError, TypeError, KeyError) as e:   # json.JSONDecodeError 是 ValueError
+                if on_invalid is not None:
+                    on_invalid(reading_id, e)
+                else:
+                    print(f"⚠️ 跳过无效记录 {reading_id}（第{line_number}行）: {e}")
+                continue
+            yield reading_id, reading, code
+
+
+def load_checkpoint(output_path: str) -> Set[Any]:
+    """
+    读取已完成的牌阵id；进程崩溃时可能残留半行，截断到最后一个完整行
+
+    Returns:
+        已完成的id集合
+    """
+    completed: Set[Any] = set()
+    if not os.path.exists(output_path):
+        return completed
+    valid_size = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                completed.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                break
+            valid_size += len(line)
+    if valid_size < os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_size)
+    return completed
+
+
+class BatchRunner:
+    """
+    批量分析任务
+
+    用法：
+        runner = BatchRunner(concurrency=8, rpm=500, tpm=200000)
+        stats = runner.run("readings.jsonl", "results.jsonl")
+    """
+
+    def __init__(self, concurrency: int = 8, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 parts: Tuple[str, ...] = ANALYSIS_PARTS, combined: bool = False,
+                 progress_every: int = 50):
+        """
+        Args:
+            concurrency: 同时分析的牌阵数
+            rpm: 每分钟请求数上限，为None时不限制
+            tpm: 每分钟token数上限（估算值），为None时不限制
+            parts: 每个牌阵需要的分析部分
+            combined: 是否用一次结构化输出请求获取全部三项（忽略 parts）
+            progress_every: 每完成多少个牌阵打印一次进度
+        """
+        self.concurrency = concurrency
+        self.parts = ANALYSIS_PARTS if combined else parts
+        self.combined = combined
+        self.progress_every = progress_every
+        self.analyzer = RateLimitedAnalyzer(
+            requests_bucket=TokenBucket(rpm) if rpm else None,
+            tokens_bucket=TokenBucket(tpm) if tpm else None,
+            plan=FOUR_SEASONS,
+        )
+
+    def analyze(self, reading: Dict[int, Card]) -> Dict[str, str]:
+        """在当前线程中依次获取所需部分；并发度由 concurrency 控制"""
+        self.analyzer.start_task()
+        if self.combined:
+            return self.analyzer.analyze_combined(reading)
+        results = {}
+        for part in self.parts:
+            if part == "full_analysis":
+                results[part] = self.analyzer.analyze_reading(reading)["full_analysis"]
+            elif part == "seasonal_advice":
+                results[part] = self.analyzer.get_seasonal_advice(reading)["seasonal_advice"]
+            else:
+                results[part] = self.analyzer.get_quick_insight(reading)
+        return results
+
+    def run(self, input_path: str, output_path: str) -> Dict[str, Any]:
+        """
+        执行批量分析
+
+        失败（得到回退文本或分析出错）的牌阵不写入结果文件，重新运行即可只重试这些牌阵；
+        无效的输入行记入 invalid 并跳过，重新运行也不会成功，需要修正输入文件。
+
+        Args:
+            input_path: 输入JSONL路径
+            output_path: 结果JSONL路径，已存在时从检查点继续
+
+        Returns:
+            统计信息：completed、skipped、failed、invalid、elapsed
+        """
+        completed = load_checkpoint(output_path)
+        stats = {"completed": 0, "skipped": 0, "failed": 0, "invalid": 0, "elapsed": 0.0}
+        start = time.perf_counter()
+
+        def _invalid(reading_id, error):
+            stats["invalid"] += 1
+            print(f"⚠️ 跳过无效记录 {reading_id}: {error}")
+
+        def _task(reading_id, reading, code):
+            results = self.analyze(reading)
+            models = self.analyzer.task_models()
+            return reading_id, reading, code, results, ",".join(models) or self.analyzer.config.DEFAULT_MODEL
+
+        with open(output_path, "a", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="tarot-batch") as pool:
+            pending = set()
+            pending_ids: Dict[Any, Any] = {}
+
+            def _collect(done):
+                for future in done:
+                    try:
+                        reading_id, reading, code, results, model = future.result()
+                    except Exception as e:
+                        # 单个牌阵分析出错不影响整个任务，重新运行时会重试
+                        stats["failed"] += 1
+                        print(f"❌ 牌阵 {pending_ids.pop(future, '?')} 分析出错: {e}")
+                        continue
+                    pending_ids.pop(future, None)
+                    # 请求失败时结果为本地离线解读，不写入批量结果
+                    offline = self.analyzer.offline.compose(reading)
+                    if any(results[part] == offline[part] for part in self.parts):
+                        stats["failed"] += 1
+                        continue
+                    record = {"id": reading_id, "code": code, "model": model, **results}
+                    # 每条结果立即落盘，崩溃时最多丢失正在进行中的牌阵
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+                    stats["completed"] += 1
+                    if stats["completed"] % self.progress_every == 0:
+                        elapsed = time.perf_counter() - start
+                        print(f"已完成 {stats['completed']} 个牌阵，{stats['completed'] / elapsed:.1f} 个/秒")
+
+            for reading_id, reading, code in iter_readings(input_path, on_invalid=_invalid):
+                if reading_id in completed:
+                    stats["skipped"] += 1
+                    continue
+                completed.add(reading_id)
+                future = pool.submit(_task, reading_id, reading, code)
+                pending_ids[future] = reading_id
+                pending.add(future)
+                # 只保留有限个待处理任务，避免大文件全部载入内存
+                if len(pending) >= self.concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect(done)
+            _collect(pending)
+
+        stats["elapsed"] = time.perf_counter() - start
+        return stats
+
+
+def generate_readings(path: str, count: int, seed: Optional[int] = None):
+    """随机抽取 count 个牌阵写入输入文件，便于生成批量任务"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(count):
+            code = encode_reading(FOUR_SEASONS.draw(rng))
+            f.write(json.dumps({"id": index, "code": code}) + "\n")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="四季牌阵批量离线分析")
+    parser.add_argument("input", help="输入JSONL文件（每行一个牌阵）")
+    parser.add_argument("output", nargs="?", help="结果JSONL文件，已存在时从检查点继续")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时分析的牌阵数")
+    parser.add_argument("--rpm", type=float, default=None, help="每分钟请求数上限")
+    parser.add_argument("--tpm", type=float, default=None, help="每分钟token数上限（估算）")
+    parser.add_argument("--parts", default=",".join(ANALYSIS_PARTS),
+                        help=f"需要的分析部分，逗号分隔，可选 {', '.join(ANALYSIS_PARTS)}")
+    parser.add_argument("--combined", action="store_true", help="用一次结构化输出请求获取全部三项")
+    parser.add_argument("--generate", type=int, metavar="N", help="随机生成N个牌阵写入输入文件后退出")
+    parser.add_argument("--seed", type=int, default=None, help="--generate 使用的随机种子")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_readings(args.input, args.generate, args.seed)
+        print(f"✅ 已生成 {args.generate} 个牌阵: {args.input}")
+        return 0
+
+    if not args.output:
+        parser.error("需要指定结果文件")
+    if not Config.is_configured():
+        print("❌ 请先配置aihubmix API密钥（环境变量 AIHUBMIX_API_KEY）")
+        return 1
+
+    parts = tuple(part.strip() for part in args.parts.split(",") if part.strip())
+    unknown = set(parts) - set(ANALYSIS_PARTS)
+    if unknown:
+        parser.error(f"未知的分析部分: {', '.join(sorted(unknown))}")
+
+    runner = BatchRunner(args.concurrency, args.rpm, args.tpm, parts, args.combined)
+    stats = runner.run(args.input, args.output)
+    print("=" * 40)
+    print(f"完成 {stats['completed']}，跳过（已完成）{stats['skipped']}，失败 {stats['failed']}，"
+          f"无效 {stats['invalid']}，耗时 {stats['elapsed']:.1f}s")
+    print()
+    print(format_report(runner.analyzer.usage.totals()))
+    if stats["failed"]:
+        print("失败的牌阵未写入结果文件，重新运行同一命令即可重试")
+    if stats["invalid"]:
+        print("无效的输入行已跳过，请修正输入文件后重新运行")
+    return 1 if stats["failed"] or stats["invalid"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
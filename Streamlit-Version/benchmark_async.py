@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+同步与异步分析器的并发基准
+在本地桩服务器上同时发起大量快速洞察请求，对比
+线程池 + TarotAIAnalyzer 与 asyncio + AsyncTarotAIAnalyzer 的耗时、吞吐量和线程数
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from stub_server import StubServer
+from 四季牌阵 import decode_reading
+
+
+def benchmark_sync(requests_count: int, concurrency: int) -> tuple:
+    """用 concurrency 个线程发送请求，返回 (耗时, 峰值线程数)"""
+    from ai_analyzer import TarotAIAnalyzer
+
+    analyzer = TarotAIAnalyzer()
+    readings = [decode_reading(i) for i in range(requests_count)]
+    peak_threads = 0
+
+    def _call(reading):
+        nonlocal peak_threads
+        peak_threads = max(peak_threads, threading.active_count())
+        return analyzer.get_quick_insight(reading)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(_call, readings))
+    return time.perf_counter() - start, peak_threads
+
+
+def benchmark_async(requests_count: int, concurrency: int) -> tuple:
+    """在单个事件循环中并发发送请求，返回 (耗时, 峰值线程数)"""
+    from async_analyzer import AsyncTarotAIAnalyzer
+
+    readings = [decode_reading(i) for i in range(requests_count)]
+
+    async def _run():
+        async with AsyncTarotAIAnalyzer(max_connections=concurrency, max_concurrency=concurrency) as analyzer:
+            start = time.perf_counter()
+            await asyncio.gather(*(analyzer.get_quick_insight(reading) for reading in readings))
+            return time.perf_counter() - start, threading.active_count()
+
+    return asyncio.run(_run())
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="同步与异步分析器的并发基准")
+    parser.add_argument("--requests", type=int, default=1000, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=200, help="同时进行中的请求数")
+    parser.add_argument("--latency", type=float, default=0.5, help="桩服务器的模拟延迟（秒）")
+    args = parser.parse_args()
+
+    # 使用假密钥并关闭缓存，确保每个请求都到达桩服务器
+    Config.set_api_key("stub")
+    Config.CACHE_ENABLED = False
+    Config.HTTP_POOL_SIZE = args.concurrency
+
+    with StubServer(latency=args.latency) as server:
+        Config.API_BASE_URL = server.base_url
+        print(f"🧪 桩服务器: {server.base_url}（延迟 {args.latency}s）")
+        print(f"请求数 {args.requests}，并发 {args.concurrency}")
+        print("=" * 50)
+
+        for label, benchmark in (("同步 + 线程池", benchmark_sync), ("asyncio", benchmark_async)):
+            elapsed, threads = benchmark(args.requests, args.concurrency)
+            print(f"{label:<12}: {elapsed:6.2f}s  {args.requests / elapsed:8.1f} 请求/秒  峰值线程数 {threads}")
+
+
+if __name__ == "__main__":
+    main()
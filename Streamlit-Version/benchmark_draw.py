@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+四季牌阵抽牌性能基准与统计检验脚本
+- 吞吐量：逐个抽牌 shuffle_and_draw() 与批量抽牌 shuffle_and_draw_batch() 每秒抽取的牌阵数
+- 延迟：shuffle_and_draw() 单次调用的 p50 / p99
+- 内存：每个牌阵的内存分配
+- 正确性：各位置牌面分布和正逆位比例的卡方均匀性检验
+
+任一检验未通过或吞吐量低于 --min-rate / --min-batch-rate 时以退出码 1 结束，可作为回归门禁。
+"""
+
+import argparse
+import math
+import sys
+import time
+import tracemalloc
+
+from 四季牌阵 import (
+    SPREAD_DECK_RANGES,
+    shuffle_and_draw,
+    shuffle_and_draw_batch,
+)
+
+
+def chi2_sf(statistic: float, df: int) -> float:
+    """
+    卡方分布的生存函数 P(X >= statistic)，即正则化上不完全伽马函数 Q(df/2, statistic/2)。
+    小参数用级数展开，大参数用连分式，避免依赖scipy。
+    """
+    a = df / 2.0
+    x = statistic / 2.0
+    if x <= 0:
+        return 1.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # 级数展开求 P(a, x)，再取补
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    # Lentz 连分式直接求 Q(a, x)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    i = 1
+    while True:
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+        i += 1
+    return math.exp(log_prefix) * h
+
+
+def chi2_uniform(counts) -> tuple:
+    """对观测频数做均匀分布的卡方检验，返回 (统计量, 自由度, p值)"""
+    total = sum(counts)
+    expected = total / len(counts)
+    statistic = sum((observed - expected) ** 2 for observed in counts) / expected
+    df = len(counts) - 1
+    return statistic, df, chi2_sf(statistic, df)
+
+
+def collect_single_counts(count: int) -> tuple:
+    """逐个抽取 count 个牌阵，统计各位置的牌面频数和逆位次数"""
+    card_counts = [[0] * size for _, size in SPREAD_DECK_RANGES]
+    reversed_counts = [0] * len(SPREAD_DECK_RANGES)
+    for _ in range(count):
+        reading = shuffle_and_draw()
+        for column, (start, _) in enumerate(SPREAD_DECK_RANGES):
+            card = reading[column + 1]
+            card_counts[column][(card.id >> 1) - start] += 1
+            reversed_counts[column] += card.is_reversed
+    return card_counts, reversed_counts
+
+
+def collect_batch_counts(count: int, batch_size: int, seed: int = None) -> tuple:
+    """批量抽取 count 个牌阵，统计各位置的牌面频数和逆位次数"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    card_counts = [np.zeros(size, dtype=np.int64) for _, size in SPREAD_DECK_RANGES]
+    reversed_counts = np.zeros(len(SPREAD_DECK_RANGES), dtype=np.int64)
+    remaining = count
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        cards, reversed_mask = shuffle_and_draw_batch(size, rng)
+        for column, (start, deck_size) in enumerate(SPREAD_DECK_RANGES):
+            card_counts[column] += np.bincount(cards[:, column] - start, minlength=deck_size)
+        reversed_counts += reversed_mask.sum(axis=0)
+        remaining -= size
+    return [c.tolist() for c in card_counts], reversed_counts.tolist()
+
+
+def check_uniformity(label: str, count: int, card_counts, reversed_counts, alpha: float) -> bool:
+    """打印每个位置的卡方检验结果，全部 p 值不低于 alpha 时返回 True"""
+    print(f"\n📊 {label} 均匀性检验（{count:,} 个牌阵，显著性水平 {alpha:g}）")
+    passed = True
+    for column, counts in enumerate(card_counts):
+        position = column + 1
+        statistic, df, p_value = chi2_uniform(counts)
+        ok = p_value >= alpha
+        passed &= ok
+        print(f"  {position}号位置 牌面: χ²={statistic:9.2f} df={df:2d} p={p_value:.4f} {'✅' if ok else '❌'}")
+
+        reversed_total = reversed_counts[column]
+        statistic, df, p_value = chi2_uniform([reversed_total, count - reversed_total])
+        ok = p_value >= alpha
+        passed &= ok
+        print(f"  {position}号位置 逆位: 比例={reversed_total / count:.4f} χ²={statistic:6.2f} p={p_value:.4f} {'✅' if ok else '❌'}")
+    return passed
+
+
+def benchmark_single(count: int) -> float:
+    """逐个抽取 count 个牌阵，返回每秒抽取的牌阵数"""
+    start = time.perf_counter()
+    for _ in range(count):
+        shuffle_and_draw()
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def benchmark_batch(count: int, batch_size: int, seed: int = None) -> float:
+    """按 batch_size 分批抽取共 count 个牌阵，返回每秒抽取的牌阵数"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    remaining = count
+    start = time.perf_counter()
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        shuffle_and_draw_batch(size, rng)
+        remaining -= size
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def measure_latency(count: int) -> tuple:
+    """测量 shuffle_and_draw() 单次调用耗时，返回 (p50, p99)，单位微秒"""
+    clock = time.perf_counter_ns
+    samples = []
+    for _ in range(count):
+        start = clock()
+        shuffle_and_draw()
+        samples.append(clock() - start)
+    samples.sort()
+    p50 = samples[int(0.50 * (count - 1))] / 1000
+    p99 = samples[int(0.99 * (count - 1))] / 1000
+    return p50, p99
+
+
+def measure_allocations(count: int) -> tuple:
+    """
+    使用 tracemalloc 测量内存分配，返回 (每个牌阵常驻字节数, 单次调用峰值字节数)。
+    常驻字节数是保留 count 个牌阵结果时平均每个占用的内存，对应会话中保存的牌阵开销。
+    """
+    tracemalloc.start()
+    try:
+        shuffle_and_draw()
+        tracemalloc.reset_peak()
+        peak_base, _ = tracemalloc.get_traced_memory()
+        shuffle_and_draw()
+        _, peak = tracemalloc.get_traced_memory()
+
+        # 牌阵列表在函数返回时才释放，测量 after 时仍然常驻
+        before, _ = tracemalloc.get_traced_memory()
+        readings = [shuffle_and_draw() for _ in range(count)]
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (after - before) / count, peak - peak_base
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="四季牌阵抽牌性能基准与统计检验")
+    parser.add_argument("--single", type=int, default=1_000_000, help="逐个抽牌的牌阵数量")
+    parser.add_argument("--batch", type=int, default=50_000_000, help="批量抽牌的牌阵总数")
+    parser.add_argument("--batch-size", type=int, default=1_000_000, help="每批抽取的牌阵数量")
+    parser.add_argument("--latency-samples", type=int, default=100_000, help="测量单次延迟的调用次数")
+    parser.add_argument("--seed", type=int, default=None, help="批量抽牌使用的随机种子")
+    parser.add_argument("--alpha", type=float, default=1e-4, help="卡方检验的显著性水平")
+    parser.add_argument("--min-rate", type=float, default=0, help="shuffle_and_draw() 吞吐量下限（牌阵/秒）")
+    parser.add_argument("--min-batch-rate", type=float, default=0, help="shuffle_and_draw_batch() 吞吐量下限（牌阵/秒）")
+    parser.add_argument("--skip-stats", action="store_true", help="只测性能，跳过统计检验")
+    args = parser.parse_args()
+
+    print("🎲 四季牌阵抽牌性能基准")
+    print("=" * 40)
+    passed = True
+
+    single_rate = benchmark_single(args.single)
+    print(f"shuffle_and_draw()       : {single_rate:>14,.0f} 牌阵/秒")
+
+    batch_rate = benchmark_batch(args.batch, args.batch_size, args.seed)
+    print(f"shuffle_and_draw_batch() : {batch_rate:>14,.0f} 牌阵/秒")
+    print(f"加速比: {batch_rate / single_rate:,.1f}x")
+
+    p50, p99 = measure_latency(args.latency_samples)
+    print(f"单次延迟: p50={p50:.2f}µs p99={p99:.2f}µs")
+
+    retained, peak = measure_allocations(min(args.single, 100_000))
+    print(f"内存分配: 每个牌阵常驻 {retained:.0f} 字节，单次调用峰值 {peak} 字节")
+
+    if single_rate < args.min_rate:
+        print(f"❌ shuffle_and_draw() 吞吐量低于下限 {args.min_rate:,.0f}")
+        passed = False
+    if batch_rate < args.min_batch_rate:
+        print(f"❌ shuffle_and_draw_batch() 吞吐量低于下限 {args.min_batch_rate:,.0f}")
+        passed = False
+
+    if not args.skip_stats:
+        card_counts, reversed_counts = collect_single_counts(args.single)
+        passed &= check_uniformity("shuffle_and_draw()", args.single, card_counts, reversed_counts, args.alpha)
+
+        card_counts, reversed_counts = collect_batch_counts(args.batch, args.batch_size, args.seed)
+        passed &= check_uniformity("shuffle_and_draw_batch()", args.batch, card_counts, reversed_counts, args.alpha)
+
+    print("\n" + ("✅ 全部检查通过" if passed else "❌ 存在未通过的检查"))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
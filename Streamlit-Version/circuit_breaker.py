@@ -0,0 +1,139 @@
+"""
+熔断器
+服务商变慢或出错时，最近若干次调用中失败或超过慢调用阈值的比例达到上限即熔断：
+熔断期间直接拒绝请求，让用户立即看到回退内容，而不是每个请求都等满超时；
+冷却结束后进入半开状态，只放行少量试探请求，试探全部成功才恢复
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from config import Config
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+class CircuitBreaker:
+    """
+    线程安全的熔断器，状态为 closed（正常）、open（熔断）、half_open（试探）
+
+    用法：
+        if breaker.try_acquire():
+            started = time.perf_counter()
+            ...
+            breaker.record(ok, time.perf_counter() - started)
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, slow_call_seconds: float = None, failure_rate: float = None,
+                 window: int = None, min_calls: int = None, open_seconds: float = None,
+                 half_open_probes: int = None):
+        """
+        Args:
+            slow_call_seconds: 超过该耗时的成功调用也视为失败，默认 Config.BREAKER_SLOW_CALL_SECONDS["default"]
+            failure_rate: 失败（含慢调用）比例达到该值时熔断，默认 Config.BREAKER_FAILURE_RATE
+            window: 统计最近多少次调用，默认 Config.BREAKER_WINDOW
+            min_calls: 窗口内至少有多少次调用才判断是否熔断，默认 Config.BREAKER_MIN_CALLS
+            open_seconds: 熔断后快速失败的时间，默认 Config.BREAKER_OPEN_SECONDS
+            half_open_probes: 半开状态放行的试探请求数，默认 Config.BREAKER_HALF_OPEN_PROBES
+        """
+        self.slow_call_seconds = (Config.BREAKER_SLOW_CALL_SECONDS["default"]
+                                  if slow_call_seconds is None else slow_call_seconds)
+        self.failure_rate = Config.BREAKER_FAILURE_RATE if failure_rate is None else failure_rate
+        self.min_calls = Config.BREAKER_MIN_CALLS if min_calls is None else min_calls
+        self.open_seconds = Config.BREAKER_OPEN_SECONDS if open_seconds is None else open_seconds
+        self.half_open_probes = Config.BREAKER_HALF_OPEN_PROBES if half_open_probes is None else half_open_probes
+        self.state = self.CLOSED
+        self.trips = 0
+        self._outcomes: Deque[bool] = deque(maxlen=Config.BREAKER_WINDOW if window is None else window)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """当前是否可能放行请求（不占用试探名额），用于路由排序"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at >= self.open_seconds
+            if self.state == self.HALF_OPEN:
+                return self._probes_in_flight < self.half_open_probes
+            return True
+
+    def try_acquire(self) -> bool:
+        """
+        请求放行：closed 时总是放行；open 时冷却结束后转为半开；半开时占用一个试探名额
+
+        Returns:
+            是否放行；放行后必须调用 record 或 release
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        """
+        记录一次放行请求的结果
+
+        Args:
+            ok: 是否成功
+            latency: 耗时（秒），超过慢调用阈值的成功调用计为失败；为None时只看成败
+        """
+        bad = not ok or (latency is not None and latency > self.slow_call_seconds)
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if bad:
+                    self._trip()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            if self.state == self.OPEN:
+                # 熔断前发出、熔断后才返回的请求，不影响状态
+                return
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._trip()
+
+    def release(self):
+        """放行的请求没有得出结论（例如调用方提前停止读取），归还试探名额"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _trip(self):
+        self.state = self.OPEN
+        self.trips += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """当前状态、窗口内的失败比例和累计熔断次数"""
+        with self._lock:
+            total = len(self._outcomes)
+            return {
+                "state": self.state,
+                "failure_rate": sum(self._outcomes) / total if total else 0.0,
+                "recent_calls": total,
+                "trips": self.trips,
+            }
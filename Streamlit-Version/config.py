@@ -3,8 +3,11 @@
 配置aihubmix API设置
 """
 
+import json
 import os
-from typing import Optional
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
 
 class Config:
     """配置类，管理API设置和应用参数"""
@@ -20,6 +23,84 @@ class Config:
     MAX_TOKENS: int = 1500
     TEMPERATURE: float = 0.7
     
+    # HTTP连接池与重试
+    REQUEST_TIMEOUT: float = 30              # 单次请求超时（秒）
+    HTTP_POOL_CONNECTIONS: int = 4           # 缓存的主机连接池数量
+    HTTP_POOL_SIZE: int = 20                 # 每个主机的keep-alive连接数
+    HTTP_WARM_CONNECTIONS: int = 3           # 启动时预热的连接数
+    HTTP_MAX_RETRIES: int = 3                # 429/5xx/连接失败的最大重试次数
+    HTTP_BACKOFF_BASE: float = 0.5           # 指数退避基数（秒）
+    HTTP_BACKOFF_MAX: float = 8.0            # 单次退避上限（秒）
+    
+    # 多服务商路由：除默认服务商（API_BASE_URL）外的其他OpenAI兼容后端，
+    # 每项为 {"name", "base_url", "api_key" 或 "api_key_env", "model"}
+    PROVIDERS: list = []
+    HEDGE_ENABLED: bool = True               # 首选后端超过p95延迟未返回时向第二个后端发送对冲请求
+    HEDGE_DEFAULT_DELAY: float = 8.0         # 延迟样本不足时的对冲等待时间（秒）
+    ROUTER_MAX_SAMPLES: int = 100            # 每个后端保留的延迟样本数
+    ROUTER_MIN_SAMPLES: int = 10             # 使用p95作为对冲等待时间所需的最少样本数
+    ROUTER_WORKERS: int = 32                 # 对冲请求线程池大小
+    
+    # 熔断器（每个 服务商 + 调用方法 一个）：最近调用中失败或慢调用的比例过高时快速失败
+    BREAKER_FAILURE_RATE: float = 0.5        # 失败（含慢调用）比例达到该值时熔断
+    BREAKER_WINDOW: int = 20                 # 统计最近多少次调用
+    BREAKER_MIN_CALLS: int = 5               # 窗口内至少有多少次调用才判断是否熔断
+    BREAKER_OPEN_SECONDS: float = 30.0       # 熔断后快速失败的时间，之后进入半开状态试探
+    BREAKER_HALF_OPEN_PROBES: int = 2        # 半开状态放行的试探请求数，全部成功才恢复
+    BREAKER_SLOW_CALL_SECONDS = {            # 超过该耗时的调用计为慢调用（秒），按调用方法区分
+        "insight": 10.0,
+        "seasonal_advice": 25.0,
+        "full_analysis": 45.0,
+        "combined": 60.0,
+        "default": 30.0,
+    }
+    
+    # 一次解读（同一牌阵的全部AI调用）共享的总时限（秒），为None时不限制
+    ANALYSIS_DEADLINE: Optional[float] = 45.0
+    
+    # 异步分析器（AsyncTarotAIAnalyzer）
+    ASYNC_MAX_CONNECTIONS: int = 100         # 非阻塞连接池大小
+    ASYNC_MAX_CONCURRENCY: int = 500         # 同时进行中的请求上限
+    
+    # AI回复缓存（键为模型、提示词哈希、温度和max_tokens）
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 4096            # 内存中最多缓存的回复数（LRU淘汰）
+    CACHE_TTL_ANALYSIS: float = 6 * 3600     # 详细分析的缓存时间（秒）
+    CACHE_TTL_BRIEF: float = 24 * 3600       # 快速洞察和季节建议的缓存时间（秒）
+    CACHE_SQLITE_PATH: Optional[str] = None  # SQLite持久化路径，为None时只缓存在内存
+    
+    # 用量统计日志：逐条记录每次调用的token用量，为None时只在内存中统计
+    USAGE_LOG_PATH: Optional[str] = None
+    
+    # Prometheus指标端点（http://127.0.0.1:端口/metrics），为None时不启动
+    METRICS_PORT: Optional[int] = None
+    
+    # 进行中请求合并：完全相同的并发请求只向上游发送一次
+    SINGLE_FLIGHT_ENABLED: bool = True
+    
+    # 预先分析：抽牌后立即在后台开始AI分析，点击分析时直接使用结果（未点击时也会消耗API额度）
+    SPECULATIVE_ANALYSIS: bool = False
+    
+    # 抽牌仪式感：抽牌后短暂停顿并播放气球动画（Web界面侧边栏可单独开关）
+    CEREMONY_ENABLED: bool = False
+    
+    # 并发分析线程池大小（每次完整分析同时发出3个请求）
+    ANALYSIS_WORKERS: int = 12
+    
+    # 预先分析使用独立的线程池，不占用点击分析的线程；同时进行中的预先分析超过上限时不再预先分析
+    SPECULATION_WORKERS: int = 6
+    SPECULATION_MAX_PENDING: int = 4
+    
+    # 分析模式："concurrent" 并发发送三个请求；"combined" 一次结构化输出请求获取全部三项
+    ANALYSIS_MODE: str = "concurrent"
+    COMBINED_MAX_TOKENS: int = 2400
+    
+    # 并发模式下详细分析是否流式输出（逐字显示，缩短首字等待时间）
+    STREAMING_ENABLED: bool = True
+    
+    # 抽牌随机数流的根种子，为None时每个进程随机生成（记录后可复现线上抽牌）
+    RNG_ROOT_SEED: Optional[int] = None
+    
     # GUI配置
     WINDOW_TITLE: str = "四季牌阵 - AI智能分析"
     WINDOW_SIZE: tuple = (1200, 800)
@@ -39,14 +120,14 @@ class Config:
     @classmethod
     def load_from_env(cls):
         """从环境变量加载配置"""
-        cls.API_KEY = os.getenv('AIHUBMIX_API_KEY')
-        
-        # 可选的环境变量覆盖
-        if os.getenv('AIHUBMIX_BASE_URL'):
-            cls.API_BASE_URL = os.getenv('AIHUBMIX_BASE_URL')
-        
-        if os.getenv('AIHUBMIX_MODEL'):
-            cls.DEFAULT_MODEL = os.getenv('AIHUBMIX_MODEL')
+        for name, value in env_overrides().items():
+            setattr(cls, name, value)
+    
+    @classmethod
+    def load_from_file(cls, path: Optional[str]):
+        """从JSON配置文件加载配置，path 为None时不做任何事"""
+        for name, value in read_config_file(path).items():
+            setattr(cls, name, value)
     
     @classmethod
     def set_api_key(cls, api_key: str):
@@ -69,7 +150,260 @@ class Config:
             "Content-Type": "application/json"
         }
 
-# 在模块导入时自动尝试从环境变量加载配置
+def env_overrides() -> Dict[str, Any]:
+    """
+    读取环境变量中的配置项
+    
+    Returns:
+        {配置项名: 值}，只包含已设置的环境变量
+    """
+    values: Dict[str, Any] = {}
+    
+    if os.getenv('AIHUBMIX_API_KEY'):
+        values['API_KEY'] = os.getenv('AIHUBMIX_API_KEY')
+    
+    if os.getenv('AIHUBMIX_BASE_URL'):
+        values['API_BASE_URL'] = os.getenv('AIHUBMIX_BASE_URL')
+    
+    if os.getenv('AIHUBMIX_MODEL'):
+        values['DEFAULT_MODEL'] = os.getenv('AIHUBMIX_MODEL')
+    
+    if os.getenv('TAROT_CACHE_DB'):
+        values['CACHE_SQLITE_PATH'] = os.getenv('TAROT_CACHE_DB')
+    
+    if os.getenv('TAROT_CACHE_ENABLED'):
+        values['CACHE_ENABLED'] = os.getenv('TAROT_CACHE_ENABLED').lower() not in ('0', 'false', 'no')
+    
+    if os.getenv('TAROT_PROVIDERS'):
+        values['PROVIDERS'] = json.loads(os.getenv('TAROT_PROVIDERS'))
+    
+    if os.getenv('TAROT_HEDGE'):
+        values['HEDGE_ENABLED'] = os.getenv('TAROT_HEDGE').lower() not in ('0', 'false', 'no')
+    
+    if os.getenv('TAROT_ANALYSIS_DEADLINE'):
+        deadline = float(os.getenv('TAROT_ANALYSIS_DEADLINE'))
+        values['ANALYSIS_DEADLINE'] = deadline if deadline > 0 else None
+    
+    if os.getenv('TAROT_USAGE_LOG'):
+        values['USAGE_LOG_PATH'] = os.getenv('TAROT_USAGE_LOG')
+    
+    if os.getenv('TAROT_METRICS_PORT'):
+        values['METRICS_PORT'] = int(os.getenv('TAROT_METRICS_PORT'))
+    
+    if os.getenv('TAROT_SINGLE_FLIGHT'):
+        values['SINGLE_FLIGHT_ENABLED'] = os.getenv('TAROT_SINGLE_FLIGHT').lower() not in ('0', 'false', 'no')
+    
+    if os.getenv('TAROT_ANALYSIS_MODE'):
+        values['ANALYSIS_MODE'] = os.getenv('TAROT_ANALYSIS_MODE')
+    
+    if os.getenv('TAROT_SPECULATIVE'):
+        values['SPECULATIVE_ANALYSIS'] = os.getenv('TAROT_SPECULATIVE').lower() not in ('0', 'false', 'no')
+    
+    if os.getenv('TAROT_CEREMONY'):
+        values['CEREMONY_ENABLED'] = os.getenv('TAROT_CEREMONY').lower() not in ('0', 'false', 'no')
+    
+    if os.getenv('TAROT_STREAMING'):
+        values['STREAMING_ENABLED'] = os.getenv('TAROT_STREAMING').lower() not in ('0', 'false', 'no')
+    
+    if os.getenv('TAROT_RNG_SEED'):
+        values['RNG_ROOT_SEED'] = int(os.getenv('TAROT_RNG_SEED'))
+    
+    return values
+
+def read_config_file(path: Optional[str]) -> Dict[str, Any]:
+    """
+    读取JSON配置文件，键为 Config 中的配置项名，例如 {"DEFAULT_MODEL": "gpt-4o", "ANALYSIS_DEADLINE": 30}
+    
+    Args:
+        path: 配置文件路径，为None或文件不存在时返回空字典
+        
+    Returns:
+        {配置项名: 值}；文件无法解析或包含未知配置项时抛出 ValueError
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        values = json.load(f)
+    if not isinstance(values, dict):
+        raise ValueError(f"配置文件 {path} 的顶层必须是JSON对象")
+    unknown = [name for name in values if name not in _DEFAULTS]
+    if unknown:
+        raise ValueError(f"配置文件 {path} 包含未知配置项: {', '.join(unknown)}")
+    return values
+
+def _freeze(value: Any) -> Any:
+    """把字典和列表转换为只读的映射和元组，快照中的嵌套配置（如 PROVIDERS）也不能被修改"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class ConfigSnapshot:
+    """
+    不可变的配置快照
+    
+    配置项名和 is_configured()、get_api_headers() 与 Config 类相同，可以代替 Config 传给分析器。
+    快照创建后不能修改，每个会话持有自己的快照，读取时不需要加锁；修改配置时用 replace() 生成新快照。
+    
+    用法：
+        snapshot = get_config_store().session({"API_KEY": "sk-...", "DEFAULT_MODEL": "gpt-4"})
+        analyzer = TarotAIAnalyzer(config=snapshot)
+    """
+    
+    def __init__(self, values: Mapping[str, Any]):
+        """
+        Args:
+            values: {配置项名: 值}，嵌套的字典和列表会被转换为只读结构
+        """
+        # 配置项直接存为实例属性，读取与普通属性一样快
+        for name, value in values.items():
+            object.__setattr__(self, name, _freeze(value))
+    
+    def __getattr__(self, name: str) -> Any:
+        # 只有读取不存在的配置项时才会调用
+        raise AttributeError(f"未知配置项: {name}")
+    
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("配置快照不可修改，请用 replace() 生成新快照")
+    
+    def __delattr__(self, name: str):
+        raise AttributeError("配置快照不可修改")
+    
+    def __repr__(self) -> str:
+        return (f"ConfigSnapshot(API_BASE_URL={self.API_BASE_URL!r}, DEFAULT_MODEL={self.DEFAULT_MODEL!r}, "
+                f"API_KEY={'已配置' if self.is_configured() else '未配置'})")
+    
+    def replace(self, **changes) -> "ConfigSnapshot":
+        """
+        生成修改了部分配置项的新快照，原快照不变
+        
+        Args:
+            **changes: 要修改的配置项，例如 API_KEY="sk-..."
+        """
+        values = vars(self)
+        unknown = [name for name in changes if name not in values]
+        if unknown:
+            raise AttributeError(f"未知配置项: {', '.join(unknown)}")
+        # 未修改的配置项已经是只读结构，直接共享
+        snapshot = object.__new__(ConfigSnapshot)
+        vars(snapshot).update(values)
+        for name, value in changes.items():
+            object.__setattr__(snapshot, name, _freeze(value))
+        return snapshot
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """全部配置项的浅拷贝"""
+        return dict(vars(self))
+    
+    def is_configured(self) -> bool:
+        """检查是否已正确配置API密钥"""
+        return self.API_KEY is not None and self.API_KEY.strip() != ""
+    
+    def get_api_headers(self) -> dict:
+        """获取API请求头"""
+        if not self.is_configured():
+            raise ValueError("API密钥未设置，请先配置aihubmix API密钥")
+        
+        return {
+            "Authorization": f"Bearer {self.API_KEY}",
+            "Content-Type": "application/json"
+        }
+
+class ConfigStore:
+    """
+    线程安全的配置层
+    
+    按 默认值 < 配置文件 < 环境变量 的顺序合并出基础快照，会话设置（侧边栏中的密钥和模型）
+    再叠加在基础快照之上。读取快照只是读取一个引用，不加锁；重新加载时在锁内生成新快照后整体替换，
+    进行中的请求继续使用它们开始时的快照。
+    
+    连接池、线程池、回复缓存和服务商列表等进程级资源在首次使用时按 Config 类创建，
+    重新加载后只有每次请求读取的配置项（模型、超时、分析模式、总时限等）立即生效。
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: JSON配置文件路径，为None时只合并默认值和环境变量
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: Optional[int] = self._stat()
+        self._snapshot = self._build()
+    
+    def _stat(self) -> Optional[int]:
+        """配置文件的修改时间，文件不存在时为None"""
+        if not self.path:
+            return None
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _build(self) -> ConfigSnapshot:
+        values = dict(_DEFAULTS)
+        values.update(read_config_file(self.path))
+        values.update(env_overrides())
+        return ConfigSnapshot(values)
+    
+    def snapshot(self) -> ConfigSnapshot:
+        """当前的基础快照"""
+        return self._snapshot
+    
+    def session(self, overrides: Optional[Mapping[str, Any]] = None) -> ConfigSnapshot:
+        """
+        生成会话快照
+        
+        Args:
+            overrides: 会话自己的配置项，例如 {"API_KEY": ..., "DEFAULT_MODEL": ...}
+            
+        Returns:
+            基础快照叠加 overrides 后的快照；没有 overrides 时直接返回基础快照
+        """
+        snapshot = self._snapshot
+        return snapshot.replace(**overrides) if overrides else snapshot
+    
+    def reload(self) -> ConfigSnapshot:
+        """
+        重新读取配置文件和环境变量并替换基础快照
+        
+        Returns:
+            新的基础快照；配置文件有误时保留原快照
+        """
+        with self._lock:
+            mtime = self._stat()
+            try:
+                self._snapshot = self._build()
+            except (OSError, ValueError) as e:
+                print(f"配置重新加载失败，继续使用当前配置: {e}")
+            self._mtime = mtime
+            return self._snapshot
+    
+    def reload_if_changed(self) -> bool:
+        """配置文件的修改时间变化时重新加载，返回是否重新加载了"""
+        if not self.path or self._stat() == self._mtime:
+            return False
+        self.reload()
+        return True
+
+# 类定义中的默认值，配置文件和环境变量在此之上覆盖
+_DEFAULTS: Dict[str, Any] = {name: value for name, value in vars(Config).items() if name.isupper()}
+
+_store: Optional[ConfigStore] = None
+_store_lock = threading.Lock()
+
+def get_config_store() -> ConfigStore:
+    """获取进程级共享的配置层，配置文件路径取自环境变量 TAROT_CONFIG_FILE"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConfigStore(os.getenv('TAROT_CONFIG_FILE'))
+    return _store
+
+# 在模块导入时自动尝试从配置文件和环境变量加载配置（环境变量优先）
+Config.load_from_file(os.getenv('TAROT_CONFIG_FILE'))
 Config.load_from_env()
 
 # 示例配置文件内容，用户可以取消注释并填入自己的API密钥
@@ -83,6 +417,14 @@ EXAMPLE_CONFIG = """
 # 可选配置：
 # API_BASE_URL = "https://aihubmix.com/v1"  # 自定义API端点
 # DEFAULT_MODEL = "gpt-3.5-turbo"          # 使用的默认模型
+# export TAROT_RNG_SEED=20240922           # 抽牌随机数流的根种子，用于复现线上抽牌
+# export DEEPSEEK_API_KEY="..."            # 其他服务商，由路由器按延迟和熔断状态选择
+# export TAROT_ANALYSIS_DEADLINE=45         # 一次解读的总时限（秒），0 表示不限制
+# export TAROT_CONFIG_FILE=tarot.json       # JSON配置文件，键为配置项名，修改后Web界面自动重新加载
+# export TAROT_SPECULATIVE=1                # 抽牌后立即在后台开始AI分析（Web界面侧边栏可单独开关）
+# export TAROT_CEREMONY=1                  # 抽牌后停顿并播放气球动画（Web界面侧边栏可单独开关）
+# export TAROT_METRICS_PORT=9464            # 在 http://127.0.0.1:9464/metrics 输出Prometheus指标
+# export TAROT_PROVIDERS='[{"name": "deepseek", "base_url": "https://api.deepseek.com/v1", "api_key_env": "DEEPSEEK_API_KEY", "model": "deepseek-chat", "stream_usage": true}]'
 """
 
 if __name__ == "__main__":
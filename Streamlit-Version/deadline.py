@@ -0,0 +1,73 @@
+"""
+解读总时限
+一次解读（同一牌阵的详细分析、快速洞察和季节建议）共享一个截止时间，
+每个请求的超时、重试退避和等待都不超过剩余时间，而不是各自使用固定的超时
+"""
+
+import threading
+import time
+from typing import Optional
+
+from config import Config
+
+
+class DeadlineExceeded(TimeoutError):
+    """总时限已到或已被取消"""
+
+
+class Deadline:
+    """
+    线程安全的截止时间，可以在多个线程和协程之间共享
+
+    用法：
+        deadline = Deadline(45)
+        response = session.post(url, timeout=deadline.timeout(Config.REQUEST_TIMEOUT))
+    """
+
+    def __init__(self, seconds: float):
+        """
+        Args:
+            seconds: 从现在起的可用时间（秒）
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        """剩余秒数，已到期或已取消时为0"""
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cancel(self):
+        """提前结束，例如用户重新抽牌后放弃旧牌阵的分析"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """
+        本次等待可以使用的时间
+
+        Args:
+            cap: 单次等待的上限，例如 Config.REQUEST_TIMEOUT
+
+        Returns:
+            剩余时间和 cap 中较小的一个；已到期时抛出 DeadlineExceeded
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("已被取消" if self.cancelled else f"超过总时限 {self.seconds:g} 秒")
+        return remaining if cap is None else min(cap, remaining)
+
+
+def new_reading_deadline(config=Config) -> Optional[Deadline]:
+    """按 config.ANALYSIS_DEADLINE（会话快照或 Config 类）创建一次解读的总时限，配置为None时不限制"""
+    if config.ANALYSIS_DEADLINE is None:
+        return None
+    return Deadline(config.ANALYSIS_DEADLINE)
@@ -6,7 +6,7 @@
 
 from config import Config
 from ai_analyzer import TarotAIAnalyzer
-from 四季牌阵 import shuffle_and_draw
+from 四季牌阵 import shuffle_and_draw, FOUR_SEASONS
 
 def demo_ai_analysis():
     """演示AI分析功能"""
@@ -30,17 +30,9 @@ def demo_ai_analysis():
     
     # 显示抽牌结果
     print("\n=== 四季牌阵结果 ===")
-    position_names = {
-        1: "1号位置 (行动力)",
-        2: "2号位置 (情感状态)", 
-        3: "3号位置 (理性思维)",
-        4: "4号位置 (事业财务)",
-        5: "5号位置 (心灵成长)"
-    }
-    
-    for position in [5, 1, 2, 3, 4]:
+    for position in FOUR_SEASONS.spread.prompt_order:
         card = reading[position]
-        print(f"{position_names[position]}：{card.name}")
+        print(f"{FOUR_SEASONS.position(position).title}：{card.name}")
     
     # 初始化AI分析器
     print("\n🤖 正在初始化AI分析器...")
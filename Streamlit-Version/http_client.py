@@ -0,0 +1,158 @@
+"""
+AI请求的HTTP连接池
+提供进程内共享的keep-alive连接池，并对429和5xx响应做带随机抖动的指数退避重试
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+from deadline import Deadline
+from lazy_imports import lazy_import
+
+# requests 连同 urllib3、certifi 约需上百毫秒导入，推迟到第一次发送请求（或预热连接）时加载
+requests = lazy_import("requests")
+
+# 需要重试的状态码：限流和服务端错误
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+_warmed_up = threading.Event()
+
+
+def get_session() -> "requests.Session":
+    """
+    获取共享的HTTP会话
+
+    所有线程复用同一个连接池，避免每次请求都重新进行DNS解析、TCP和TLS握手。
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=Config.HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=Config.HTTP_POOL_SIZE,
+                    max_retries=0,  # 重试由 post_with_retry 负责
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def backoff_delay(attempt: int, response: Optional["requests.Response"] = None) -> float:
+    """
+    计算第 attempt 次重试前的等待时间（秒）
+
+    优先使用响应中的 Retry-After，否则使用 full jitter 指数退避：
+    在 [0, min(上限, 基数 * 2^attempt)] 内均匀取值，避免多个客户端同时重试。
+    """
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        try:
+            return min(float(retry_after), Config.HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(Config.HTTP_BACKOFF_MAX, Config.HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def post_with_retry(url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                    timeout: float = None, max_retries: int = None,
+                    deadline: Optional[Deadline] = None, before_attempt: Optional[Callable[[], None]] = None,
+                    **kwargs) -> "requests.Response":
+    """
+    通过共享连接池发送POST请求，遇到429、5xx或连接失败时重试
+
+    读取超时不会重试，以免用户等待时间成倍增加。指定总时限时，每次请求的超时不超过剩余时间，
+    剩余时间不够退避时直接返回最后一次响应（或抛出连接异常），不再重试。
+
+    Args:
+        url: 请求地址
+        headers: 请求头
+        payload: JSON请求体
+        timeout: 单次请求超时（秒），默认 Config.REQUEST_TIMEOUT
+        max_retries: 最大重试次数，默认 Config.HTTP_MAX_RETRIES
+        deadline: 总时限，已到期时抛出 DeadlineExceeded
+        before_attempt: 每次实际发送（包括重试）之前调用，例如从限速令牌桶中取令牌
+        **kwargs: 透传给 requests.Session.post 的其他参数（如 stream=True）
+
+    Returns:
+        最后一次请求的响应
+    """
+    session = get_session()
+    timeout = Config.REQUEST_TIMEOUT if timeout is None else timeout
+    max_retries = Config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+
+    for attempt in range(max_retries + 1):
+        if deadline is not None:
+            timeout = deadline.timeout(timeout)
+        if before_attempt is not None:
+            before_attempt()
+        try:
+            response = session.post(url, headers=headers, json=payload, timeout=timeout, **kwargs)
+        except requests.exceptions.ConnectionError:
+            delay = backoff_delay(attempt)
+            if attempt == max_retries or (deadline is not None and delay >= deadline.remaining()):
+                raise
+            time.sleep(delay)
+            continue
+
+        if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+            delay = backoff_delay(attempt, response)
+            if deadline is not None and delay >= deadline.remaining():
+                return response
+            response.close()
+            time.sleep(delay)
+            continue
+        return response
+    raise AssertionError("unreachable")
+
+
+def warm_up(base_url: str = None, headers: Dict[str, str] = None, connections: int = 1) -> bool:
+    """
+    预热连接池：提前建立到API服务器的TLS连接，让第一个分析请求不必等待握手
+
+    Args:
+        base_url: API基础地址，默认 Config.API_BASE_URL
+        headers: 请求头，默认不带鉴权
+        connections: 并发预热的连接数
+
+    Returns:
+        是否至少成功建立了一个连接
+    """
+    session = get_session()
+    url = f"{base_url or Config.API_BASE_URL}/models"
+    succeeded = threading.Event()
+
+    def _touch():
+        try:
+            session.get(url, headers=headers, timeout=Config.REQUEST_TIMEOUT).close()
+            succeeded.set()
+        except requests.exceptions.RequestException:
+            pass
+
+    threads = [threading.Thread(target=_touch, daemon=True) for _ in range(max(1, connections))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return succeeded.is_set()
+
+
+def warm_up_in_background(base_url: str = None, headers: Dict[str, str] = None):
+    """在后台线程预热连接池，每个进程只执行一次"""
+    if _warmed_up.is_set():
+        return
+    _warmed_up.set()
+    threading.Thread(
+        target=warm_up,
+        args=(base_url, headers, Config.HTTP_WARM_CONNECTIONS),
+        name="tarot-http-warmup",
+        daemon=True,
+    ).start()
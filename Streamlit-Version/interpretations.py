@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+离线牌义库
+78张牌 x 正逆位共156种状态的牌义，与牌阵各位置的解读框架在首次使用时预先组合成索引
+（四季牌阵为 5 个位置 x 156 种状态 = 780 条逐位解读和 780 条建议），
+组合器只做查表和拼接，几十微秒内即可生成完整的四季解读，
+用作抽牌后的即时首屏内容，以及AI服务未配置、变慢或失败时的降级回复
+
+用法：
+    interpreter = get_offline_interpreter()
+    results = interpreter.compose(reading)   # {"full_analysis", "insight", "seasonal_advice"}
+"""
+
+import threading
+import time
+from typing import Dict, NamedTuple, Tuple
+
+from 四季牌阵 import ALL_CARDS, CARD_TABLE, FOUR_SEASONS, Card, MajorArcana
+
+# 每张牌的 (正位含义, 逆位含义)，以顿号分隔的第一个词作为该状态的关键词
+CARD_MEANINGS: Dict[str, Tuple[str, str]] = {
+    # 大阿尔卡那
+    "愚人": ("纯真开端、对未知的信任与轻装上路", "冲动冒进、逃避责任与方向不明"),
+    "魔术师": ("意志集中、资源俱足、化想法为现实", "能力分散、心思摇摆与自我怀疑"),
+    "女祭司": ("直觉敏锐、静观内省与隐藏的智慧", "忽视直觉、信息不明与压抑内心的声音"),
+    "女皇": ("丰盛滋养、创造力与感官享受", "创造受阻、过度依赖与忽略自我照顾"),
+    "皇帝": ("秩序结构、权威担当与稳定掌控", "控制过度、僵化固执与缺乏自律"),
+    "教皇": ("传统信念、师长指引与共同价值", "质疑规则、挣脱教条与寻找自己的路"),
+    "恋人": ("真诚结合、价值一致与重要抉择", "关系失衡、价值冲突与犹豫不决"),
+    "战车": ("坚定意志、克服阻碍与掌握方向", "方向迷失、力量内耗与急于求成"),
+    "力量": ("温柔勇气、耐心与自我驯服", "自我怀疑、情绪失控与外强中干"),
+    "隐士": ("独处省思、向内探寻与智慧之光", "过度孤立、逃避人群与迷失于思绪"),
+    "命运之轮": ("周期转变、机缘来临与顺势而为", "时运低潮、抗拒变化与重复旧循环"),
+    "正义": ("公平因果、理性判断与诚实负责", "失衡偏颇、逃避后果与不公之感"),
+    "倒吊人": ("暂停等待、转换视角与甘愿放下", "无谓拖延、牺牲无果与停滞不前"),
+    "死神": ("结束与转化、告别旧我与迎接新生", "抗拒结束、执着过去与迟迟未至的转变"),
+    "节制": ("平衡调和、耐心融合与中庸之道", "失衡过度、急躁冒进与内外不协调"),
+    "恶魔": ("欲望束缚、执念与物质依恋", "挣脱束缚、看清执念与重获自由"),
+    "高塔": ("骤然变动、旧结构崩解与真相显露", "恐惧改变、变动延后与余震未平"),
+    "星星": ("希望疗愈、信心重建与灵感指引", "信心动摇、希望暂隐与需要重新连接"),
+    "月亮": ("潜意识浮现、迷雾中的不安与想象力", "迷雾渐散、恐惧释放与真相浮出"),
+    "太阳": ("喜悦成功、活力充沛与清晰明朗", "光芒暂蔽、喜悦打折与过度乐观"),
+    "审判": ("觉醒召唤、自我评估与重新出发", "自我苛责、错过召唤与犹疑不决"),
+    "世界": ("圆满完成、整合成就与新的循环", "未竟之事、临门一脚与需要收尾"),
+    # 权杖：能量、行动与创造力
+    "权杖一": ("灵感迸发、新计划的火种与创造冲动", "动力不足、计划延误与热情难以点燃"),
+    "权杖二": ("规划远景、做出选择与走出舒适区", "畏惧未知、计划停留在纸面与犹豫不前"),
+    "权杖三": ("拓展视野、等待成果与远方的机会", "进展受阻、期望落空与准备不足"),
+    "权杖四": ("庆祝稳定、阶段性成果与归属感", "根基不稳、过渡期的不安与庆祝推迟"),
+    "权杖五": ("良性竞争、意见碰撞与切磋成长", "内耗争执、回避冲突与无谓纷争"),
+    "权杖六": ("胜利认可、自信前行与公众肯定", "认可迟来、自我怀疑与骄傲自满"),
+    "权杖七": ("坚守立场、勇于捍卫与迎接挑战", "疲于应对、退让妥协与力不从心"),
+    "权杖八": ("快速推进、消息到来与行动顺畅", "节奏失控、仓促出错与进展延误"),
+    "权杖九": ("韧性坚持、保持警觉与最后一搏", "身心疲惫、过度戒备与难以再撑"),
+    "权杖十": ("责任沉重、负担过多与咬牙坚持", "不堪重负、学会放下与分担责任"),
+    "权杖侍从": ("探索热情、新鲜想法与好奇尝试", "三分钟热度、想法多行动少与缺乏方向"),
+    "权杖骑士": ("冒险冲劲、热情奔放与果断行动", "鲁莽冲动、半途而废与急躁易怒"),
+    "权杖皇后": ("自信魅力、温暖热情与独立自主", "自信受挫、嫉妒不安与过度强势"),
+    "权杖国王": ("远见领导、魄力担当与鼓舞他人", "独断专行、急于求成与期望过高"),
+    # 圣杯：情感、关系与直觉
+    "圣杯一": ("情感新生、爱与慈悲的涌现", "情感封闭、压抑感受与爱意流失"),
+    "圣杯二": ("相互吸引、和谐伙伴与情感连结", "关系失衡、沟通不畅与心意错位"),
+    "圣杯三": ("友谊欢聚、分享喜悦与支持网络", "过度放纵、小圈子的隔阂与情谊变淡"),
+    "圣杯四": ("情绪倦怠、沉思内省与错过机会", "走出冷漠、重新接纳与新的可能"),
+    "圣杯五": ("失落遗憾、沉湎过去与悲伤", "接受失去、疗愈开始与看见仍有的拥有"),
+    "圣杯六": ("怀旧温情、童真与旧日的善意", "困于过去、理想化回忆与难以前行"),
+    "圣杯七": ("多重幻想、选择众多与白日梦", "拨开幻想、认清现实与聚焦选择"),
+    "圣杯八": ("主动离开、追寻更深的意义与告别", "犹豫不舍、逃避离开与漫无目的"),
+    "圣杯九": ("心愿达成、满足与情感富足", "欲求不满、表面满足与内心空虚"),
+    "圣杯十": ("家庭和乐、情感圆满与归属", "关系裂痕、理想与现实的落差"),
+    "圣杯侍从": ("温柔讯息、直觉萌芽与情感表达", "情绪化、多愁善感与不成熟的表达"),
+    "圣杯骑士": ("浪漫邀请、追随内心与温柔示好", "情绪起伏、承诺落空与过度理想化"),
+    "圣杯皇后": ("共情关怀、情绪稳定与直觉滋养", "情绪透支、过度付出与依赖他人"),
+    "圣杯国王": ("情绪成熟、包容沉稳与温和智慧", "压抑情绪、冷漠疏离与情绪操控"),
+    # 宝剑：思想、挑战与决策
+    "宝剑一": ("思路清晰、真相突破与决断力", "思绪混乱、判断失误与言语伤人"),
+    "宝剑二": ("僵持两难、暂时回避与等待抉择", "僵局松动、信息过载与被迫表态"),
+    "宝剑三": ("心痛失望、真相刺痛与情绪释放", "伤口愈合、放下痛苦与走出阴霾"),
+    "宝剑四": ("休息复原、沉淀思绪与暂停充电", "焦躁难安、休息不足与被迫重启"),
+    "宝剑五": ("争执得失、赢了道理输了关系", "化解冲突、放下胜负与寻求和解"),
+    "宝剑六": ("平稳过渡、离开困境与驶向平静", "转变受阻、放不下包袱与原地打转"),
+    "宝剑七": ("策略机巧、独自行动与隐藏意图", "坦白真相、计划败露与回归诚实"),
+    "宝剑八": ("自我设限、困于想法与无力感", "松开束缚、看见出路与重获主动"),
+    "宝剑九": ("焦虑失眠、过度担忧与心理压力", "焦虑缓解、走出噩梦与寻求帮助"),
+    "宝剑十": ("触底反弹、痛苦终点与彻底结束", "逐步恢复、余痛未消与拒绝结束"),
+    "宝剑侍从": ("求知好奇、敏锐观察与直言表达", "流言是非、思虑不周与言辞尖刻"),
+    "宝剑骑士": ("思维迅捷、直奔目标与果断出击", "莽撞急躁、言语冲突与方向混乱"),
+    "宝剑皇后": ("独立清醒、边界分明与坦率洞察", "冷漠苛刻、过度批判与心防过重"),
+    "宝剑国王": ("理性权威、公正判断与清晰逻辑", "冷酷专断、滥用理性与操纵言辞"),
+    # 金币：物质、财富与事业
+    "金币一": ("新的财源、务实机会与稳固开端", "机会错失、规划不足与财务不稳"),
+    "金币二": ("灵活平衡、多线并行与随机应变", "顾此失彼、收支失衡与应接不暇"),
+    "金币三": ("团队协作、专业技能与获得认可", "配合不佳、标准不一与技能待磨"),
+    "金币四": ("守成节制、保障安全与掌控资源", "过度吝啬、执着占有与财务松动"),
+    "金币五": ("经济困窘、匮乏感与孤立无援", "困境好转、接受帮助与重建信心"),
+    "金币六": ("资源流动、乐于给予与慷慨分享", "付出失衡、附带条件与债务纠缠"),
+    "金币七": ("耐心耕耘、评估进度与长期投资", "急于收成、投入无果与方向需调整"),
+    "金币八": ("专注精进、勤勉工作与技艺打磨", "敷衍了事、重复乏味与完美主义"),
+    "金币九": ("自给自足、丰盛安逸与独立成就", "过度工作、依赖他人与财务隐忧"),
+    "金币十": ("长久财富、家业传承与稳固基础", "根基动摇、家庭财务纠纷与传承受阻"),
+    "金币侍从": ("学习新技能、务实规划与踏实起步", "拖延懒散、目标不清与学而不用"),
+    "金币骑士": ("稳健可靠、按部就班与持之以恒", "停滞保守、过于刻板与懈怠"),
+    "金币皇后": ("务实照顾、经营有道与富足安稳", "过度操心、物质焦虑与生活失衡"),
+    "金币国王": ("事业有成、财务稳健与可靠领导", "过度物质、固执保守与贪求"),
+}
+
+
+class PositionFrame(NamedTuple):
+    """一个位置（生活层面）的解读框架，{name}、{meaning}、{key} 分别为牌名、牌义和关键词"""
+    upright: str
+    reversed: str
+    advice_upright: str
+    advice_reversed: str
+
+
+# 按 SpreadPosition.label 匹配的解读框架
+POSITION_FRAMES: Dict[str, PositionFrame] = {
+    "行动力": PositionFrame(
+        "{name}落在行动力的位置，代表{meaning}。这一季适合把想法落实为具体行动，顺着这股能量主动出击。",
+        "{name}出现在行动力的位置，提示{meaning}。行动上的阻滞需要先被看见，调整节奏比一味用力更重要。",
+        "借着「{key}」的势头，给自己定一个本季能完成的小目标，今天就迈出第一步。",
+        "留意「{key}」的提醒，先放慢脚步理清优先级，把力气用在最重要的一件事上。",
+    ),
+    "情感状态": PositionFrame(
+        "{name}出现在情感状态的位置，映照出{meaning}。内心的感受正在流动，适合真诚地表达与连结。",
+        "{name}落在情感状态的位置，反映{meaning}。温柔地接纳此刻的情绪，不急着给感受下结论。",
+        "珍惜「{key}」带来的温度，主动向在乎的人表达心意。",
+        "面对「{key}」，给情绪留出空间，每天留一点时间倾听自己。",
+    ),
+    "理性思维": PositionFrame(
+        "{name}落在理性思维的位置，显示{meaning}。头脑清明的时刻，适合分析局势、做出判断。",
+        "{name}出现在理性思维的位置，提醒{meaning}。想法容易钻牛角尖，换个角度或与人讨论会更清楚。",
+        "运用「{key}」的清晰，把悬而未决的问题写下来，逐条做出决定。",
+        "察觉「{key}」的影响，重要决定前多收集信息，避免在情绪中下结论。",
+    ),
+    "事业财务": PositionFrame(
+        "{name}出现在事业财务的位置，预示{meaning}。脚踏实地的耕耘会在现实层面看到回报。",
+        "{name}落在事业财务的位置，提示{meaning}。现实层面需要更谨慎地规划资源与投入。",
+        "把握「{key}」的机会，为工作或财务制定清晰的季度计划并按步执行。",
+        "针对「{key}」，检视收支和工作安排，先稳住基础再图扩张。",
+    ),
+    "灵性成长": PositionFrame(
+        "核心位置的{name}是本季的灵魂课题，象征{meaning}，为其余四个层面定下基调。",
+        "核心位置的{name}象征{meaning}。这是本季需要向内面对的功课，也是其余四个层面的底色。",
+        "以「{key}」为本季的内在主题，每天留出片刻静心，与它对话。",
+        "把「{key}」当作成长的功课，温柔而诚实地面对内在的阻力。",
+    ),
+}
+
+# 牌阵中未定义框架的位置使用的通用框架（{label} 为位置含义）
+GENERIC_FRAME = PositionFrame(
+    "{name}落在{label}的位置，代表{meaning}。",
+    "{name}落在{label}的位置，提示{meaning}。",
+    "在{label}上，顺着「{key}」的能量前进。",
+    "在{label}上，留意「{key}」带来的提醒。",
+)
+
+# (逆位牌占比上限, 整体基调, 核心洞察的后半句)，按占比从低到高匹配
+BALANCE_TEXTS = (
+    (0.0, "所有牌均为正位，能量整体顺畅，是积极推进、播种收获的一季", "四季的每一步都会顺势生长"),
+    (0.4, "整体基调向好，少数层面需要留意与调整", "顺境与逆流都会成为成长的养分"),
+    (0.8, "多个层面存在阻滞，适合放慢脚步、向内调整", "放慢脚步，种子正在土壤下积蓄力量"),
+    (1.0, "所有牌均为逆位，能量普遍内收，这一季更适合休养、反思与重整", "静待冬尽，内在的火光会重新点燃"),
+)
+
+
+def _base_name(card_enum) -> str:
+    """牌的基础名称（不含正逆位）"""
+    return card_enum.name if isinstance(card_enum, MajorArcana) else card_enum.value
+
+
+def _meaning(card: Card) -> str:
+    upright, reversed_ = CARD_MEANINGS[_base_name(card.card)]
+    return reversed_ if card.is_reversed else upright
+
+
+def _keyword(card: Card) -> str:
+    return _meaning(card).split("、", 1)[0]
+
+
+class OfflineInterpreter:
+    """
+    由牌义库和牌阵定义预先编译的解读索引 + 组合器
+
+    每个位置为全部156种状态各预先生成一条解读和一条建议（下标即 Card.id），
+    组合时只查表和拼接，不做任何I/O。
+    """
+
+    def __init__(self, plan=FOUR_SEASONS):
+        """
+        Args:
+            plan: 编译后的牌阵（DrawPlan），默认为四季牌阵
+        """
+        self.plan = plan
+        texts, advice = [], []
+        for position in plan.positions:
+            frame = POSITION_FRAMES.get(position.label, GENERIC_FRAME)
+            texts.append(tuple(self._fill(frame.reversed if card.is_reversed else frame.upright, card, position)
+                               for card in CARD_TABLE))
+            advice.append(tuple(
+                self._fill(frame.advice_reversed if card.is_reversed else frame.advice_upright, card, position)
+                for card in CARD_TABLE
+            ))
+        # position_texts[位置编号 - 1][Card.id]
+        self.position_texts: Tuple[Tuple[str, ...], ...] = tuple(texts)
+        self.advice_texts: Tuple[Tuple[str, ...], ...] = tuple(advice)
+        self.keywords: Tuple[str, ...] = tuple(_keyword(card) for card in CARD_TABLE)
+        self.core_position = plan.spread.core_position or plan.spread.prompt_order[0]
+
+    @staticmethod
+    def _fill(template: str, card: Card, position) -> str:
+        return template.format(name=card.name, meaning=_meaning(card), key=_keyword(card), label=position.label)
+
+    def interpret(self, number: int, card: Card) -> str:
+        """某个位置上一张牌的解读"""
+        return self.position_texts[number - 1][card.id]
+
+    @staticmethod
+    def _balance(reading: Dict[int, Card]) -> Tuple[str, str]:
+        """按逆位牌占比返回 (整体基调, 核心洞察的后半句)"""
+        ratio = sum(card.is_reversed for card in reading.values()) / len(reading)
+        for limit, overview, flow in BALANCE_TEXTS:
+            if ratio <= limit:
+                return overview, flow
+        return BALANCE_TEXTS[-1][1], BALANCE_TEXTS[-1][2]
+
+    def full_analysis(self, reading: Dict[int, Card]) -> str:
+        """按整体概述、逐位解读、牌面关联、实用建议、灵性指引组织的完整解读（Markdown）"""
+        positions = self.plan.positions
+        core = reading[self.core_position]
+        others = [position for position in positions if position.number != self.core_position]
+        flowing = [position.label for position in others if not reading[position.number].is_reversed]
+        blocked = [position.label for position in others if reading[position.number].is_reversed]
+        overview, _ = self._balance(reading)
+
+        lines = [
+            "### 整体概述",
+            f"本季牌阵以{core.name}为核心，主题是{_meaning(core)}。{overview}。",
+            "",
+            "### 逐位解读",
+        ]
+        for position in positions:
+            card = reading[position.number]
+            lines.append(f"- **{position.title}｜{card.name}**：{self.position_texts[position.number - 1][card.id]}")
+
+        lines += ["", "### 牌面关联"]
+        if flowing and blocked:
+            lines.append(f"{'、'.join(flowing)}的能量较为顺畅，可以带动{'、'.join(blocked)}上的调整；"
+                         f"不必同时处理所有问题，先从顺手的层面积累信心。")
+        elif flowing:
+            lines.append("各个生活层面相互支持，可以同步展开、彼此成就。")
+        else:
+            lines.append("各个生活层面都在提示调整，外在的阻力往往指向同一个内在课题，宜少做加法、多做减法。")
+        if core.is_reversed:
+            lines.append("核心牌为逆位，外在层面的起伏多半源于内在课题，先照顾内心会事半功倍。")
+        else:
+            lines.append("核心牌为正位，内在方向清晰，能为其余层面提供稳定的支撑。")
+
+        lines += ["", "### 实用建议"]
+        strongest = next((p for p in others if not reading[p.number].is_reversed), None)
+        weakest = next((p for p in others if reading[p.number].is_reversed), None)
+        if strongest is not None:
+            lines.append(f"- 发挥优势（{strongest.label}）："
+                         f"{self.advice_texts[strongest.number - 1][reading[strongest.number].id]}")
+        if weakest is not None:
+            lines.append(f"- 需要留意（{weakest.label}）："
+                         f"{self.advice_texts[weakest.number - 1][reading[weakest.number].id]}")
+
+        lines += ["", "### 灵性指引", self.advice_texts[self.core_position - 1][core.id]]
+        return "\n".join(lines)
+
+    def insight(self, reading: Dict[int, Card]) -> str:
+        """一句话的核心洞察"""
+        core = reading[self.core_position]
+        _, flow = self._balance(reading)
+        key = self.keywords[core.id]
+        if core.is_reversed:
+            return f"穿过「{key}」的迷雾，{flow}。"
+        return f"当「{key}」照亮内心，{flow}。"
+
+    def seasonal_advice(self, reading: Dict[int, Card]) -> str:
+        """各生活层面的建议，每个位置一行"""
+        return "\n".join(
+            f"{index}. {position.label}建议：{self.advice_texts[position.number - 1][reading[position.number].id]}"
+            for index, position in enumerate(self.plan.positions, start=1)
+        )
+
+    def compose(self, reading: Dict[int, Card]) -> Dict[str, str]:
+        """
+        生成完整的离线解读
+
+        Args:
+            reading: 抽牌结果字典
+
+        Returns:
+            包含 full_analysis、insight、seasonal_advice 的字典，与AI分析结果的格式一致
+        """
+        return {
+            "full_analysis": self.full_analysis(reading),
+            "insight": self.insight(reading),
+            "seasonal_advice": self.seasonal_advice(reading),
+        }
+
+
+_interpreters: Dict[str, OfflineInterpreter] = {}
+_interpreters_lock = threading.Lock()
+
+
+def get_offline_interpreter(plan=FOUR_SEASONS) -> OfflineInterpreter:
+    """获取指定牌阵的共享离线解读器（每个牌阵在首次使用时编译一次）"""
+    key = plan.spread.key
+    interpreter = _interpreters.get(key)
+    if interpreter is None:
+        with _interpreters_lock:
+            interpreter = _interpreters.get(key)
+            if interpreter is None:
+                interpreter = _interpreters[key] = OfflineInterpreter(plan)
+    return interpreter
+
+
+# 导入时检查牌义库覆盖全部78张牌
+_missing = [_base_name(card) for card in ALL_CARDS if _base_name(card) not in CARD_MEANINGS]
+if _missing:
+    raise ValueError(f"牌义库缺少: {', '.join(_missing)}")
+
+
+if __name__ == "__main__":
+    # 随机抽一个牌阵，输出离线解读和耗时
+    started = time.perf_counter()
+    interpreter = get_offline_interpreter()
+    compiled = time.perf_counter() - started
+    reading = FOUR_SEASONS.draw()
+    started = time.perf_counter()
+    for _ in range(1000):
+        results = interpreter.compose(reading)
+    per_call = (time.perf_counter() - started) / 1000
+
+    entries = sum(len(texts) for texts in interpreter.position_texts)
+    print(f"索引编译: {compiled * 1000:.1f}ms（{entries} 条逐位解读）  组合一次: {per_call * 1e6:.1f}µs")
+    print("=" * 60)
+    for position in FOUR_SEASONS.positions:
+        print(f"{position.title}: {reading[position.number].name}")
+    for part, text in results.items():
+        print(f"\n[{part}]\n{text}")
@@ -0,0 +1,71 @@
+"""
+延迟导入
+numpy、requests、aiohttp 等较重的依赖在第一次访问其属性时才真正加载，
+缩短Web应用和分析器模块的冷启动时间（用 profile_imports.py 检查导入耗时）
+"""
+
+import importlib
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """
+    模块代理：第一次访问属性时导入真正的模块，之后直接转发
+
+    不使用 importlib.util.LazyLoader：它把占位模块放进 sys.modules，
+    inspect.getmodule() 和Streamlit的文件监视器遍历 sys.modules 读取 __file__ 时会把所有占位模块提前加载。
+    代理只存在于导入它的模块中，真正的模块在加载后才出现在 sys.modules 里。
+    """
+
+    __slots__ = ("_name", "_module", "_lock")
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", sys.modules.get(name))
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        # 只有 _name、_module、_lock 之外的属性才会走到这里
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "已加载" if self._module is not None else "未加载"
+        return f"<LazyModule {self._name!r}（{state}）>"
+
+
+def lazy_import(name: str) -> Optional[LazyModule]:
+    """
+    返回一个延迟加载的模块：导入语句本身几乎不耗时，第一次访问模块属性时才执行模块代码
+
+    模块级和函数签名中的类型注解会访问模块属性，引用延迟模块中的类型时请使用字符串注解，
+    例如 "requests.Session"。
+
+    Args:
+        name: 顶层模块名，例如 "numpy"
+
+    Returns:
+        模块代理；模块未安装时返回None（用于可选依赖）
+    """
+    if name not in sys.modules and importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+分析器压测
+按目标QPS（恒定间隔或泊松到达）向分析器发起牌阵分析，统计实际吞吐量、延迟分位数和错误率；
+默认在进程内启动桩服务器（stub_server.py），不产生费用也不依赖网络
+
+示例：
+    python load_test.py --qps 20 --duration 30 --operation all --latency lognormal:0.8,0.5 --token-rate 80
+    python load_test.py --qps 50 --engine async --operation stream --error-rate 0.05 --max-error-rate 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from ai_analyzer import TarotAIAnalyzer
+from config import Config
+from deadline import Deadline
+from provider_router import Provider, ProviderRouter
+from stub_server import add_stub_arguments, stub_from_args
+from 四季牌阵 import Card, FOUR_SEASONS
+
+# 每次操作对应界面上的一种分析方式
+OPERATIONS = ("all", "combined", "stream", "insight")
+
+
+@dataclass
+class Sample:
+    """一次操作的结果"""
+    operation: str
+    started: float                   # 相对压测开始的时间（秒）
+    latency: float                   # 完整耗时（秒）
+    ttfb: Optional[float] = None     # 流式操作收到第一个片段的耗时（秒）
+    ok: bool = True                  # 是否拿到了AI回复（任一部分为回退文本即视为失败）
+    error: Optional[str] = None      # 抛出的异常
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法计算 q 分位数（values 需已排序），没有数据时返回None"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def _is_fallback(result: Any, offline: Dict[str, str]) -> bool:
+    """结果中是否包含回退文本（该牌阵的离线解读）"""
+    fallbacks = set(offline.values())
+    if isinstance(result, dict):
+        return any(value in fallbacks for value in result.values())
+    return result in fallbacks
+
+
+class LoadTest:
+    """
+    开环压测：请求按到达时间发出，不等待前一个请求完成，超过并发上限的请求计为丢弃
+
+    用法：
+        samples = LoadTest(analyzer, operation="all", qps=10, duration=30).run()
+    """
+
+    def __init__(self, analyzer, operation: str = "all", qps: float = 5.0, duration: float = 30.0,
+                 max_in_flight: int = 256, poisson: bool = False, deadline: Optional[float] = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            analyzer: TarotAIAnalyzer 或 AsyncTarotAIAnalyzer
+            operation: 每次操作的分析方式，取自 OPERATIONS
+            qps: 目标每秒操作数
+            duration: 发起请求的时长（秒），之后等待进行中的操作完成
+            max_in_flight: 同时进行中的操作上限
+            poisson: 是否按泊松过程到达（默认恒定间隔）
+            deadline: 每次操作的总时限（秒），为None时不限制
+            seed: 随机种子，决定抽到的牌阵和到达间隔
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"未知的操作: {operation}，可选 {', '.join(OPERATIONS)}")
+        self.analyzer = analyzer
+        self.operation = operation
+        self.qps = qps
+        self.duration = duration
+        self.max_in_flight = max_in_flight
+        self.poisson = poisson
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.samples: List[Sample] = []
+        self.dropped = 0
+        self.elapsed = 0.0
+
+    def _arrivals(self) -> List[float]:
+        """各次操作相对开始时间的发起时刻"""
+        times, now = [], 0.0
+        while True:
+            now += self.rng.expovariate(self.qps) if self.poisson else 1.0 / self.qps
+            if now >= self.duration:
+                return times
+            times.append(now)
+
+    def _new_deadline(self) -> Optional[Deadline]:
+        return Deadline(self.deadline) if self.deadline else None
+
+    def _run_once(self, reading: Dict[int, Card], started: float) -> Sample:
+        """同步执行一次操作并计时"""
+        begin = time.perf_counter()
+        ttfb = None
+        try:
+            deadline = self._new_deadline()
+            if self.operation == "all":
+                result = self.analyzer.analyze_all(reading, deadline)
+            elif self.operation == "combined":
+                result = self.analyzer.analyze_combined(reading, deadline)
+            elif self.operation == "insight":
+                result = self.analyzer.get_quick_insight(reading, deadline)
+            else:
+                chunks = []
+                for chunk in self.analyzer.analyze_reading_stream(reading, deadline):
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - begin
+                    chunks.append(chunk)
+                result = "".join(chunks)
+        except Exception as e:
+            return Sample(self.operation, started, time.perf_counter() - begin, ttfb, False, repr(e))
+        return Sample(self.operation, started, time.perf_counter() - begin, ttfb,
+                      not _is_fallback(result, self.analyzer.offline.compose(reading)))
+
+    async def _run_once_async(self, reading: Dict[int, Card], started: float) -> Sample:
+        """_run_once 的协程版本"""
+        begin = time.perf_counter()
+        ttfb = None
+        try:
+            deadline = self._new_deadline()
+            if self.operation == "all":
+                result = await self.analyzer.analyze_all(reading, deadline)
+            elif self.operation == "combined":
+                result = await self.analyzer.analyze_combined(reading, deadline)
+            elif self.operation == "insight":
+                result = await self.analyzer.get_quick_insight(reading, deadline)
+            else:
+                chunks = []
+                async for chunk in self.analyzer.analyze_reading_stream(reading, deadline):
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - begin
+                    chunks.append(chunk)
+                result = "".join(chunks)
+        except Exception as e:
+            return Sample(self.operation, started, time.perf_counter() - begin, ttfb, False, repr(e))
+        return Sample(self.operation, started, time.perf_counter() - begin, ttfb,
+                      not _is_fallback(result, self.analyzer.offline.compose(reading)))
+
+    def run(self) -> List[Sample]:
+        """用线程池驱动同步分析器"""
+        samples: List[Sample] = []
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        start = time.perf_counter()
+
+        def _task(reading, offset):
+            try:
+                samples.append(self._run_once(reading, offset))
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="load-test") as pool:
+            for offset in self._arrivals():
+                reading = FOUR_SEASONS.draw(self.rng)
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if not slots.acquire(blocking=False):
+                    self.dropped += 1
+                    continue
+                pool.submit(_task, reading, offset)
+        self.elapsed = time.perf_counter() - start
+        self.samples = samples
+        return samples
+
+    async def run_async(self) -> List[Sample]:
+        """在当前事件循环中驱动 AsyncTarotAIAnalyzer"""
+        tasks = []
+        in_flight = 0
+        start = time.perf_counter()
+
+        async def _task(reading, offset):
+            nonlocal in_flight
+            try:
+                return await self._run_once_async(reading, offset)
+            finally:
+                in_flight -= 1
+
+        for offset in self._arrivals():
+            reading = FOUR_SEASONS.draw(self.rng)
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if in_flight >= self.max_in_flight:
+                self.dropped += 1
+                continue
+            in_flight += 1
+            tasks.append(asyncio.ensure_future(_task(reading, offset)))
+        self.samples = list(await asyncio.gather(*tasks))
+        self.elapsed = time.perf_counter() - start
+        return self.samples
+
+
+def summarize(samples: List[Sample], elapsed: float, dropped: int = 0) -> Dict[str, Any]:
+    """汇总吞吐量、延迟分位数和错误率"""
+    latencies = sorted(sample.latency for sample in samples)
+    ttfbs = sorted(sample.ttfb for sample in samples if sample.ttfb is not None)
+    failed = sum(1 for sample in samples if not sample.ok)
+    quantiles = (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+    return {
+        "operations": len(samples),
+        "succeeded": len(samples) - failed,
+        "failed": failed,
+        "dropped": dropped,
+        "error_rate": (failed + dropped) / (len(samples) + dropped) if samples or dropped else 0.0,
+        "elapsed": elapsed,
+        "throughput": len(samples) / elapsed if elapsed else 0.0,
+        "goodput": (len(samples) - failed) / elapsed if elapsed else 0.0,
+        "latency": {name: percentile(latencies, q) for name, q in quantiles},
+        "ttfb": {name: percentile(ttfbs, q) for name, q in quantiles} if ttfbs else None,
+        "errors": sorted({sample.error for sample in samples if sample.error}),
+    }
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """将汇总格式化为文本"""
+    def _row(label: str, values: Dict[str, Optional[float]]) -> str:
+        return f"{label}  " + "  ".join(
+            f"{name} {value:.3f}s" if value is not None else f"{name} -" for name, value in values.items()
+        )
+
+    lines = [
+        f"操作 {summary['operations']}  成功 {summary['succeeded']}  失败 {summary['failed']}  "
+        f"丢弃（超过并发上限）{summary['dropped']}  错误率 {summary['error_rate']:.2%}",
+        f"耗时 {summary['elapsed']:.1f}s  吞吐量 {summary['throughput']:.2f} 次/秒  "
+        f"有效吞吐量 {summary['goodput']:.2f} 次/秒",
+        _row("延迟", summary["latency"]),
+    ]
+    if summary["ttfb"]:
+        lines.append(_row("首字", summary["ttfb"]))
+    for error in summary["errors"][:5]:
+        lines.append(f"异常: {error}")
+    return "\n".join(lines)
+
+
+def _run(args: argparse.Namespace, make_analyzer: Callable[[], Any]) -> LoadTest:
+    """按命令行参数执行一次压测"""
+    test_kwargs = dict(
+        operation=args.operation, qps=args.qps, duration=args.duration, max_in_flight=args.max_in_flight,
+        poisson=args.poisson, deadline=args.deadline or None, seed=args.seed,
+    )
+    if args.engine == "sync":
+        test = LoadTest(make_analyzer(), **test_kwargs)
+        test.run()
+        return test
+
+    from async_analyzer import AsyncTarotAIAnalyzer
+
+    async def _main():
+        async with AsyncTarotAIAnalyzer(router=ProviderRouter([Provider("load-test", stream_usage=True)])) as analyzer:
+            test = LoadTest(analyzer, **test_kwargs)
+            await test.run_async()
+            return test
+
+    return asyncio.run(_main())
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="四季牌阵分析器压测")
+    parser.add_argument("--qps", type=float, default=5.0, help="目标每秒操作数")
+    parser.add_argument("--duration", type=float, default=30.0, help="发起请求的时长（秒）")
+    parser.add_argument("--operation", choices=OPERATIONS, default="all",
+                        help="all: 三项并发；combined: 结构化输出；stream: 流式详细分析；insight: 快速洞察")
+    parser.add_argument("--engine", choices=("sync", "async"), default="sync",
+                        help="sync: TarotAIAnalyzer + 线程池；async: AsyncTarotAIAnalyzer")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="同时进行中的操作上限")
+    parser.add_argument("--poisson", action="store_true", help="按泊松过程到达（默认恒定间隔）")
+    parser.add_argument("--deadline", type=float, default=Config.ANALYSIS_DEADLINE or 0,
+                        help="每次操作的总时限（秒），0表示不限制")
+    parser.add_argument("--cache", action="store_true", help="启用回复缓存（默认关闭，每次都请求上游）")
+    parser.add_argument("--base-url", default=None, help="压测已运行的服务（默认在进程内启动桩服务器）")
+    parser.add_argument("--json", metavar="PATH", help="把汇总和逐条结果写入JSON文件")
+    parser.add_argument("--metrics-port", type=int, default=None, help="压测期间在该端口输出Prometheus指标")
+    parser.add_argument("--metrics", metavar="PATH", help="结束时把Prometheus指标写入文本文件")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="错误率超过该值时返回非零退出码")
+    parser.add_argument("--max-p95", type=float, default=None, help="p95延迟（秒）超过该值时返回非零退出码")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    Config.CACHE_ENABLED = args.cache
+    server = None
+    if args.base_url:
+        Config.API_BASE_URL = args.base_url
+    else:
+        server = stub_from_args(args).start()
+        Config.API_BASE_URL = server.base_url
+        print(f"🧪 桩服务器: {server.base_url}（首字延迟 {server.latency}，"
+              f"生成速度 {args.token_rate or '不限'} token/秒）")
+    if not Config.is_configured():
+        Config.set_api_key("load-test")
+    if args.metrics_port is not None:
+        metrics_server = metrics.start_metrics_server(args.metrics_port)
+        if metrics_server is not None:
+            print(f"📈 指标端点: http://127.0.0.1:{metrics_server.server_address[1]}/metrics")
+
+    try:
+        test = _run(args, lambda: TarotAIAnalyzer(router=ProviderRouter([Provider("load-test", stream_usage=True)])))
+    finally:
+        if server is not None:
+            server.stop()
+
+    summary = summarize(test.samples, test.elapsed, test.dropped)
+    print("=" * 60)
+    print(f"{args.operation} / {args.engine}  目标 {args.qps:g} 次/秒 × {args.duration:g}s")
+    print(format_summary(summary))
+    if server is not None:
+        print(f"桩服务器: {dict(server.stats)}")
+    for route, route_stats in test.analyzer.router.stats().items():
+        # 熔断后的操作会快速失败，错误率高而上游请求数少时先看这里
+        print(f"熔断器 {route}: {route_stats['state']}  熔断 {route_stats['trips']} 次  "
+              f"失败率 {route_stats['failure_rate']:.0%}")
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(metrics.REGISTRY.render())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "summary": summary,
+                       "samples": [asdict(sample) for sample in test.samples]}, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        print(f"❌ 错误率 {summary['error_rate']:.2%} 超过 {args.max_error_rate:.2%}")
+        failed = True
+    p95 = summary["latency"]["p95"]
+    if args.max_p95 is not None and p95 is not None and p95 > args.max_p95:
+        print(f"❌ p95延迟 {p95:.3f}s 超过 {args.max_p95:g}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+热路径指标
+进程内的计数器、仪表和直方图，按方法、模型等标签细分，以Prometheus文本格式输出；
+设置 Config.METRICS_PORT（环境变量 TAROT_METRICS_PORT）后在本机启动 /metrics 端点，
+用于区分变慢的环节是抽牌、提示词构建、网络还是页面渲染
+
+用法：
+    with metrics.DRAW_SECONDS.time(path="shuffle_and_draw"):
+        reading = FOUR_SEASONS.draw()
+    metrics.ERRORS.inc(method="insight", model="gpt-4o-mini", kind="timeout")
+    print(metrics.REGISTRY.render())
+"""
+
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import Config
+
+# 直方图分桶上界（秒 或 token/秒），+Inf 桶自动追加
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 12.0, 20.0, 30.0, 45.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+DRAW_BUCKETS = (0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.001, 0.01)
+TOKEN_RATE_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+
+def _escape(value: str) -> str:
+    """按Prometheus文本格式转义标签值"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """带标签的指标基类，每组标签值一个序列"""
+
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        """
+        Args:
+            name: 指标名，例如 tarot_draw_seconds
+            help_text: 说明文字
+            labelnames: 标签名，记录时必须逐一给出
+        """
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {tuple(labels)}")
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError:
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {tuple(labels)}") from None
+
+    def reset(self):
+        """清空所有序列"""
+        with self._lock:
+            self._series.clear()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """以Prometheus文本格式输出本指标"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+                for key, value in series]
+
+
+class Gauge(Counter):
+    """可任意设置的仪表"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    """分桶直方图：每组标签记录各桶计数、总和与次数"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Args:
+            name: 指标名
+            help_text: 说明文字
+            labelnames: 标签名
+            buckets: 递增的分桶上界，+Inf 桶自动追加
+        """
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _get_series(self, key: Tuple[str, ...]) -> list:
+        """[各桶计数, 总和, 次数]，调用方需持有锁"""
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value: float, **labels):
+        """记录一个观测值"""
+        key = self._key(labels)
+        # bisect_left：等于上界的值计入该桶（Prometheus 的 le 语义）
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._get_series(key)
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def labels(self, **labels) -> "_BoundHistogram":
+        """
+        绑定一组标签值，热路径上反复记录时省去每次处理标签的开销
+
+        Returns:
+            只有 observe(value) 的绑定直方图
+        """
+        key = self._key(labels)
+        with self._lock:
+            return _BoundHistogram(self, self._get_series(key))
+
+    def reset(self):
+        """把所有序列清零（保留序列本身，已绑定的直方图继续有效）"""
+        with self._lock:
+            for series in self._series.values():
+                series[0] = [0] * (len(self.buckets) + 1)
+                series[1] = 0.0
+                series[2] = 0
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """记录 with 代码块的耗时（秒），代码块抛出异常时同样记录"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        """观测次数"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def total(self, **labels) -> float:
+        """观测值总和"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[1] if series else 0.0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count)
+                            in self._series.items())
+        lines = []
+        bounds = self.buckets + (float("inf"),)
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _BoundHistogram:
+    """Histogram.labels 返回的绑定直方图"""
+
+    __slots__ = ("_buckets", "_lock", "_series")
+
+    def __init__(self, histogram: Histogram, series: list):
+        self._buckets = histogram.buckets
+        self._lock = histogram._lock
+        self._series = series
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        series = self._series
+        with self._lock:
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+
+class MetricsRegistry:
+    """指标注册表，负责按名称去重和统一输出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标已存在: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """全部指标的Prometheus文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def reset(self):
+        """清空全部指标的序列（压测分段统计时使用）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+# 进程级注册表和各环节的指标
+REGISTRY = MetricsRegistry()
+
+DRAW_SECONDS = REGISTRY.histogram(
+    "tarot_draw_seconds", "抽取一个牌阵的耗时（path：shuffle_and_draw 或会话随机数流 stream）",
+    ("path",), DRAW_BUCKETS)
+PROMPT_BUILD_SECONDS = REGISTRY.histogram(
+    "tarot_prompt_build_seconds", "整理卡牌信息并构建提示词的耗时", ("method",), FAST_BUCKETS)
+ANALYZER_CALL_SECONDS = REGISTRY.histogram(
+    "tarot_analyzer_call_seconds", "分析器公开方法的耗时（含缓存、排队和回退）", ("call", "engine"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "tarot_request_seconds", "一次AI请求从查缓存到得到结果的耗时（source：cache、upstream 或 fallback）",
+    ("method", "model", "source"))
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "tarot_upstream_seconds", "成功的上游调用耗时（含重试）", ("method", "model"))
+TTFB_SECONDS = REGISTRY.histogram(
+    "tarot_ttfb_seconds", "首字节时间：非流式为收到响应头，流式为收到第一个文本片段", ("method", "model"))
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "tarot_tokens_per_second", "生成速度：流式为 生成token数 / 首个片段之后的耗时，非流式为 生成token数 / 调用耗时",
+    ("method", "model"),
+    TOKEN_RATE_BUCKETS)
+TOKENS = REGISTRY.counter(
+    "tarot_tokens_total", "上游调用的token数（type：prompt、completion、cached）", ("method", "model", "type"))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "tarot_cache_lookups_total", "回复缓存查询次数（result：hit 或 miss）", ("method", "result"))
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "tarot_cache_hit_ratio", "回复缓存命中率（进程启动以来）", ("method",))
+ERRORS = REGISTRY.counter(
+    "tarot_errors_total", "AI请求失败次数（kind：timeout、deadline、circuit_open、provider、network、"
+    "disconnect、parse、unknown）", ("method", "model", "kind"))
+# 抽牌是微秒级的热路径，预先绑定标签
+DRAW_SHUFFLE_SECONDS = DRAW_SECONDS.labels(path="shuffle_and_draw")
+DRAW_STREAM_SECONDS = DRAW_SECONDS.labels(path="stream")
+RENDER_SECONDS = REGISTRY.histogram(
+    "tarot_render_seconds", "Streamlit页面各区域的渲染耗时", ("section",), FAST_BUCKETS)
+SPECULATIONS = REGISTRY.counter(
+    "tarot_speculative_analyses_total", "抽牌后预先开始的分析（outcome：started、ready 点击时已全部完成、"
+    "pending 点击时仍在进行、retried 点击时重新请求了失败的部分、cancelled 重新抽牌或未使用、"
+    "skipped 预先分析线程池已满）", ("outcome",))
+
+
+def timed_call(call: str) -> Callable:
+    """
+    装饰器：把分析器方法的耗时记入 tarot_analyzer_call_seconds，
+    协程方法标记为 engine="async"，普通方法标记为 engine="sync"
+
+    Args:
+        call: 方法名标签
+    """
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with ANALYZER_CALL_SECONDS.time(call=call, engine="async"):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with ANALYZER_CALL_SECONDS.time(call=call, engine="sync"):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache_lookup(method: str, hit: bool):
+    """记录一次回复缓存查询，并更新该方法的命中率"""
+    CACHE_LOOKUPS.inc(method=method, result="hit" if hit else "miss")
+    hits = CACHE_LOOKUPS.value(method=method, result="hit")
+    misses = CACHE_LOOKUPS.value(method=method, result="miss")
+    CACHE_HIT_RATIO.set(hits / (hits + misses), method=method)
+
+
+def record_upstream(method: str, model: str, latency: float, prompt_tokens: int = 0,
+                    completion_tokens: int = 0, cached_tokens: int = 0, ttfb: Optional[float] = None,
+                    streamed: bool = False):
+    """
+    记录一次成功的上游调用
+
+    Args:
+        method: 调用方法
+        model: 实际使用的模型
+        latency: 调用耗时（秒）
+        prompt_tokens: 提示词token数
+        completion_tokens: 生成token数
+        cached_tokens: 命中服务商前缀缓存的token数
+        ttfb: 首字节时间（秒），未知时为None
+        streamed: 是否为流式调用；非流式回复与响应头同时到达，生成速度按整次调用计算
+    """
+    UPSTREAM_SECONDS.observe(latency, method=method, model=model)
+    if ttfb is not None:
+        TTFB_SECONDS.observe(ttfb, method=method, model=model)
+    TOKENS.inc(prompt_tokens, method=method, model=model, type="prompt")
+    TOKENS.inc(completion_tokens, method=method, model=model, type="completion")
+    TOKENS.inc(cached_tokens, method=method, model=model, type="cached")
+    generation = latency - ttfb if streamed and ttfb is not None else latency
+    if completion_tokens and generation > 0:
+        TOKENS_PER_SECOND.observe(completion_tokens / generation, method=method, model=model)
+
+
+def _metrics_handler() -> type:
+    """GET /metrics 的请求处理器；http.server 导入约需30毫秒，只在启动端点时加载"""
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        """GET /metrics 返回注册表的文本格式"""
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 不在控制台逐条输出抓取日志
+            pass
+
+    return _MetricsHandler
+
+
+_server: Optional["ThreadingHTTPServer"] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1",
+                         registry: MetricsRegistry = REGISTRY) -> Optional["ThreadingHTTPServer"]:
+    """
+    在后台线程启动 /metrics 端点，每个进程只启动一次
+
+    Args:
+        port: 监听端口，默认 Config.METRICS_PORT；为None时不启动，为0时随机选择
+        host: 监听地址，默认只允许本机访问
+        registry: 要输出的注册表
+
+    Returns:
+        HTTP服务器（server_address 为实际监听地址）；未启动或端口被占用时返回None
+    """
+    global _server
+    port = Config.METRICS_PORT if port is None else port
+    if port is None:
+        return None
+    with _server_lock:
+        if _server is None:
+            from http.server import ThreadingHTTPServer
+            try:
+                server = ThreadingHTTPServer((host, port), _metrics_handler())
+            except OSError as e:
+                print(f"指标端点启动失败: {host}:{port}: {e}")
+                return None
+            server.daemon_threads = True
+            server.registry = registry
+            threading.Thread(target=server.serve_forever, name="tarot-metrics", daemon=True).start()
+            _server = server
+    return _server
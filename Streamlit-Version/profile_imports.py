@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+冷启动导入耗时分析与回归门禁
+在全新的解释器中逐个导入Web应用和分析器模块，报告导入耗时、最慢的直接依赖，
+并检查 numpy、requests 等较重的依赖没有在导入时被加载（它们应通过 lazy_imports 延迟到首次使用）。
+
+任一模块超过导入预算或提前加载了重依赖时以退出码 1 结束，可作为回归门禁：
+    python profile_imports.py
+    python profile_imports.py --budget-ms 80 --top 10 ai_analyzer
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# 各模块的默认导入预算（毫秒），约为本地测量值的两倍，留出机器差异的余量
+DEFAULT_BUDGETS_MS: Dict[str, float] = {
+    "config": 10,
+    "四季牌阵": 40,
+    "ai_analyzer": 80,
+    "async_analyzer": 120,
+    "streamlit_app": 300,     # 包括 st.set_page_config 校验图标时加载的 streamlit.emojis（约80毫秒）
+}
+
+# 导入目标之前预先加载的模块：Streamlit在执行脚本之前已经导入了streamlit，这部分不计入应用
+PRELOADS: Dict[str, Tuple[str, ...]] = {
+    "streamlit_app": ("streamlit",),
+}
+
+# 不允许在导入时真正加载的重依赖（延迟模块的代理不放入 sys.modules，首次访问属性前不会出现在这里）
+HEAVY_MODULES = ("numpy", "pandas", "requests", "aiohttp", "http.server", "sqlite3")
+
+# 在子进程中执行：预先加载 PRELOADS，计时导入目标，输出耗时和新加载的模块
+_CHILD_SCRIPT = """
+import json, sys, time
+preloads, target = sys.argv[1].split(",") if sys.argv[1] else [], sys.argv[2]
+for name in preloads:
+    __import__(name)
+def loaded():
+    return {name for name, module in list(sys.modules.items()) if module is not None}
+before = loaded()
+started = time.perf_counter()
+__import__(target)
+seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds, "loaded": sorted(loaded() - before)}))
+"""
+
+
+def _parse_importtime(stderr: str, target: str) -> List[Tuple[str, int]]:
+    """
+    从 -X importtime 的输出中取出目标模块的直接依赖及其累计耗时
+
+    Returns:
+        [(模块名, 累计耗时微秒)]，按耗时降序
+    """
+    children: List[Tuple[int, str, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # 表头
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == target:
+                direct = [(child, micros) for child_depth, child, micros in children if child_depth == 1]
+                return sorted(direct, key=lambda item: -item[1])
+            children = []
+        else:
+            children.append((depth, name, int(cumulative)))
+    return []
+
+
+def profile_module(target: str, repeat: int = 5) -> Tuple[float, List[str], List[Tuple[str, int]]]:
+    """
+    在全新的解释器中导入模块 repeat 次，取最短耗时
+
+    Args:
+        target: 模块名
+        repeat: 重复次数
+
+    Returns:
+        (最短导入耗时秒数, 该次导入新加载的模块, 该次导入中各直接依赖的累计耗时)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best: Optional[float] = None
+    loaded: List[str] = []
+    children: List[Tuple[str, int]] = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _CHILD_SCRIPT, ",".join(PRELOADS.get(target, ())), target],
+            cwd=here, capture_output=True, text=True, encoding="utf-8",
+        )
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        if result.returncode != 0 or not lines:
+            raise RuntimeError(f"导入 {target} 失败:\n{result.stderr[-2000:]}")
+        data = json.loads(lines[-1])
+        if best is None or data["seconds"] < best:
+            best = data["seconds"]
+            loaded = data["loaded"]
+            children = _parse_importtime(result.stderr, target)
+    return best, loaded, children
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="冷启动导入耗时分析与回归门禁")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BUDGETS_MS), help="要分析的模块，默认为全部")
+    parser.add_argument("--budget-ms", type=float, default=None, help="统一的导入预算（毫秒），默认按模块分别设定")
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块导入的次数，取最短耗时")
+    parser.add_argument("--top", type=int, default=5, help="列出最慢的几个直接依赖")
+    args = parser.parse_args()
+
+    print("🚀 冷启动导入耗时")
+    print("=" * 40)
+    passed = True
+    for target in args.modules:
+        budget = args.budget_ms if args.budget_ms is not None else DEFAULT_BUDGETS_MS.get(target, 100)
+        try:
+            seconds, loaded, children = profile_module(target, args.repeat)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            passed = False
+            continue
+
+        millis = seconds * 1000
+        status = "✅" if millis <= budget else "❌"
+        preload = f"（已预先导入 {', '.join(PRELOADS[target])}）" if target in PRELOADS else ""
+        print(f"{status} {target:<16} {millis:7.1f} ms  预算 {budget:g} ms{preload}")
+        for child, micros in children[:args.top]:
+            print(f"     {child:<28} {micros / 1000:7.1f} ms")
+        if millis > budget:
+            passed = False
+
+        eager = [name for name in HEAVY_MODULES if name in loaded]
+        if eager:
+            print(f"❌ {target} 在导入时加载了重依赖: {', '.join(eager)}（请改用 lazy_imports.lazy_import）")
+            passed = False
+
+    print("\n" + ("✅ 全部模块在预算之内" if passed else "❌ 存在超出预算的模块"))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
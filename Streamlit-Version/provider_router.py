@@ -0,0 +1,445 @@
+"""
+多服务商路由
+为每个OpenAI兼容的后端（AIHubMix、OpenAI、Claude、Gemini、Deepseek等）维护滚动的延迟分布和熔断器，
+把每次调用发往最快的可用后端；首选后端超过其p95延迟仍未返回时，向第二个后端发送对冲请求，
+取先返回的结果，以降低服务商变慢时的尾延迟
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from config import Config
+from deadline import Deadline, DeadlineExceeded
+from lazy_imports import lazy_import
+
+# 只有协程版本 acall 用到asyncio，同步分析器不必在导入时加载它
+asyncio = lazy_import("asyncio")
+
+
+class ProviderError(Exception):
+    """服务商返回了错误响应"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        """
+        Args:
+            message: 错误说明
+            status: HTTP状态码，不是HTTP错误时为None
+        """
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def client_error(self) -> bool:
+        """
+        4xx（密钥错误、请求参数不被接受等）取决于调用方的请求和凭据，不说明后端故障：
+        不计入熔断器和延迟统计，否则一个会话填错密钥就会让所有会话的请求被熔断
+        """
+        return is_client_error(self.status)
+
+
+def is_client_error(status: Optional[int]) -> bool:
+    """HTTP状态码是否为4xx（调用方的错误）"""
+    return status is not None and 400 <= status < 500
+
+
+@dataclass(frozen=True)
+class Provider:
+    """
+    一个OpenAI兼容的后端
+
+    base_url、api_key、model 为None时在调用时从传入的配置（会话快照或 Config 类）读取默认值，
+    因此同一个路由器可以同时服务使用不同密钥和模型的会话。
+
+    stream_usage 表示后端支持 stream_options.include_usage（流式响应的最后一个事件携带 usage）。
+    不认识该字段的OpenAI兼容后端会返回400，因此只对确认支持的后端开启。
+    """
+    name: str
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    api_key_env: Optional[str] = None    # 从该环境变量读取密钥
+    model: Optional[str] = None
+    stream_usage: bool = False
+
+    def resolved_base_url(self, config=Config) -> str:
+        return (self.base_url or config.API_BASE_URL).rstrip("/")
+
+    def resolved_api_key(self, config=Config) -> Optional[str]:
+        if self.api_key:
+            return self.api_key
+        if self.api_key_env:
+            return os.getenv(self.api_key_env)
+        return config.API_KEY if self.base_url is None else None
+
+    def resolved_model(self, config=Config) -> str:
+        return self.model or config.DEFAULT_MODEL
+
+    def is_configured(self, config=Config) -> bool:
+        key = self.resolved_api_key(config)
+        return key is not None and key.strip() != ""
+
+    def headers(self, config=Config) -> Dict[str, str]:
+        """API请求头"""
+        return {
+            "Authorization": f"Bearer {self.resolved_api_key(config)}",
+            "Content-Type": "application/json"
+        }
+
+
+class LatencyProfile:
+    """单个后端（按调用方法区分）的滚动延迟样本"""
+
+    def __init__(self, max_samples: int):
+        self.latencies: Deque[float] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        """记录一次成功调用的耗时"""
+        with self._lock:
+            self.latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """延迟的 q 分位数，没有样本时返回None"""
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ProviderRouter:
+    """
+    延迟感知的服务商路由器
+
+    每个 (服务商, 调用方法) 有一个熔断器：熔断中的后端不参与路由，全部熔断时立即抛出 CircuitOpenError。
+    只有5xx、超时和网络错误计为后端失败，4xx（ProviderError.client_error）不计入。
+
+    用法：
+        router = ProviderRouter([Provider("aihubmix"), Provider("deepseek", "https://api.deepseek.com/v1", ...)])
+        content = router.call(lambda provider: send(provider, data), kind="insight")
+    """
+
+    def __init__(self, providers: List[Provider], hedging: bool = None):
+        """
+        Args:
+            providers: 候选后端，顺序作为没有延迟数据时的优先级
+            hedging: 是否启用对冲请求，默认 Config.HEDGE_ENABLED
+        """
+        if not providers:
+            raise ValueError("至少需要一个服务商")
+        self.providers = list(providers)
+        self.hedging = Config.HEDGE_ENABLED if hedging is None else hedging
+        self.hedged = 0
+        self._profiles: Dict[Tuple[str, str], LatencyProfile] = {}
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def profile(self, provider: Provider, kind: str) -> LatencyProfile:
+        """获取 (服务商, 调用方法) 的延迟分布；不同方法的生成长度差别很大，分别统计"""
+        key = (provider.name, kind)
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = self._profiles[key] = LatencyProfile(Config.ROUTER_MAX_SAMPLES)
+            return profile
+
+    def breaker(self, provider: Provider, kind: str) -> CircuitBreaker:
+        """获取 (服务商, 调用方法) 的熔断器，慢调用阈值按方法取 Config.BREAKER_SLOW_CALL_SECONDS"""
+        key = (provider.name, kind)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                thresholds = Config.BREAKER_SLOW_CALL_SECONDS
+                breaker = self._breakers[key] = CircuitBreaker(
+                    slow_call_seconds=thresholds.get(kind, thresholds["default"])
+                )
+            return breaker
+
+    def rank(self, kind: str = "default", config=Config) -> List[Provider]:
+        """
+        按优先级排列可用的后端：正常状态下有延迟数据的按中位延迟升序排在最前，
+        尚无数据的按配置顺序其次（通过对冲和故障转移获得样本），半开试探中的排在最后；熔断中的不参与
+
+        Args:
+            kind: 调用方法
+            config: 调用方的配置（会话快照或 Config 类），决定默认服务商是否已配置密钥
+
+        Returns:
+            排好序的后端列表；全部未配置密钥或全部熔断时为空
+        """
+        candidates = [provider for provider in self.providers
+                      if provider.is_configured(config) and self.breaker(provider, kind).available()]
+
+        def _key(item: Tuple[int, Provider]):
+            index, provider = item
+            if self.breaker(provider, kind).state != CircuitBreaker.CLOSED:
+                return (2, 0.0, index)
+            median = self.profile(provider, kind).percentile(0.5)
+            return (0, median, index) if median is not None else (1, 0.0, index)
+
+        return [provider for _, provider in sorted(enumerate(candidates), key=_key)]
+
+    def _ranked_or_raise(self, kind: str, config=Config) -> List[Provider]:
+        """rank 的结果为空时抛出说明原因的异常"""
+        ranked = self.rank(kind, config)
+        if ranked:
+            return ranked
+        if not any(provider.is_configured(config) for provider in self.providers):
+            raise ProviderError("没有已配置密钥的服务商")
+        raise CircuitOpenError("所有服务商均已熔断，稍后自动重试")
+
+    def pick(self, kind: str = "default", config=Config) -> Optional[Provider]:
+        """
+        为不做对冲的请求（流式请求）选出一个后端并占用其熔断器名额
+
+        Args:
+            kind: 调用方法
+            config: 调用方的配置，参见 rank
+
+        Returns:
+            选中的后端，调用结束后必须调用 record 或 release；没有可用后端时为None
+        """
+        for provider in self.rank(kind, config):
+            if self.breaker(provider, kind).try_acquire():
+                return provider
+        return None
+
+    def hedge_delay(self, provider: Provider, kind: str) -> float:
+        """首选后端超过这个时间仍未返回时发送对冲请求：样本足够时为p95延迟，否则为默认值"""
+        profile = self.profile(provider, kind)
+        if len(profile.latencies) < Config.ROUTER_MIN_SAMPLES:
+            return Config.HEDGE_DEFAULT_DELAY
+        return profile.percentile(0.95)
+
+    def record(self, provider: Provider, kind: str, latency: Optional[float], ok: bool):
+        """记录一次调用结果（流式请求等由调用方自行计时的场景）；latency 为None时只计成败"""
+        if ok and latency is not None:
+            self.profile(provider, kind).record(latency)
+        self.breaker(provider, kind).record(ok, latency)
+
+    def release(self, provider: Provider, kind: str):
+        """pick 选中的请求没有得出结论（调用方提前停止、总时限已到），归还熔断器名额"""
+        self.breaker(provider, kind).release()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=Config.ROUTER_WORKERS, thread_name_prefix="tarot-router"
+                    )
+        return self._executor
+
+    def _attempt(self, provider: Provider, kind: str, fn: Callable[[Provider], Any]) -> Any:
+        """经熔断器调用一次后端并记录延迟和结果"""
+        if not self.breaker(provider, kind).try_acquire():
+            raise CircuitOpenError(f"{provider.name} 已熔断")
+        started = time.perf_counter()
+        try:
+            result = fn(provider)
+        except DeadlineExceeded:
+            # 总时限已到不说明后端有问题，不计入熔断器
+            self.release(provider, kind)
+            raise
+        except ProviderError as e:
+            if e.client_error:
+                self.release(provider, kind)
+            else:
+                self.record(provider, kind, None, False)
+            raise
+        except Exception:
+            self.record(provider, kind, None, False)
+            raise
+        self.record(provider, kind, time.perf_counter() - started, True)
+        return result
+
+    def call(self, fn: Callable[[Provider], Any], kind: str = "default",
+             deadline: Optional[Deadline] = None, config=Config) -> Any:
+        """
+        把调用发往最快的可用后端：超过其p95延迟未返回时向下一个后端对冲，失败时依次故障转移
+
+        被放弃的对冲请求和超过总时限的请求会在后台跑完，其延迟和结果仍计入统计。
+
+        Args:
+            fn: 向指定后端发送请求的函数，失败时抛出异常
+            kind: 调用方法，用于区分延迟分布和熔断器
+            deadline: 总时限，到期时不再等待并抛出 DeadlineExceeded
+            config: 调用方的配置，参见 rank
+
+        Returns:
+            第一个成功返回的结果；全部失败时抛出最后一个异常，全部熔断时抛出 CircuitOpenError
+        """
+        if deadline is not None:
+            deadline.timeout()
+        ranked = self._ranked_or_raise(kind, config)
+        can_hedge = self.hedging and len(ranked) > 1
+        if not can_hedge and deadline is None:
+            return self._call_in_order(ranked, kind, fn)
+
+        executor = self._get_executor()
+        candidates = iter(ranked)
+        pending: Dict[Any, Provider] = {}
+        last_error: Optional[BaseException] = None
+
+        def _launch() -> bool:
+            provider = next(candidates, None)
+            if provider is None:
+                return False
+            pending[executor.submit(self._attempt, provider, kind, fn)] = provider
+            return True
+
+        _launch()
+        hedge_at = time.monotonic() + self.hedge_delay(ranked[0], kind)
+        while pending:
+            waits = []
+            if can_hedge:
+                waits.append(max(0.0, hedge_at - time.monotonic()))
+            if deadline is not None:
+                waits.append(deadline.remaining())
+            done, _ = wait(pending, timeout=min(waits) if waits else None, return_when=FIRST_COMPLETED)
+            if not done:
+                if deadline is not None and deadline.expired():
+                    # 总时限已到：不再等待，进行中的请求在后台跑完
+                    deadline.timeout()
+                # 首选后端超过p95仍未返回：发送对冲请求，两个请求谁先返回用谁
+                can_hedge = False
+                if _launch():
+                    self.hedged += 1
+                continue
+            for future in done:
+                pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+            if not pending:
+                # 进行中的请求都失败了：转移到下一个后端
+                can_hedge = False
+                _launch()
+        raise last_error
+
+    def _call_in_order(self, ranked: List[Provider], kind: str, fn: Callable[[Provider], Any]) -> Any:
+        """不对冲，在当前线程中依次尝试各后端"""
+        last_error: Optional[BaseException] = None
+        for provider in ranked:
+            try:
+                return self._attempt(provider, kind, fn)
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    async def acall(self, fn: Callable[[Provider], Awaitable[Any]], kind: str = "default",
+                    config=Config) -> Any:
+        """call 的协程版本，fn 为协程函数；总时限由调用方用 asyncio.wait_for 控制"""
+        ranked = self._ranked_or_raise(kind, config)
+
+        async def _attempt(provider: Provider) -> Any:
+            if not self.breaker(provider, kind).try_acquire():
+                raise CircuitOpenError(f"{provider.name} 已熔断")
+            started = time.perf_counter()
+            try:
+                result = await fn(provider)
+            except (DeadlineExceeded, asyncio.CancelledError):
+                # 超过总时限或作为落后的对冲请求被取消，不计入熔断器
+                self.release(provider, kind)
+                raise
+            except ProviderError as e:
+                if e.client_error:
+                    self.release(provider, kind)
+                else:
+                    self.record(provider, kind, None, False)
+                raise
+            except Exception:
+                self.record(provider, kind, None, False)
+                raise
+            self.record(provider, kind, time.perf_counter() - started, True)
+            return result
+
+        candidates = iter(ranked)
+        pending = set()
+        last_error: Optional[BaseException] = None
+
+        def _launch() -> bool:
+            provider = next(candidates, None)
+            if provider is None:
+                return False
+            pending.add(asyncio.ensure_future(_attempt(provider)))
+            return True
+
+        _launch()
+        hedge_at = time.monotonic() + self.hedge_delay(ranked[0], kind)
+        can_hedge = self.hedging and len(ranked) > 1
+        try:
+            while pending:
+                timeout = max(0.0, hedge_at - time.monotonic()) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    can_hedge = False
+                    if _launch():
+                        self.hedged += 1
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        last_error = e
+                if not pending:
+                    can_hedge = False
+                    _launch()
+        finally:
+            # 协程中可以直接取消落后的请求
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各 服务商/调用方法 的p50、p95延迟和熔断器状态"""
+        with self._lock:
+            keys = set(self._profiles) | set(self._breakers)
+        result = {}
+        for name, kind in sorted(keys):
+            provider = next(provider for provider in self.providers if provider.name == name)
+            profile = self.profile(provider, kind)
+            result[f"{name}/{kind}"] = {
+                "p50": profile.percentile(0.5),
+                "p95": profile.percentile(0.95),
+                "samples": len(profile.latencies),
+                **self.breaker(provider, kind).stats(),
+            }
+        return result
+
+
+def providers_from_config() -> List[Provider]:
+    """默认服务商（API_BASE_URL + API_KEY + DEFAULT_MODEL）加上 Config.PROVIDERS 中的其他服务商"""
+    providers = [Provider(name="aihubmix", stream_usage=True)]
+    for entry in Config.PROVIDERS:
+        providers.append(Provider(
+            name=entry["name"],
+            base_url=entry["base_url"],
+            api_key=entry.get("api_key"),
+            api_key_env=entry.get("api_key_env"),
+            model=entry.get("model"),
+            stream_usage=bool(entry.get("stream_usage", False)),
+        ))
+    return providers
+
+
+_default_router: Optional[ProviderRouter] = None
+_default_lock = threading.Lock()
+
+
+def get_provider_router() -> ProviderRouter:
+    """获取进程级共享的路由器，延迟统计在所有会话间共享"""
+    global _default_router
+    if _default_router is None:
+        with _default_lock:
+            if _default_router is None:
+                _default_router = ProviderRouter(providers_from_config())
+    return _default_router
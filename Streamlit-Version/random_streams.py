@@ -0,0 +1,185 @@
+"""
+四季牌阵随机数流管理
+为每个会话或工作线程派生统计独立、可复现的随机数流，替代模块全局的 random 状态
+"""
+
+import hashlib
+import itertools
+import secrets
+import threading
+import time
+import random
+import weakref
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import metrics
+from 四季牌阵 import Card, FOUR_SEASONS
+
+
+class ReadingTicket(NamedTuple):
+    """
+    一次抽牌的凭证：随机数流标识 + 该流中的抽牌序号，配合根种子即可复现牌阵
+
+    seed_id 是根种子的指纹（不泄露根种子），用于在日志中找到对应的根种子，
+    并防止用错误的根种子复现出一个看似正常的牌阵
+    """
+    stream_id: str
+    index: int
+    seed_id: str = ""
+
+    def __str__(self) -> str:
+        text = f"{self.stream_id}#{self.index}"
+        return f"{text}@{self.seed_id}" if self.seed_id else text
+
+    @classmethod
+    def parse(cls, text: str) -> "ReadingTicket":
+        """从 str(ticket) 的格式解析凭证，兼容不带根种子指纹的旧格式"""
+        body, sep, seed_id = text.rpartition("@")
+        if not sep:
+            body, seed_id = text, ""
+        stream_id, sep, index = body.rpartition("#")
+        if not sep or not stream_id or not index.isdigit():
+            raise ValueError(f"无效的抽牌凭证: {text}")
+        return cls(stream_id, int(index), seed_id)
+
+
+class RandomStream:
+    """
+    单个会话或线程独占的随机数流。
+    每次抽牌都从 (根种子, 流标识, 序号) 派生一个独立的生成器，
+    因此任意一次抽牌都可以单独复现，而不需要重放之前的抽牌。
+    """
+
+    def __init__(self, manager: "RandomStreamManager", stream_id: str):
+        self.manager = manager
+        self.stream_id = stream_id
+        self._counter = itertools.count()  # CPython中 next() 是原子操作
+
+    def next_rng(self) -> Tuple[ReadingTicket, random.Random]:
+        """获取下一次抽牌使用的生成器及其凭证"""
+        ticket = ReadingTicket(self.stream_id, next(self._counter), self.manager.seed_id)
+        return ticket, self.manager.rng_for(ticket)
+
+    def draw(self, plan=FOUR_SEASONS) -> Tuple[Dict[int, Card], ReadingTicket]:
+        """
+        从本流抽取一个牌阵
+
+        Args:
+            plan: 要抽取的牌阵，默认为四季牌阵
+
+        Returns:
+            (牌阵字典, 抽牌凭证)
+        """
+        ticket, rng = self.next_rng()
+        started = time.perf_counter()
+        reading = plan.draw(rng)
+        metrics.DRAW_STREAM_SECONDS.observe(time.perf_counter() - started)
+        return reading, ticket
+
+
+class RandomStreamManager:
+    """
+    随机数流管理器，类似 numpy.random.SeedSequence.spawn：
+    从一个根种子为每个流标识派生互不相关的子种子（SHA-256），各流之间没有共享状态。
+    只要记录根种子，就可以用抽牌凭证复现任意一次线上抽牌。
+
+    管理器只以弱引用登记随机数流：流由调用方持有（例如保存在Streamlit会话状态中），
+    调用方不再引用后自动释放，进程中的会话和线程再多也不会累积。
+    """
+
+    def __init__(self, root_seed: Optional[int] = None):
+        """
+        Args:
+            root_seed: 根种子，为None时使用128位系统随机数（请记录 root_seed 以便复现）
+        """
+        self.root_seed = secrets.randbits(128) if root_seed is None else int(root_seed)
+        self.seed_id = hashlib.sha256(f"seed/{self.root_seed}".encode("utf-8")).hexdigest()[:8]
+        self._streams: "weakref.WeakValueDictionary[str, RandomStream]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def derive_seed(self, stream_id: str, index: int) -> int:
+        """派生 (流标识, 序号) 对应的256位子种子"""
+        material = f"{self.root_seed}/{stream_id}/{index}".encode("utf-8")
+        return int.from_bytes(hashlib.sha256(material).digest(), "big")
+
+    def rng_for(self, ticket: ReadingTicket) -> random.Random:
+        """获取凭证对应的生成器"""
+        return random.Random(self.derive_seed(ticket.stream_id, ticket.index))
+
+    def stream(self, stream_id: str) -> RandomStream:
+        """
+        获取（或创建）指定标识的随机数流，例如每个Streamlit会话一个
+
+        调用方需要一直持有返回的流：所有引用都被释放后，同一标识会得到从序号0开始的新流，
+        重复的凭证会抽出与之前相同的牌阵
+
+        Args:
+            stream_id: 流标识，不能包含 "#" 和 "@"
+        """
+        if "#" in stream_id or "@" in stream_id:
+            raise ValueError("随机数流标识不能包含 '#' 或 '@'")
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                stream = self._streams[stream_id] = RandomStream(self, stream_id)
+        return stream
+
+    def release(self, stream_id: str):
+        """提前释放随机数流（调用方不再引用时也会自动释放）"""
+        with self._lock:
+            self._streams.pop(stream_id, None)
+
+    def for_current_thread(self) -> RandomStream:
+        """获取当前线程独占的随机数流，适用于线程池中的工作线程"""
+        stream = getattr(self._local, "stream", None)
+        if stream is None:
+            stream_id = f"thread-{threading.get_ident()}-{secrets.token_hex(4)}"
+            stream = self._local.stream = self.stream(stream_id)
+        return stream
+
+    def numpy_generator(self, stream_id: str, index: int = 0):
+        """为批量抽牌派生独立的 numpy.random.Generator"""
+        import numpy as np
+
+        return np.random.default_rng(self.derive_seed(stream_id, index))
+
+    def replay(self, ticket, plan=FOUR_SEASONS) -> Dict[int, Card]:
+        """
+        复现一次抽牌
+
+        Args:
+            ticket: ReadingTicket 或其字符串形式
+            plan: 抽牌时使用的牌阵
+
+        Returns:
+            与当时完全相同的牌阵字典；凭证的根种子指纹与本管理器不符时抛出 ValueError
+        """
+        if isinstance(ticket, str):
+            ticket = ReadingTicket.parse(ticket)
+        if ticket.seed_id and ticket.seed_id != self.seed_id:
+            raise ValueError(f"抽牌凭证来自根种子 {ticket.seed_id}，与当前根种子 {self.seed_id} 不符")
+        return plan.draw(self.rng_for(ticket))
+
+
+_default_manager: Optional[RandomStreamManager] = None
+_default_lock = threading.Lock()
+
+
+def get_stream_manager() -> RandomStreamManager:
+    """
+    获取进程级的随机数流管理器，根种子来自 Config.RNG_ROOT_SEED
+
+    创建时输出一次根种子及其指纹：未设置 TAROT_RNG_SEED 时这是复现本进程抽牌的唯一记录
+    """
+    global _default_manager
+    if _default_manager is None:
+        from config import Config
+
+        with _default_lock:
+            if _default_manager is None:
+                manager = RandomStreamManager(Config.RNG_ROOT_SEED)
+                print(f"抽牌根种子: {manager.root_seed}（指纹 {manager.seed_id}），"
+                      f"复现凭证以 @{manager.seed_id} 结尾的抽牌时设置 TAROT_RNG_SEED={manager.root_seed}")
+                _default_manager = manager
+    return _default_manager
@@ -0,0 +1,162 @@
+"""
+AI回复缓存
+按 模型 + 提示词哈希 + 温度 + max_tokens 缓存LLM回复，内存LRU淘汰、逐条TTL过期，
+可选SQLite持久化，使进程重启后缓存仍然有效
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from lazy_imports import lazy_import
+
+# 只有配置了持久化路径时才用到SQLite
+sqlite3 = lazy_import("sqlite3")
+
+
+def make_cache_key(model: str, messages: Any, temperature: float, max_tokens: int,
+                   **extra: Any) -> str:
+    """
+    生成缓存键
+
+    Args:
+        model: 模型名称
+        messages: 发送给模型的完整消息（系统提示词 + 用户提示词）
+        temperature: 采样温度
+        max_tokens: 最大token数量
+        **extra: 其他会影响回复的请求参数（如 response_format）
+
+    Returns:
+        SHA-256十六进制字符串
+    """
+    material = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature,
+         "max_tokens": max_tokens, **extra},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """线程安全的LRU + TTL缓存，可选SQLite持久化"""
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 3600,
+                 sqlite_path: Optional[str] = None):
+        """
+        Args:
+            max_entries: 内存中最多保留的条目数，超出后淘汰最久未使用的条目
+            default_ttl: 默认过期时间（秒）
+            sqlite_path: SQLite数据库路径，为None时只使用内存
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional["sqlite3.Connection"] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """获取未过期的缓存值，不存在时返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row is not None:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 本条目的过期时间（秒），默认 default_ttl
+        """
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._db.commit()
+
+    def _store(self, key: str, value: str, expires_at: float):
+        """写入内存并按LRU淘汰，调用方需持有锁"""
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存（包括SQLite）并重置计数"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM response_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中次数、未命中次数、命中率和内存条目数"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程级共享缓存，Config.CACHE_ENABLED 为False时返回None"""
+    global _default_cache
+    from config import Config
+
+    if not Config.CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = ResponseCache(
+                    max_entries=Config.CACHE_MAX_ENTRIES,
+                    default_ttl=Config.CACHE_TTL_ANALYSIS,
+                    sqlite_path=Config.CACHE_SQLITE_PATH,
+                )
+    return _default_cache
@@ -0,0 +1,268 @@
+"""
+进行中请求合并（single-flight）
+多个会话同时发出完全相同的请求（相同卡牌、相同方法、相同模型）时，
+只向上游发送一次，所有等待者共享同一个结果；流式请求中后加入的等待者会先补齐已生成的片段
+"""
+
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from lazy_imports import lazy_import
+
+# 只有 AsyncSingleFlight 用到asyncio，推迟到第一次使用时加载
+asyncio = lazy_import("asyncio")
+
+
+class _Call:
+    """一次进行中的普通请求"""
+
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _StreamCall:
+    """一次进行中的流式请求：后台线程拉取上游片段，所有订阅者从共享缓冲区读取"""
+
+    def __init__(self, source: Callable[[], Iterator[str]], on_done: Callable[[], None]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = threading.Condition()
+        self._on_done = on_done
+        self._thread = threading.Thread(target=self._pump, args=(source,), name="tarot-single-flight", daemon=True)
+        self._thread.start()
+
+    def _pump(self, source: Callable[[], Iterator[str]]):
+        """在后台线程中读取上游，即使所有订阅者提前离开也读完，以便结果写入缓存"""
+        try:
+            for chunk in source():
+                with self._changed:
+                    self.chunks.append(chunk)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._on_done()
+            with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def subscribe(self, timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        从第一个片段开始产生全部片段，上游失败时抛出相同的异常
+
+        Args:
+            timeout: 订阅者最多跟随多少秒，超过时抛出 TimeoutError（上游继续在后台读完）
+        """
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        index = 0
+        while True:
+            with self._changed:
+                remaining = None if expires_at is None else max(0.0, expires_at - time.monotonic())
+                if not self._changed.wait_for(lambda: index < len(self.chunks) or self.done, remaining):
+                    raise TimeoutError("等待进行中的相同流式请求超时")
+                pending = self.chunks[index:]
+                finished = self.done
+            yield from pending
+            index += len(pending)
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    线程安全的请求合并
+
+    用法：
+        flight = SingleFlight()
+        content = flight.do(key, lambda: send_request(data))
+        for chunk in flight.stream(key, lambda: stream_request(data)): ...
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.shared = 0
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _StreamCall] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        执行 fn 并返回结果；相同 key 已有调用进行中时，等待并共享其结果
+
+        Args:
+            key: 请求键（通常为 make_cache_key 的结果）
+            fn: 实际发送请求的函数
+            timeout: 等待者最多等待多少秒，超过时抛出 TimeoutError；不限制 fn 本身
+
+        Returns:
+            fn 的返回值；fn 抛出的异常会传给所有等待者
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            if not call.finished.wait(timeout):
+                raise TimeoutError("等待进行中的相同请求超时")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.finished.set()
+        return call.result
+
+    def stream(self, key: str, source: Callable[[], Iterator[str]],
+               timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        订阅流式请求；相同 key 已有流进行中时，先补齐已生成的片段再跟随后续片段
+
+        Args:
+            key: 请求键
+            source: 返回上游片段迭代器的函数，只在没有进行中的流时调用
+            timeout: 订阅者最多跟随多少秒，超过时抛出 TimeoutError
+
+        Returns:
+            片段迭代器
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            if call is None:
+                call = self._streams[key] = _StreamCall(source, lambda: self._release_stream(key))
+                self.executed += 1
+            else:
+                self.shared += 1
+        return call.subscribe(timeout)
+
+    def _release_stream(self, key: str):
+        with self._lock:
+            self._streams.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """返回实际发出的上游请求数、被合并的请求数和当前进行中的请求数"""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls) + len(self._streams),
+            }
+
+
+class _AsyncStreamCall:
+    """_StreamCall 的协程版本：由一个任务拉取上游片段"""
+
+    def __init__(self, source: Callable[[], AsyncIterator[str]], on_done: Callable[[], None]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in source():
+                async with self._changed:
+                    self.chunks.append(chunk)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._on_done()
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                pending = self.chunks[index:]
+                finished = self.done
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight 的协程版本，只能在一个事件循环中使用
+
+    上游请求在独立任务中执行，单个等待者被取消不会影响其他等待者。
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.shared = 0
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _AsyncStreamCall] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行协程函数 fn 并返回结果；相同 key 已有调用进行中时共享其结果"""
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.executed += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stream(self, key: str, source: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """订阅流式请求，参见 SingleFlight.stream"""
+        call = self._streams.get(key)
+        if call is None:
+            call = self._streams[key] = _AsyncStreamCall(source, lambda: self._streams.pop(key, None))
+            self.executed += 1
+        else:
+            self.shared += 1
+        return call.subscribe()
+
+    def stats(self) -> Dict[str, int]:
+        """参见 SingleFlight.stats"""
+        return {
+            "executed": self.executed,
+            "shared": self.shared,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
+
+
+_default_flight: Optional[SingleFlight] = None
+_default_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """获取进程级共享的请求合并器，Config.SINGLE_FLIGHT_ENABLED 为False时返回None"""
+    global _default_flight
+    from config import Config
+
+    if not Config.SINGLE_FLIGHT_ENABLED:
+        return None
+    if _default_flight is None:
+        with _default_lock:
+            if _default_flight is None:
+                _default_flight = SingleFlight()
+    return _default_flight
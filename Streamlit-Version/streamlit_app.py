@@ -4,16 +4,18 @@
 """
 
 import streamlit as st
-import pandas as pd
 from datetime import datetime
+import html
 import time
+import uuid
 from typing import Dict, Optional
-import asyncio
-import threading
 
-from config import Config
-from ai_analyzer import TarotAIAnalyzer
-from 四季牌阵 import shuffle_and_draw, Card
+import metrics
+from config import get_config_store
+from ai_analyzer import SpeculativeAnalysis, TarotAIAnalyzer
+from deadline import Deadline, new_reading_deadline
+from random_streams import get_stream_manager
+from 四季牌阵 import Card, FOUR_SEASONS
 
 # 页面配置
 st.set_page_config(
@@ -35,6 +37,26 @@ st.markdown("""
         margin-bottom: 2rem;
     }
     
+    .card-grid {
+        display: grid;
+        gap: 1rem;
+        margin: 1rem 0;
+    }
+    
+    .card-grid .card-container {
+        margin: 0;
+    }
+    
+    @media (max-width: 640px) {
+        .card-grid {
+            grid-template-columns: 1fr !important;
+        }
+        
+        .card-grid .card-gap {
+            display: none;
+        }
+    }
+    
     .card-container {
         background: #f8f9fa;
         padding: 1.5rem;
@@ -133,35 +155,57 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# 片段（fragment）内的按钮只重新运行该片段，标题、侧边栏和上面的样式不会重新发送；
+# 旧版Streamlit没有片段时退化为普通函数，每次交互重新运行整个页面
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
 class StreamlitTarotApp:
     """Streamlit四季牌阵应用程序类"""
     
     def __init__(self):
         """初始化应用程序"""
-        self.analyzer = TarotAIAnalyzer()
+        self.plan = FOUR_SEASONS
         self.initialize_session_state()
+        # 每个会话使用自己的不可变配置快照：进程级配置（配置文件修改后自动重新加载）+ 本会话在侧边栏保存的设置
+        store = get_config_store()
+        store.reload_if_changed()
+        self.config = store.session(st.session_state.config_overrides)
+        st.session_state.api_configured = self.config.is_configured()
+        self.analyzer = TarotAIAnalyzer(self.plan, config=self.config)
+        self.analyzer.warm_up()  # 后台预热连接池，每个进程只执行一次
+        metrics.start_metrics_server()  # 设置 TAROT_METRICS_PORT 时启动指标端点，每个进程只启动一次
     
     def initialize_session_state(self):
         """初始化会话状态"""
         if 'current_reading' not in st.session_state:
             st.session_state.current_reading = None
-        if 'api_configured' not in st.session_state:
-            st.session_state.api_configured = Config.is_configured()
+        if 'config_overrides' not in st.session_state:
+            # 本会话在侧边栏保存的配置项（API_KEY、DEFAULT_MODEL），只影响本会话
+            st.session_state.config_overrides = {}
         if 'analysis_results' not in st.session_state:
             st.session_state.analysis_results = None
+        if 'rng_stream' not in st.session_state:
+            # 每个会话使用独立的随机数流，互不干扰且可复现；流由会话持有，会话结束后随之释放
+            st.session_state.rng_stream = get_stream_manager().stream(uuid.uuid4().hex)
+        if 'reading_ticket' not in st.session_state:
+            st.session_state.reading_ticket = None
+        if 'drawn_at' not in st.session_state:
+            st.session_state.drawn_at = None
+        if 'draw_error' not in st.session_state:
+            st.session_state.draw_error = None
+        if 'ceremony_pending' not in st.session_state:
+            # 刚抽完牌、仪式动画尚未播放
+            st.session_state.ceremony_pending = False
+        if 'config_saved' not in st.session_state:
+            # 侧边栏「保存配置」的结果：None 未保存，True 成功，False 密钥为空
+            st.session_state.config_saved = None
+        if 'speculation' not in st.session_state:
+            # 抽牌后在后台进行中的预先分析（SpeculativeAnalysis）
+            st.session_state.speculation = None
     
-    def safe_rerun(self):
-        """安全的重新运行方法，兼容不同版本的Streamlit"""
-        try:
-            if hasattr(st, 'experimental_rerun'):
-                st.experimental_rerun()
-            elif hasattr(st, 'rerun'):
-                st.rerun()
-            else:
-                # 如果都不可用，使用query params触发重新加载
-                st.experimental_set_query_params(refresh=str(time.time()))
-        except Exception as e:
-            st.warning(f"页面刷新失败，请手动刷新浏览器: {e}")
+    def ceremony_enabled(self) -> bool:
+        """是否开启抽牌仪式感（侧边栏开关，默认取 Config.CEREMONY_ENABLED）"""
+        return st.session_state.get('ceremony', self.config.CEREMONY_ENABLED)
     
     def render_header(self):
         """渲染页面标题"""
@@ -184,29 +228,43 @@ class StreamlitTarotApp:
         
         # API配置区域
         with st.sidebar.expander("🔑 API配置", expanded=not st.session_state.api_configured):
-            api_key = st.text_input(
+            st.text_input(
                 "aihubmix API密钥",
                 type="password",
+                key="api_key_input",
                 help="请输入您的aihubmix API密钥"
             )
             
-            model = st.selectbox(
+            st.selectbox(
                 "AI模型选择",
                 options=["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo-preview"],
                 index=0,
+                key="model_input",
                 help="选择用于分析的AI模型"
             )
             
-            if st.button("💾 保存配置"):
-                if api_key:
-                    Config.set_api_key(api_key)
-                    Config.DEFAULT_MODEL = model
-                    st.session_state.api_configured = True
-                    st.sidebar.success("配置保存成功！")
-                    time.sleep(0.5)  # 让用户看到成功消息
-                    self.safe_rerun()
-                else:
-                    st.sidebar.error("请输入有效的API密钥")
+            # 回调在本次运行之前保存配置，页面直接以新配置渲染，无需再次重新运行
+            st.button("💾 保存配置", on_click=self.save_config)
+            saved = st.session_state.config_saved
+            st.session_state.config_saved = None
+            if saved:
+                st.sidebar.success("配置保存成功！")
+            elif saved is False:
+                st.sidebar.error("请输入有效的API密钥")
+        
+        st.sidebar.checkbox(
+            "⚡ 抽牌后立即开始AI分析",
+            value=self.config.SPECULATIVE_ANALYSIS,
+            key="speculative_analysis",
+            help="抽牌完成后在后台预先分析，点击「AI智能分析」时几乎无需等待；未点击分析时也会消耗API额度"
+        )
+        
+        st.sidebar.checkbox(
+            "✨ 抽牌仪式感",
+            value=self.config.CEREMONY_ENABLED,
+            key="ceremony",
+            help="抽牌后短暂停顿并播放气球动画；关闭时立即显示牌阵"
+        )
         
         # 使用说明
         with st.sidebar.expander("📖 使用说明"):
@@ -229,6 +287,19 @@ class StreamlitTarotApp:
             - 5号位：灵性成长（大阿尔卡纳）
             """)
     
+    def save_config(self):
+        """「保存配置」按钮的回调：把密钥和模型写入本会话的配置覆盖项"""
+        api_key = st.session_state.api_key_input
+        if not api_key:
+            st.session_state.config_saved = False
+            return
+        st.session_state.config_overrides = {
+            **st.session_state.config_overrides,
+            "API_KEY": api_key,
+            "DEFAULT_MODEL": st.session_state.model_input,
+        }
+        st.session_state.config_saved = True
+    
     def render_card_layout(self):
         """渲染牌阵布局"""
         st.subheader("🎴 四季牌阵")
@@ -243,108 +314,63 @@ class StreamlitTarotApp:
     
     def render_empty_layout(self):
         """渲染空牌阵布局"""
-        st.markdown("### 💫 你的四季牌阵正在等待...")
-        
-        # 使用列布局创建十字形排列
-        col1, col2, col3 = st.columns([1, 1, 1])
-        
-        # 上排（4号位置）
-        with col2:
-            st.markdown("""
-            <div class="card-container">
-                <div class="card-position">4号位置 (事业财务)</div>
-                <div class="card-name card-empty">📊 待揭示</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # 中排（1、5、3号位置）
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col1:
-            st.markdown("""
-            <div class="card-container">
-                <div class="card-position">1号位置 (行动力)</div>
-                <div class="card-name card-empty">⚡ 待揭示</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown("""
-            <div class="card-container">
-                <div class="card-position">5号位置 (灵性成长)</div>
-                <div class="card-name card-empty">✨ 核心奥秘</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown("""
-            <div class="card-container">
-                <div class="card-position">3号位置 (理性思维)</div>
-                <div class="card-name card-empty">🧠 待揭示</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # 下排（2号位置）
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col2:
-            st.markdown("""
-            <div class="card-container">
-                <div class="card-position">2号位置 (情感状态)</div>
-                <div class="card-name card-empty">💝 待揭示</div>
-            </div>
-            """, unsafe_allow_html=True)
+        st.markdown(f"### 💫 你的{self.plan.spread.title}正在等待...")
+        self.render_layout_grid(None)
     
     def render_active_layout(self):
         """渲染已抽取的牌阵布局"""
-        reading = st.session_state.current_reading
+        ceremony = st.session_state.ceremony_pending and self.ceremony_enabled()
+        st.session_state.ceremony_pending = False
+        if ceremony:
+            with st.spinner("🎲 正在抽取四季牌阵..."):
+                time.sleep(1)  # 增加仪式感
         
-        # 上排（4号位置）
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col2:
-            st.markdown(f"""
-            <div class="card-container">
-                <div class="card-position">4号位置 (事业财务)</div>
-                <div class="card-name">{reading[4].name}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # 中排（1、5、3号位置）
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col1:
-            st.markdown(f"""
-            <div class="card-container">
-                <div class="card-position">1号位置 (行动力)</div>
-                <div class="card-name">{reading[1].name}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown(f"""
-            <div class="card-container">
-                <div class="card-position">5号位置 (灵性成长)</div>
-                <div class="card-name core-card">{reading[5].name}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown(f"""
-            <div class="card-container">
-                <div class="card-position">3号位置 (理性思维)</div>
-                <div class="card-name">{reading[3].name}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # 下排（2号位置）
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col2:
-            st.markdown(f"""
-            <div class="card-container">
-                <div class="card-position">2号位置 (情感状态)</div>
-                <div class="card-name">{reading[2].name}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # 显示抽牌时间
-        st.caption(f"抽牌时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        self.render_layout_grid(st.session_state.current_reading)
+        if ceremony:
+            st.balloons()
+        
+        # 显示抽牌时间和凭证
+        st.caption(f"抽牌时间: {st.session_state.drawn_at.strftime('%Y-%m-%d %H:%M:%S')}")
+        if st.session_state.reading_ticket:
+            st.caption(f"牌阵凭证: {st.session_state.reading_ticket}")
+    
+    def render_layout_grid(self, reading: Optional[Dict[int, Card]]):
+        """
+        按牌阵定义的布局网格渲染每个位置
+        
+        整个牌阵拼成一个CSS网格，只输出一个HTML块，不再为每一行创建 st.columns
+        
+        Args:
+            reading: 抽牌结果字典，为None时显示占位文字
+        """
+        layout = self.plan.spread.layout
+        width = max(len(row) for row in layout)
+        cells = []
+        for row in layout:
+            for number in tuple(row) + (None,) * (width - len(row)):
+                if number is None:
+                    cells.append('<div class="card-gap"></div>')
+                    continue
+                position = self.plan.position(number)
+                if reading is None:
+                    css_class = "card-name card-empty"
+                    text = position.placeholder
+                elif number == self.plan.spread.core_position:
+                    css_class = "card-name core-card"
+                    text = reading[number].name
+                else:
+                    css_class = "card-name"
+                    text = reading[number].name
+                cells.append(
+                    f'<div class="card-container">'
+                    f'<div class="card-position">{html.escape(position.title)}</div>'
+                    f'<div class="{css_class}">{html.escape(text)}</div>'
+                    f'</div>'
+                )
+        st.markdown(
+            f'<div class="card-grid" style="grid-template-columns: repeat({width}, 1fr);">{"".join(cells)}</div>',
+            unsafe_allow_html=True
+        )
     
     def render_control_panel(self):
         """渲染控制面板"""
@@ -358,11 +384,15 @@ class StreamlitTarotApp:
             # 创建一个居中的大按钮
             col1, col2, col3 = st.columns([1, 2, 1])
             with col2:
-                if st.button("🔮 开始抽取四季牌阵 🔮", 
-                           type="primary", 
-                           use_container_width=True,
-                           help="一键抽取完整的四季牌阵（5张牌）"):
-                    self.draw_cards()
+                # 回调在片段重新运行之前抽牌，牌阵在同一次运行中直接显示
+                st.button("🔮 开始抽取四季牌阵 🔮", 
+                          type="primary", 
+                          use_container_width=True,
+                          help="一键抽取完整的四季牌阵（5张牌）",
+                          on_click=self.draw_cards)
+            
+            if st.session_state.draw_error:
+                st.error(f"❌ 抽牌失败: {st.session_state.draw_error}")
             
             st.markdown("---")
             st.info("💡 点击上方按钮将同时抽取所有5张牌，无需多次点击")
@@ -376,18 +406,19 @@ class StreamlitTarotApp:
             
             with col1:
                 api_enabled = st.session_state.api_configured
-                if st.button("🤖 AI智能分析", 
-                           disabled=not api_enabled,
-                           use_container_width=True,
-                           type="secondary"):
-                    self.start_ai_analysis()
+                analyze = st.button("🤖 AI智能分析", 
+                                    disabled=not api_enabled,
+                                    use_container_width=True,
+                                    type="secondary")
             
             with col2:
-                if st.button("🔄 重新抽牌", 
-                           use_container_width=True):
-                    st.session_state.current_reading = None
-                    st.session_state.analysis_results = None
-                    self.safe_rerun()
+                st.button("🔄 重新抽牌", 
+                          use_container_width=True,
+                          on_click=self.reset_reading)
+            
+            if analyze:
+                with metrics.RENDER_SECONDS.time(section="ai_analysis"):
+                    self.start_ai_analysis()
             
             # 状态提示
             if not st.session_state.api_configured:
@@ -397,61 +428,84 @@ class StreamlitTarotApp:
         
     
     def draw_cards(self):
-        """抽取四季牌阵"""
-        try:
-            # 显示开始信息
-            st.info("🎲 准备抽取四季牌阵...")
-            
-            # 导入模块调试
+        """抽取四季牌阵（「开始抽取」按钮的回调）"""
+        with metrics.RENDER_SECONDS.time(section="draw_cards"):
             try:
-                from 四季牌阵 import shuffle_and_draw, Card
-                st.success("✅ 模块导入成功")
-            except ImportError as e:
-                st.error(f"❌ 模块导入失败: {e}")
-                return
-            
-            with st.spinner("🎲 正在抽取四季牌阵..."):
-                time.sleep(1)  # 增加仪式感
-                
-                # 调用抽牌函数
-                st.info("📝 调用 shuffle_and_draw() 函数...")
-                reading = shuffle_and_draw()
-                st.info(f"📝 抽牌函数返回: {type(reading)}")
+                # 从本会话的随机数流抽牌
+                reading, ticket = st.session_state.rng_stream.draw(self.plan)
                 
                 # 确保reading不为空
                 if not reading:
                     raise ValueError("抽牌结果为空")
                 
-                st.info(f"📝 抽取到的牌阵包含 {len(reading)} 张牌")
-                
                 # 验证reading包含所有必需的位置
-                required_positions = [1, 2, 3, 4, 5]
-                for pos in required_positions:
+                for pos in (position.number for position in self.plan.positions):
                     if pos not in reading:
                         raise ValueError(f"缺少{pos}号位置的牌")
-                    else:
-                        st.info(f"📝 位置 {pos}: {reading[pos].name}")
                 
                 # 更新session state
                 st.session_state.current_reading = reading
+                st.session_state.reading_ticket = str(ticket)
+                st.session_state.drawn_at = datetime.now()
                 st.session_state.analysis_results = None
+                st.session_state.draw_error = None
+                st.session_state.ceremony_pending = True
+                self.start_speculation(reading)
                 
-                st.success("✅ Session state 更新成功")
-            
-            st.success("✅ 抽牌完成！")
-            st.balloons()
-            
-            # 强制重新运行以更新界面
-            time.sleep(1)
-            self.safe_rerun()
+            except Exception as e:
+                # 回调中不输出元素，错误信息在控制面板中显示
+                self.reset_reading()
+                st.session_state.draw_error = str(e)
+    
+    def reset_reading(self):
+        """清空当前牌阵和分析结果（「重新抽牌」按钮的回调，抽牌失败时也会调用）"""
+        self.cancel_speculation()
+        st.session_state.current_reading = None
+        st.session_state.reading_ticket = None
+        st.session_state.drawn_at = None
+        st.session_state.analysis_results = None
+    
+    def start_speculation(self, reading: Dict[int, Card]):
+        """
+        开启预先分析时，抽牌后立即在后台开始分析，并取消上一个牌阵的预先分析
+        
+        Args:
+            reading: 刚抽出的牌阵
+        """
+        self.cancel_speculation()
+        if not st.session_state.get('speculative_analysis', self.config.SPECULATIVE_ANALYSIS):
+            return
+        if not st.session_state.api_configured:
+            return
+        # 预先分析必须可以取消，未配置总时限时按单次请求超时的两倍限制
+        deadline = new_reading_deadline(self.config) or Deadline(self.config.REQUEST_TIMEOUT * 2)
+        st.session_state.speculation = self.analyzer.speculate(reading, deadline)
+    
+    def cancel_speculation(self):
+        """取消本会话进行中的预先分析（重新抽牌时调用）"""
+        speculation = st.session_state.speculation
+        st.session_state.speculation = None
+        if speculation is not None:
+            speculation.cancel()
+    
+    def take_speculation(self, reading: Dict[int, Card]) -> Optional[SpeculativeAnalysis]:
+        """
+        取出当前牌阵的预先分析，每个预先分析只使用一次
+        
+        Args:
+            reading: 当前牌阵
             
-        except Exception as e:
-            st.error(f"❌ 抽牌失败: {str(e)}")
-            import traceback
-            st.error(f"详细错误: {traceback.format_exc()}")
-            # 重置状态
-            st.session_state.current_reading = None
-            st.session_state.analysis_results = None
+        Returns:
+            属于该牌阵、未被取消且没有超过总时限的预先分析，没有时返回None
+        """
+        speculation = st.session_state.speculation
+        st.session_state.speculation = None
+        if speculation is None:
+            return None
+        if speculation.reading is not reading or speculation.cancelled or speculation.expired:
+            speculation.cancel()
+            return None
+        return speculation
     
     def start_ai_analysis(self):
         """开始AI分析"""
@@ -463,36 +517,95 @@ class StreamlitTarotApp:
             st.error("请先配置API密钥")
             return
         
+        part_labels = {
+            'full_analysis': "📝 详细分析",
+            'insight': "💡 核心洞察",
+            'seasonal_advice': "🌟 季节建议",
+        }
+        
+        # 分析过程显示在占位区域中，完成后清空，由同一次运行中的 render_analysis_results 显示结果，无需再次重新运行
+        live = st.empty()
         try:
-            with st.spinner("🤖 AI正在分析中，请稍候..."):
-                # 获取分析结果
-                analysis_result = self.analyzer.analyze_reading(
-                    st.session_state.current_reading, 
-                    None  # 不再支持用户自定义问题
-                )
+            with live.container(), st.spinner("🤖 AI正在分析中，请稍候..."):
+                reading = st.session_state.current_reading
+                # 三个分析请求共享一个总时限，服务变慢时最多等待 ANALYSIS_DEADLINE 秒
+                deadline = new_reading_deadline(self.config)
+                progress = st.progress(0.0, text="🤖 正在请求AI分析...")
+                results = {}
+                
+                def mark_done(part):
+                    progress.progress(
+                        len(results) / len(part_labels),
+                        text=f"✅ {part_labels[part]}已完成 ({len(results)}/{len(part_labels)})"
+                    )
+                
+                speculation = self.take_speculation(reading)
+                if speculation is not None:
+                    # 抽牌后已在后台开始分析，已完成的部分立即显示
+                    # 预先分析中失败的部分用本次点击的总时限重新请求
+                    parts = speculation.iter_parts(deadline)
+                elif self.config.ANALYSIS_MODE == "combined":
+                    # 一次结构化输出请求获取全部三项
+                    parts = self.analyzer.analyze_combined(reading, deadline).items()
+                elif self.config.STREAMING_ENABLED:
+                    # 快速洞察和季节建议在后台并发请求，同时逐字显示详细分析
+                    parts = self.analyzer.iter_analysis_parts(reading, ('insight', 'seasonal_advice'), deadline)
+                    with st.expander(part_labels['full_analysis'], expanded=True):
+                        results['full_analysis'] = self.write_stream(
+                            self.analyzer.analyze_reading_stream(reading, deadline)
+                        )
+                    mark_done('full_analysis')
+                else:
+                    # 三个分析请求并发发送，每完成一个就立即显示
+                    parts = self.analyzer.iter_analysis_parts(reading, deadline=deadline)
                 
-                insight = self.analyzer.get_quick_insight(st.session_state.current_reading)
-                advice_result = self.analyzer.get_seasonal_advice(st.session_state.current_reading)
+                for part, text in parts:
+                    results[part] = text
+                    mark_done(part)
+                    with st.expander(part_labels[part], expanded=(part == 'insight')):
+                        st.write(text)
                 
-                st.session_state.analysis_results = {
-                    'full_analysis': analysis_result.get("full_analysis", "分析失败"),
-                    'insight': insight,
-                    'seasonal_advice': advice_result.get("seasonal_advice", "建议获取失败"),
-                    'timestamp': datetime.now()
-                }
+                results['timestamp'] = datetime.now()
+                st.session_state.analysis_results = results
             
-            st.success("✅ AI分析完成！")
-            time.sleep(0.5)
-            self.safe_rerun()
+            live.empty()
+            offline = self.analyzer.offline.compose(reading)
+            if any(results.get(part) == text for part, text in offline.items()):
+                st.warning("⏱️ AI服务暂时不可用或响应较慢，部分内容显示的是本地牌义解读")
+            if hasattr(st, 'toast'):
+                st.toast("✅ AI分析完成！")
+            else:
+                st.success("✅ AI分析完成！")
             
         except Exception as e:
             st.error(f"❌ AI分析失败: {str(e)}")
             import traceback
             st.error(f"详细错误: {traceback.format_exc()}")
     
+    def write_stream(self, chunks) -> str:
+        """
+        逐段渲染流式文本，兼容没有 st.write_stream 的旧版Streamlit
+        
+        Args:
+            chunks: 文本片段迭代器
+            
+        Returns:
+            完整文本
+        """
+        if hasattr(st, 'write_stream'):
+            return st.write_stream(chunks)
+        placeholder = st.empty()
+        text = ""
+        for chunk in chunks:
+            text += chunk
+            placeholder.markdown(text)
+        return text
+    
     def render_analysis_results(self):
         """渲染分析结果"""
         if st.session_state.analysis_results is None:
+            if st.session_state.current_reading:
+                self.render_offline_preview(st.session_state.current_reading)
             return
         
         results = st.session_state.analysis_results
@@ -518,6 +631,24 @@ class StreamlitTarotApp:
         if st.button("📥 导出分析结果"):
             self.export_results()
     
+    def render_offline_preview(self, reading: Dict[int, Card]):
+        """抽牌后立即显示本地牌义速览，不等待AI分析"""
+        preview = self.analyzer.offline.compose(reading)
+        
+        st.subheader("📖 牌义速览")
+        st.info(f"✨ {preview['insight']}")
+        
+        with st.expander("📝 逐位解读", expanded=False):
+            st.markdown(preview['full_analysis'])
+        
+        with st.expander("🌟 季节建议", expanded=False):
+            st.write(preview['seasonal_advice'])
+        
+        if self.config.is_configured():
+            st.caption("以上为本地牌义解读，点击「AI智能分析」获取结合整个牌阵的个性化解读")
+        else:
+            st.caption("以上为本地牌义解读，在侧边栏配置API密钥后可获取AI深度分析")
+    
     def export_results(self):
         """导出分析结果"""
         if not st.session_state.analysis_results or not st.session_state.current_reading:
@@ -526,17 +657,18 @@ class StreamlitTarotApp:
         results = st.session_state.analysis_results
         reading = st.session_state.current_reading
         
+        cards_text = "\n".join(
+            f"{position.title}: {reading[position.number].name}" for position in self.plan.positions
+        )
+        
         # 创建导出内容
         export_content = f"""
-=== 四季牌阵占卜结果 ===
+=== {self.plan.spread.title}占卜结果 ===
 时间: {results['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}
+凭证: {st.session_state.reading_ticket}
 
 === 牌阵结果 ===
-1号位置 (行动力): {reading[1].name}
-2号位置 (情感状态): {reading[2].name}
-3号位置 (理性思维): {reading[3].name}
-4号位置 (事业财务): {reading[4].name}
-5号位置 (灵性成长): {reading[5].name}
+{cards_text}
 
 === 核心洞察 ===
 {results['insight']}
@@ -558,22 +690,37 @@ class StreamlitTarotApp:
             mime="text/plain"
         )
     
-    def run(self):
-        """运行应用程序"""
-        # 渲染页面组件
-        self.render_header()
-        self.render_sidebar()
+    @_fragment
+    def render_reading_area(self):
+        """
+        渲染牌阵、控制面板和分析结果
         
-        # 主内容区域
-        self.render_card_layout()
+        这一区域是一个片段：抽牌、重新抽牌、AI分析和导出只重新运行这里，
+        片段重新运行时沿用上一次整页运行创建的应用对象（配置快照和分析器）
+        """
+        with metrics.RENDER_SECONDS.time(section="card_layout"):
+            self.render_card_layout()
         
         st.divider()
         
+        # 按钮触发的抽牌和AI分析分别记为 draw_cards、ai_analysis
         self.render_control_panel()
         
         st.divider()
         
-        self.render_analysis_results()
+        with metrics.RENDER_SECONDS.time(section="analysis_results"):
+            self.render_analysis_results()
+    
+    def run(self):
+        """运行应用程序"""
+        # 渲染页面组件（各区域耗时记入 tarot_render_seconds）
+        with metrics.RENDER_SECONDS.time(section="header"):
+            self.render_header()
+        with metrics.RENDER_SECONDS.time(section="sidebar"):
+            self.render_sidebar()
+        
+        # 主内容区域
+        self.render_reading_area()
         
         # 页脚
         st.markdown("---")
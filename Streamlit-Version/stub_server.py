@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+本地OpenAI兼容的桩服务器
+实现 /v1/chat/completions（包括 stream=True 的SSE流式输出），首字延迟按可配置的分布抽样，
+生成速度按每秒token数模拟，并可按比例注入500、429、无响应和中途断开等故障，用于离线压测分析器
+
+延迟分布写法（--latency）：
+    0.5                    固定0.5秒
+    uniform:0.2,1.5        0.2~1.5秒均匀分布
+    normal:0.8,0.2         均值0.8秒、标准差0.2秒的正态分布（截断到0以上）
+    lognormal:0.8,0.5      中位数0.8秒、sigma 0.5的对数正态分布（长尾，接近真实服务商）
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Union
+
+
+class Distribution:
+    """
+    非负的随机延迟分布
+
+    用法：
+        latency = Distribution.parse("lognormal:0.8,0.5")
+        seconds = latency.sample(rng)
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, kind: str, *params: float):
+        """
+        Args:
+            kind: fixed、uniform、normal、lognormal
+            params: fixed 为 (秒,)；uniform 为 (下限, 上限)；normal 为 (均值, 标准差)；lognormal 为 (中位数, sigma)
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的延迟分布: {kind}，可选 {', '.join(self.KINDS)}")
+        if len(params) != self.KINDS[kind]:
+            raise ValueError(f"{kind} 分布需要 {self.KINDS[kind]} 个参数")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "Distribution"]) -> "Distribution":
+        """从数字或 "分布:参数1,参数2" 形式的字符串解析"""
+        if isinstance(spec, Distribution):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, _, params = spec.partition(":")
+        if not params:
+            return cls("fixed", float(kind))
+        return cls(kind.strip(), *(float(value) for value in params.split(",")))
+
+    def sample(self, rng: random.Random) -> float:
+        """抽取一个延迟（秒）"""
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(*self.params))
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma)
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(f'{value:g}' for value in self.params)}"
+
+
+class StubServer:
+    """
+    基于asyncio的轻量HTTP/1.1桩服务器，支持keep-alive和分块传输的SSE，可在后台线程中运行
+
+    用法：
+        with StubServer(latency="lognormal:0.8,0.5", token_rate=60, error_rate=0.02) as server:
+            Config.API_BASE_URL = server.base_url
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: Union[str, float, Distribution] = 0.5,
+                 reply: str = "（桩服务器模拟回复）四季流转，万物各得其时。",
+                 token_rate: Optional[float] = None, reply_tokens: Optional[int] = None,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 hang_rate: float = 0.0, disconnect_rate: float = 0.0,
+                 hang_seconds: float = 120.0, chunk_tokens: int = 4, seed: Optional[int] = None):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            latency: 首字延迟（秒）或延迟分布，参见 Distribution.parse
+            reply: 回复内容
+            token_rate: 每秒生成的token数（按每个字符一个token计），为None时首字之后立即生成完毕
+            reply_tokens: 回复长度，重复 reply 直到该长度；为None时直接使用 reply；均不超过请求的 max_tokens
+            error_rate: 返回500的比例
+            rate_limit_rate: 返回429（带 Retry-After）的比例
+            hang_rate: 不返回任何内容、hang_seconds 秒后断开的比例，用于测试客户端超时
+            disconnect_rate: 回复到一半时断开连接的比例（流式请求收不到 [DONE]）
+            hang_seconds: 无响应请求保持连接的时间（秒）
+            chunk_tokens: 流式输出每个事件包含的token数
+            seed: 随机种子，用于复现延迟和故障序列
+        """
+        self.host = host
+        self.port = port
+        self.latency = Distribution.parse(latency)
+        self.reply = reply
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.disconnect_rate = disconnect_rate
+        self.hang_seconds = hang_seconds
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.rng = random.Random(seed)
+        self.requests_served = 0
+        self.stats: Counter = Counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接上的多个请求（keep-alive）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                keep_alive = True
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    keep_alive = await self._chat_completions(json.loads(body or b"{}"), writer)
+                else:
+                    self._write_json(writer, 200 if method == "GET" else 404, {"object": "list", "data": []})
+                if not keep_alive:
+                    break
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # 服务器关闭时仍保持的空闲连接会被取消，属于正常退出
+            pass
+        finally:
+            writer.close()
+
+    def _inject_fault(self) -> Optional[str]:
+        """按配置的比例抽取本次请求要注入的故障，没有故障时返回None"""
+        roll = self.rng.random()
+        for fault, rate in (("error_500", self.error_rate), ("error_429", self.rate_limit_rate),
+                            ("hang", self.hang_rate), ("disconnect", self.disconnect_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def _completion_text(self, request: Dict) -> str:
+        """生成回复文本：长度不超过 max_tokens；要求JSON对象时返回包含三项分析的JSON"""
+        text = self.reply
+        if self.reply_tokens:
+            text = (self.reply * (self.reply_tokens // len(self.reply) + 1))[:self.reply_tokens]
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"full_analysis": text, "insight": self.reply, "seasonal_advice": text},
+                              ensure_ascii=False)
+        return text[:request.get("max_tokens") or len(text)]
+
+    async def _chat_completions(self, request: Dict, writer: asyncio.StreamWriter) -> bool:
+        """
+        返回模拟的chat/completions回复（普通或SSE流式）
+
+        Returns:
+            连接是否还能继续使用
+        """
+        self.requests_served += 1
+        self.stats["requests"] += 1
+        fault = self._inject_fault()
+        if fault:
+            self.stats[fault] += 1
+        if fault == "hang":
+            await asyncio.sleep(self.hang_seconds)
+            return False
+
+        await asyncio.sleep(self.latency.sample(self.rng))
+        if fault == "error_500":
+            self._write_json(writer, 500, {"error": {"message": "injected server error", "type": "server_error"}})
+            return True
+        if fault == "error_429":
+            self._write_json(writer, 429, {"error": {"message": "injected rate limit", "type": "rate_limit"}},
+                             extra_headers={"Retry-After": "1"})
+            return True
+
+        text = self._completion_text(request)
+        # 粗略按字符数模拟提示词token数
+        prompt_tokens = sum(len(message.get("content", "")) for message in request.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(text),
+            "total_tokens": prompt_tokens + len(text),
+        }
+        if request.get("stream"):
+            self.stats["streams"] += 1
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            return await self._stream(request, writer, text, usage if include_usage else None,
+                                      disconnect=fault == "disconnect")
+
+        if fault == "disconnect":
+            # 生成到一半时断开，不返回任何响应
+            await asyncio.sleep(self._generation_time(len(text)) / 2)
+            writer.transport.abort()
+            return False
+        await asyncio.sleep(self._generation_time(len(text)))
+        self._write_json(writer, 200, {
+            "id": f"stub-{self.requests_served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+        return True
+
+    def _generation_time(self, tokens: int) -> float:
+        """按 token_rate 计算生成 tokens 个token所需的时间"""
+        return tokens / self.token_rate if self.token_rate else 0.0
+
+    async def _stream(self, request: Dict, writer: asyncio.StreamWriter, text: str,
+                      usage: Optional[Dict], disconnect: bool) -> bool:
+        """以分块传输的SSE逐段发送回复，最后发送 usage（如果请求了）和 [DONE]"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        base = {"id": f"stub-{self.requests_served}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "stub")}
+        pieces = [text[index:index + self.chunk_tokens] for index in range(0, len(text), self.chunk_tokens)]
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(self._generation_time(len(piece)))
+            if disconnect and index >= len(pieces) // 2:
+                await writer.drain()
+                writer.transport.abort()
+                return False
+            self._write_event(writer, {**base, "choices": [{"index": 0, "delta": {"content": piece},
+                                                             "finish_reason": None}]})
+            await writer.drain()
+        self._write_event(writer, {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if usage is not None:
+            self._write_event(writer, {**base, "choices": [], "usage": usage})
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        return True
+
+    @classmethod
+    def _write_event(cls, writer: asyncio.StreamWriter, event: Dict):
+        cls._write_chunk(writer, f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+
+    @staticmethod
+    def _write_json(writer: asyncio.StreamWriter, status: int, payload: Dict,
+                    extra_headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = "".join(f"{name}: {value}\r\n" for name, value in (extra_headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"{headers}"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+
+    async def serve(self):
+        """在当前事件循环中运行，直到被取消"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop = asyncio.get_running_loop()
+        self._ready.set()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start(self) -> "StubServer":
+        """在后台线程中启动服务器"""
+        def _run():
+            try:
+                asyncio.run(self.serve())
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=_run, name="stub-server", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """停止后台线程中的服务器"""
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    """向命令行解析器添加桩服务器参数（load_test.py 等脚本复用）"""
+    parser.add_argument("--latency", default="0.5", help="首字延迟（秒）或分布，例如 lognormal:0.8,0.5")
+    parser.add_argument("--token-rate", type=float, default=None, help="每秒生成的token数，默认立即生成完毕")
+    parser.add_argument("--reply-tokens", type=int, default=None, help="回复长度（token数）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="不返回任何内容的比例")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="回复到一半断开连接的比例")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def stub_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> StubServer:
+    """按 add_stub_arguments 添加的参数创建桩服务器"""
+    return StubServer(
+        host, port, latency=args.latency, token_rate=args.token_rate, reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        hang_rate=args.hang_rate, disconnect_rate=args.disconnect_rate, seed=args.seed,
+    )
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = stub_from_args(args, args.host, args.port)
+    print(f"🧪 桩服务器已启动: {server.base_url}（首字延迟 {server.latency}）")
+    print(f"   export AIHUBMIX_BASE_URL={server.base_url}")
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print("\n桩服务器已停止")
+
+
+if __name__ == "__main__":
+    main()
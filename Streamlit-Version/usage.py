@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+AI调用用量统计
+记录每次调用的提示词、生成和命中服务商前缀缓存的token数，按 方法 + 模型 汇总，
+可选逐条追加到JSONL日志，用于分析成本、延迟和前缀缓存命中率
+"""
+
+import json
+import threading
+import time
+import unicodedata
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class UsageRecord:
+    """一次AI调用的用量"""
+    method: str                      # 调用方法：full_analysis、insight、seasonal_advice、combined
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0           # 提示词中命中服务商前缀缓存的部分
+    latency: float = 0.0             # 请求耗时（秒）
+    from_cache: bool = False         # 是否直接由本地回复缓存返回（未发往上游）
+    timestamp: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_response(cls, method: str, model: str, usage: Optional[Dict[str, Any]],
+                      latency: float) -> "UsageRecord":
+        """
+        从响应中的 usage 字段构建记录
+
+        Args:
+            method: 调用方法
+            model: 模型名称
+            usage: 响应的 usage 字段，服务商未返回时为None
+            latency: 请求耗时（秒）
+        """
+        usage = usage or {}
+        details = usage.get("prompt_tokens_details") or {}
+        return cls(
+            method=method,
+            model=model,
+            prompt_tokens=usage.get("prompt_tokens") or 0,
+            completion_tokens=usage.get("completion_tokens") or 0,
+            cached_tokens=details.get("cached_tokens") or 0,
+            latency=latency,
+        )
+
+
+@dataclass
+class UsageTotals:
+    """一组调用的汇总"""
+    calls: int = 0
+    cache_hits: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency: float = 0.0
+
+    def add(self, record: UsageRecord):
+        if record.from_cache:
+            self.cache_hits += 1
+            return
+        self.calls += 1
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.cached_tokens += record.cached_tokens
+        self.latency += record.latency
+
+    @property
+    def cached_ratio(self) -> float:
+        """提示词token中命中前缀缓存的比例"""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency / self.calls if self.calls else 0.0
+
+
+class UsageTracker:
+    """线程安全的用量统计"""
+
+    def __init__(self, log_path: Optional[str] = None, keep_recent: int = 200):
+        """
+        Args:
+            log_path: JSONL日志路径，为None时只在内存中统计
+            keep_recent: 内存中保留的最近调用记录数
+        """
+        self.log_path = log_path
+        self.recent: Deque[UsageRecord] = deque(maxlen=keep_recent)
+        self._totals: Dict[Tuple[str, str], UsageTotals] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: UsageRecord):
+        """记录一次调用"""
+        with self._lock:
+            self.recent.append(record)
+            self._totals.setdefault((record.method, record.model), UsageTotals()).add(record)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+
+    def totals(self) -> Dict[Tuple[str, str], UsageTotals]:
+        """按 (方法, 模型) 汇总的用量副本"""
+        with self._lock:
+            return {key: UsageTotals(**asdict(totals)) for key, totals in self._totals.items()}
+
+    def overall(self) -> UsageTotals:
+        """全部调用的汇总"""
+        overall = UsageTotals()
+        for totals in self.totals().values():
+            for name in asdict(overall):
+                setattr(overall, name, getattr(overall, name) + getattr(totals, name))
+        return overall
+
+    def reset(self):
+        """清空内存中的统计（不影响日志文件）"""
+        with self._lock:
+            self.recent.clear()
+            self._totals.clear()
+
+
+def aggregate(records: Iterable[UsageRecord]) -> Dict[Tuple[str, str], UsageTotals]:
+    """按 (方法, 模型) 汇总任意记录"""
+    totals: Dict[Tuple[str, str], UsageTotals] = {}
+    for record in records:
+        totals.setdefault((record.method, record.model), UsageTotals()).add(record)
+    return totals
+
+
+def _pad(text: str, width: int, align_right: bool = True) -> str:
+    """按终端显示宽度补齐（中文字符占两格）"""
+    display = sum(2 if unicodedata.east_asian_width(char) in "WF" else 1 for char in text)
+    padding = " " * max(0, width - display)
+    return padding + text if align_right else text + padding
+
+
+def format_report(totals: Dict[Tuple[str, str], UsageTotals]) -> str:
+    """将汇总格式化为文本表格"""
+    columns = (("方法", 16), ("模型", 20), ("调用", 6), ("缓存命中", 10), ("提示词", 10), ("生成", 10),
+               ("前缀缓存", 10), ("缓存率", 8), ("平均耗时", 10))
+    rows = [[name for name, _ in columns]]
+    for (method, model), item in sorted(totals.items()):
+        rows.append([
+            method, model, str(item.calls), str(item.cache_hits), str(item.prompt_tokens),
+            str(item.completion_tokens), str(item.cached_tokens), f"{item.cached_ratio:.1%}",
+            f"{item.mean_latency:.2f}s",
+        ])
+    return "\n".join(
+        "".join(_pad(cell, width, align_right=index >= 2) for index, (cell, (_, width)) in enumerate(zip(row, columns)))
+        for row in rows
+    )
+
+
+_default_tracker: Optional[UsageTracker] = None
+_default_lock = threading.Lock()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """获取进程级共享的用量统计，Config.USAGE_LOG_PATH 不为None时同时写入日志"""
+    global _default_tracker
+    from config import Config
+
+    if _default_tracker is None:
+        with _default_lock:
+            if _default_tracker is None:
+                _default_tracker = UsageTracker(log_path=Config.USAGE_LOG_PATH)
+    return _default_tracker
+
+
+def load_log(path: str) -> List[UsageRecord]:
+    """读取JSONL用量日志"""
+    with open(path, encoding="utf-8") as f:
+        return [UsageRecord(**json.loads(line)) for line in f if line.strip()]
+
+
+def main():
+    """命令行入口：汇总用量日志"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="汇总AI调用用量日志")
+    parser.add_argument("log", help="JSONL用量日志（TAROT_USAGE_LOG）")
+    args = parser.parse_args()
+
+    totals = aggregate(load_log(args.log))
+    print(format_report(totals))
+
+
+if __name__ == "__main__":
+    main()
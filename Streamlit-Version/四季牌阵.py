@@ -1,6 +1,14 @@
 # 导入所需的库
+from dataclasses import dataclass  # 用于定义不可变的牌阵结构
 from enum import Enum  # 用于创建枚举类型
 import random  # 用于随机选择和洗牌
+import time  # 用于记录抽牌耗时
+
+import metrics  # 抽牌耗时指标
+from lazy_imports import lazy_import  # 延迟加载较重的依赖
+
+# 可选依赖，仅批量抽牌时使用；第一次批量抽牌时才加载（约90毫秒），未安装时为None
+np = lazy_import("numpy")
 
 # 定义大阿尔卡那牌的枚举
 class MajorArcana(Enum):
@@ -100,116 +108,466 @@ class MinorArcana(Enum):
     金币皇后 = "金币皇后"
     金币国王 = "金币国王"
 
+# 全局卡牌编号：0-21 为大阿尔卡那，22-77 依次为权杖、圣杯、宝剑、金币
+ALL_CARDS = tuple(MajorArcana) + tuple(MinorArcana)
+CARD_INDEX = {card: index for index, card in enumerate(ALL_CARDS)}
+
 # 定义卡牌类
 class Card:
     """
     代表一张塔罗牌，包含牌的枚举成员和是否逆位的信息。
+    所有 78 张牌 x 正逆位共 156 种状态在导入时预先创建（享元），
+    Card(card_enum, is_reversed) 只是查表返回对应的唯一实例，实例不可修改。
     """
-    def __init__(self, card_enum, is_reversed=False):
+    __slots__ = ("card", "is_reversed", "name", "id")
+    
+    def __new__(cls, card_enum, is_reversed=False):
         """
-        初始化一张牌。
+        获取一张牌的唯一实例。
         :param card_enum: 牌的枚举成员 (来自 MajorArcana 或 MinorArcana)
         :param is_reversed: 布尔值，表示牌是否为逆位
+        :return: CARD_TABLE 中对应的 Card 实例
         """
-        self.card = card_enum
-        self.is_reversed = is_reversed
+        try:
+            return CARD_TABLE[CARD_INDEX[card_enum] * 2 + bool(is_reversed)]
+        except KeyError:
+            raise ValueError(f"未知的塔罗牌: {card_enum!r}") from None
     
-    @property
-    def name(self):
-        """
-        获取卡牌的完整名称，包括正位或逆位状态。
-        :return: 字符串，例如 "魔术师 (正位)" 或 "权杖一 (逆位)"
-        """
+    @classmethod
+    def _create(cls, card_enum, is_reversed):
+        """仅在构建享元表时调用，预先计算显示名称和整数编号"""
+        self = object.__new__(cls)
         # 根据牌的类型获取基础名称
-        if isinstance(self.card, MajorArcana):
-            base_name = self.card.name
+        if isinstance(card_enum, MajorArcana):
+            base_name = card_enum.name
         else:
-            base_name = self.card.value
+            base_name = card_enum.value
         # 判断并添加正逆位标识
-        position = "逆位" if self.is_reversed else "正位"
-        return f"{base_name} ({position})"
+        position = "逆位" if is_reversed else "正位"
+        object.__setattr__(self, "card", card_enum)
+        object.__setattr__(self, "is_reversed", is_reversed)
+        # 完整名称，例如 "魔术师 (正位)" 或 "权杖一 (逆位)"
+        object.__setattr__(self, "name", f"{base_name} ({position})")
+        # 整数编号：全局卡牌编号 * 2 + 是否逆位，范围 0-155
+        object.__setattr__(self, "id", CARD_INDEX[card_enum] * 2 + int(is_reversed))
+        return self
+    
+    def __setattr__(self, key, value):
+        raise AttributeError("Card 对象不可修改")
+    
+    def __delattr__(self, key):
+        raise AttributeError("Card 对象不可修改")
+    
+    def __reduce__(self):
+        # 复制或反序列化时返回同一个享元实例
+        return card_from_id, (self.id,)
+    
+    def __repr__(self):
+        return f"Card({self.name})"
+
+# 享元表：下标即 Card.id
+CARD_TABLE = tuple(
+    Card._create(card_enum, is_reversed)
+    for card_enum in ALL_CARDS
+    for is_reversed in (False, True)
+)
+
+# 根据整数编号获取卡牌
+def card_from_id(card_id):
+    """
+    根据 Card.id 查表获取卡牌。
+    :param card_id: 0-155 之间的整数
+    :return: Card 对象
+    """
+    return CARD_TABLE[card_id]
+
+# 不可变牌组表，在导入时构建一次
+MAJOR_ARCANA_DECK = tuple(MajorArcana)
+WANDS_DECK = tuple(card for card in MinorArcana if card.value.startswith('权杖'))
+CUPS_DECK = tuple(card for card in MinorArcana if card.value.startswith('圣杯'))
+SWORDS_DECK = tuple(card for card in MinorArcana if card.value.startswith('宝剑'))
+PENTACLES_DECK = tuple(card for card in MinorArcana if card.value.startswith('金币'))
 
 # 初始化塔罗牌牌组
 def initialize_tarot_decks():
     """
     创建并分类所有的塔罗牌。
     :return: 一个元组，包含五个列表：大阿尔卡那，权杖，圣杯，宝剑和金币。
+             每次调用都返回新的列表，调用方可以自由修改（洗牌、抽牌）。
     """
-    # 创建大阿尔卡那牌组
-    major_arcana = list(MajorArcana)
-    
-    # 创建小阿尔卡那牌组并按花色分类
-    minor_arcana = list(MinorArcana)
-    wands = [card for card in minor_arcana if card.value.startswith('权杖')]
-    cups = [card for card in minor_arcana if card.value.startswith('圣杯')]
-    swords = [card for card in minor_arcana if card.value.startswith('宝剑')]
-    pentacles = [card for card in minor_arcana if card.value.startswith('金币')]
-    
-    return major_arcana, wands, cups, swords, pentacles
+    return (list(MAJOR_ARCANA_DECK), list(WANDS_DECK), list(CUPS_DECK),
+            list(SWORDS_DECK), list(PENTACLES_DECK))
+
+# 根据随机数源获取 randbelow(n) 函数
+def get_randbelow(rng=None):
+    """
+    将不同类型的随机数源统一为 randbelow(n) 函数，返回 [0, n) 内均匀分布的整数。
+    :param rng: 随机数源，支持：
+                None（模块全局的 random 状态）、random.Random 实例（含 SystemRandom）、
+                numpy.random.Generator、secrets 模块（或任何提供 randbelow 的对象）
+    :return: 可调用对象 randbelow(n)
+    """
+    if rng is None:
+        return random.randrange
+    if hasattr(rng, "randbelow"):
+        return rng.randbelow
+    if hasattr(rng, "randrange"):
+        return rng.randrange
+    if hasattr(rng, "integers"):
+        return lambda n: int(rng.integers(n))
+    raise TypeError(f"不支持的随机数源: {type(rng).__name__}")
+
+# 从牌组中不放回地抽取 k 张牌
+def sample_cards(deck, k, rng=None):
+    """
+    使用部分 Fisher–Yates 算法从牌组中抽取 k 张牌，只做 k 次交换，不洗整副牌，也不修改原牌组。
+    被交换过的位置记录在字典中，因此时间和额外空间都是 O(k)。
+    :param deck: 卡牌序列（列表或元组）
+    :param k: 要抽取的张数
+    :param rng: 随机数源，参见 get_randbelow
+    :return: 抽出的 k 张牌枚举成员列表，按抽取顺序排列
+    """
+    size = len(deck)
+    if not 0 <= k <= size:
+        raise ValueError(f"无法从 {size} 张牌中抽取 {k} 张")
+    randbelow = get_randbelow(rng)
+    swapped = {}
+    picked = []
+    for i in range(k):
+        j = i + randbelow(size - i)
+        picked.append(deck[swapped.get(j, j)])
+        swapped[j] = swapped.get(i, i)
+    return picked
 
 # 从牌组中抽一张牌
-def draw_card(deck):
+def draw_card(deck, rng=None):
     """
     从指定的牌组中抽取最上面的一张牌，并随机决定其正逆位。
     :param deck: 一个卡牌列表
+    :param rng: 随机数源，参见 get_randbelow
     :return: 一个 Card 对象
     """
     card_enum = deck.pop()  # 从牌组中移除并返回最后一张牌
-    is_reversed = random.choice([True, False])  # 随机决定正位或逆位
+    is_reversed = get_randbelow(rng)(2) == 1  # 随机决定正位或逆位
     return Card(card_enum, is_reversed)
 
+# 定义牌阵中的一个位置
+@dataclass(frozen=True)
+class SpreadPosition:
+    """
+    牌阵中的一个位置。
+    :param number: 位置编号，也是牌阵字典的键
+    :param deck: 该位置抽牌的牌组表（如 WANDS_DECK）
+    :param label: 界面上显示的位置含义，例如 "行动力"
+    :param prompt_label: 发送给AI时使用的位置描述
+    :param placeholder: 尚未抽牌时显示的占位文字
+    """
+    number: int
+    deck: tuple
+    label: str
+    prompt_label: str
+    placeholder: str = "待揭示"
+
+    @property
+    def title(self):
+        """位置标题，例如 "1号位置 (行动力)" """
+        return f"{self.number}号位置 ({self.label})"
+
+# 定义一个牌阵
+@dataclass(frozen=True)
+class SpreadDefinition:
+    """
+    声明式的牌阵定义，只需声明一次，抽牌、显示和AI提示词都由它编译而来。
+    :param key: 注册表中的唯一标识
+    :param title: 牌阵名称
+    :param positions: SpreadPosition 元组
+    :param prompt_order: 发送给AI时的位置顺序
+    :param layout: 布局网格，每行是位置编号元组，None 表示空格
+    :param core_position: 需要突出显示的核心位置编号
+    """
+    key: str
+    title: str
+    positions: tuple
+    prompt_order: tuple
+    layout: tuple
+    core_position: int = None
+
+# 编译后的抽牌计划
+@dataclass(frozen=True)
+class DrawPlan:
+    """
+    由 SpreadDefinition 预先编译的抽牌计划，运行时不再重建字典和位置名称映射。
+    :param spread: 原始牌阵定义
+    :param options: 每个位置可抽到的 Card 元组（含正逆位），按位置顺序排列
+    :param deck_ranges: 每个位置牌组在 ALL_CARDS 中的 (起始编号, 张数)，供批量抽牌和编码使用
+    :param prompt_template: 按 prompt_order 排列的提示词模板
+    """
+    spread: SpreadDefinition
+    options: tuple
+    deck_ranges: tuple
+    prompt_template: str
+
+    @property
+    def positions(self):
+        return self.spread.positions
+
+    def position(self, number):
+        """根据编号获取 SpreadPosition"""
+        return self.spread.positions[number - 1]
+
+    def draw(self, rng=None):
+        """
+        按计划抽取一个牌阵。每个位置只需一张牌，因此直接在"牌面 x 正逆位"表中均匀选取一项，
+        与完整洗牌后取顶牌再随机正逆位的分布相同，但每个位置只消耗一次随机数。
+        :param rng: 随机数源，参见 get_randbelow；传入带种子的 random.Random 可复现结果
+        :return: 牌阵字典，键为位置编号，值为 Card 对象
+        """
+        randbelow = get_randbelow(rng)
+        return {
+            number: choices[randbelow(len(choices))]
+            for number, choices in enumerate(self.options, start=1)
+        }
+
+    def draw_batch(self, n, rng=None):
+        """
+        使用NumPy一次性抽取 n 个牌阵，返回紧凑的数组而不是 Card 对象。
+        :param n: 要抽取的牌阵数量
+        :param rng: numpy.random.Generator 或随机种子，默认使用新的 Generator
+        :return: 元组 (cards, reversed)：
+                 cards 为 (n, 位置数) 的 uint8 数组，值为 ALL_CARDS 中的全局编号，第 i 列对应 i+1 号位置；
+                 reversed 为同形状的布尔数组，True 表示逆位。
+        """
+        if np is None:
+            raise ImportError("批量抽牌需要安装numpy: pip install numpy")
+        if n < 0:
+            raise ValueError("牌阵数量不能为负数")
+        if not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(rng)
+
+        # 每个位置独立地在对应牌组的全局编号区间内均匀取值；按列生成比广播上界快数倍
+        cards = np.empty((n, len(self.deck_ranges)), dtype=np.uint8)
+        for column, (start, size) in enumerate(self.deck_ranges):
+            cards[:, column] = rng.integers(start, start + size, size=n, dtype=np.uint8)
+
+        # 正逆位各占50%，直接把随机字节拆成比特位即可
+        raw_bits = np.frombuffer(rng.bytes((cards.size + 7) // 8), dtype=np.uint8)
+        reversed_mask = np.unpackbits(raw_bits, count=cards.size).reshape(cards.shape).view(np.bool_)
+        return cards, reversed_mask
+
+    def format_prompt(self, reading):
+        """按 prompt_order 将牌阵格式化为AI提示词中的卡牌信息文本"""
+        return self.prompt_template.format(
+            *(reading[number].name for number in self.spread.prompt_order)
+        )
+
+# 牌阵注册表
+SPREADS = {}
+
+# 编译牌阵定义
+def compile_spread(spread):
+    """
+    将 SpreadDefinition 编译为 DrawPlan。
+    :param spread: SpreadDefinition 对象
+    :return: DrawPlan 对象
+    """
+    numbers = tuple(position.number for position in spread.positions)
+    if numbers != tuple(range(1, len(numbers) + 1)):
+        raise ValueError(f"牌阵 {spread.key} 的位置编号必须从1开始连续排列")
+    if sorted(spread.prompt_order) != list(numbers):
+        raise ValueError(f"牌阵 {spread.key} 的提示词顺序必须包含每个位置各一次")
+
+    deck_ranges = []
+    for position in spread.positions:
+        start = CARD_INDEX[position.deck[0]]
+        if ALL_CARDS[start:start + len(position.deck)] != position.deck:
+            raise ValueError(f"{position.title} 的牌组必须是 ALL_CARDS 中的连续区间")
+        deck_ranges.append((start, len(position.deck)))
+
+    options = tuple(
+        tuple(Card(card_enum, is_reversed) for card_enum in position.deck for is_reversed in (False, True))
+        for position in spread.positions
+    )
+    prompt_template = "\n".join(
+        spread.positions[number - 1].prompt_label.replace("{", "{{").replace("}", "}}") + "：{}"
+        for number in spread.prompt_order
+    )
+    return DrawPlan(spread, options, tuple(deck_ranges), prompt_template)
+
+# 注册牌阵
+def register_spread(spread):
+    """
+    编译并注册一个牌阵，之后可通过 get_spread(spread.key) 获取。
+    :param spread: SpreadDefinition 对象
+    :return: 编译后的 DrawPlan
+    """
+    plan = compile_spread(spread)
+    SPREADS[spread.key] = plan
+    return plan
+
+# 获取已注册的牌阵
+def get_spread(key):
+    """
+    根据标识获取已编译的抽牌计划。
+    :param key: 牌阵标识，例如 "four_seasons"
+    :return: DrawPlan 对象
+    """
+    try:
+        return SPREADS[key]
+    except KeyError:
+        raise KeyError(f"未注册的牌阵: {key}") from None
+
+# 按照"四季牌阵"的规则从不同牌组中抽取牌
+# 1号位（春）：权杖，代表能量和新开始
+# 2号位（夏）：圣杯，代表情感和关系
+# 3号位（秋）：宝剑，代表思想和挑战
+# 4号位（冬）：金币，代表物质和收获
+# 5号位（核心）：大阿尔卡那，代表核心主题和灵性指引
+FOUR_SEASONS = register_spread(SpreadDefinition(
+    key="four_seasons",
+    title="四季牌阵",
+    positions=(
+        SpreadPosition(1, WANDS_DECK, "行动力", "1号位置（权杖牌组-行动力）", "⚡ 待揭示"),
+        SpreadPosition(2, CUPS_DECK, "情感状态", "2号位置（圣杯牌组-情感状态）", "💝 待揭示"),
+        SpreadPosition(3, SWORDS_DECK, "理性思维", "3号位置（宝剑牌组-理性思维）", "🧠 待揭示"),
+        SpreadPosition(4, PENTACLES_DECK, "事业财务", "4号位置（金币牌组-事业财务）", "📊 待揭示"),
+        SpreadPosition(5, MAJOR_ARCANA_DECK, "灵性成长", "5号位置（大阿尔卡纳-心灵成长）", "✨ 核心奥秘"),
+    ),
+    prompt_order=(5, 1, 2, 3, 4),  # 按重要性排序
+    layout=(
+        (None, 4, None),
+        (1, 5, 3),
+        (None, 2, None),
+    ),
+    core_position=5,
+))
+
+# 四季牌阵中每个位置对应牌组在 ALL_CARDS 中的 (起始编号, 张数)，顺序与牌阵位置 1-5 一致
+SPREAD_DECK_RANGES = FOUR_SEASONS.deck_ranges
+
 # 洗牌并抽取一个完整的牌阵
-def shuffle_and_draw():
+def shuffle_and_draw(rng=None):
     """
-    执行完整的抽牌流程：初始化牌组，洗牌，然后抽取一个"四季牌阵"。
+    执行完整的抽牌流程，抽取一个"四季牌阵"。
+    :param rng: 随机数源，参见 get_randbelow；传入带种子的 random.Random 可复现结果
     :return: 一个字典，包含五张抽出的牌，对应牌阵中的五个位置。
     """
-    major_arcana, wands, cups, swords, pentacles = initialize_tarot_decks()
-    
-    # 分别洗乱每个牌组
-    random.shuffle(major_arcana)
-    random.shuffle(wands)
-    random.shuffle(cups)
-    random.shuffle(swords)
-    random.shuffle(pentacles)
-    
-    # 按照"四季牌阵"的规则从不同牌组中抽取牌
-    # 1号位（春）：权杖，代表能量和新开始
-    # 2号位（夏）：圣杯，代表情感和关系
-    # 3号位（秋）：宝剑，代表思想和挑战
-    # 4号位（冬）：金币，代表物质和收获
-    # 5号位（核心）：大阿尔卡那，代表核心主题和灵性指引
-    reading = {
-        1: draw_card(wands),      
-        2: draw_card(cups),       
-        3: draw_card(swords),     
-        4: draw_card(pentacles),  
-        5: draw_card(major_arcana) 
-    }
-    
+    started = time.perf_counter()
+    reading = FOUR_SEASONS.draw(rng)
+    metrics.DRAW_SHUFFLE_SECONDS.observe(time.perf_counter() - started)
     return reading
 
+# 批量抽取多个牌阵
+def shuffle_and_draw_batch(n, rng=None):
+    """
+    使用NumPy一次性抽取 n 个"四季牌阵"，参见 DrawPlan.draw_batch。
+    :param n: 要抽取的牌阵数量
+    :param rng: numpy.random.Generator 或随机种子，默认使用新的 Generator
+    :return: 元组 (cards, reversed)，均为 (n, 5) 数组
+    """
+    return FOUR_SEASONS.draw_batch(n, rng)
+
+# 将批量抽牌结果还原为牌阵字典
+def batch_to_readings(cards, reversed_mask):
+    """
+    将 shuffle_and_draw_batch 返回的数组转换为与 shuffle_and_draw 相同格式的牌阵字典列表。
+    :param cards: (n, 5) 的全局卡牌编号数组
+    :param reversed_mask: (n, 5) 的逆位布尔数组
+    :return: 牌阵字典列表，每个字典的键为位置 1-5，值为 Card 对象
+    """
+    readings = []
+    for row_cards, row_reversed in zip(cards.tolist(), reversed_mask.tolist()):
+        readings.append({
+            position: CARD_TABLE[card_index * 2 + is_reversed]
+            for position, (card_index, is_reversed) in enumerate(zip(row_cards, row_reversed), start=1)
+        })
+    return readings
+
+# 牌阵编码的取值空间：14⁴ · 22 · 2⁵ = 27,044,864，可放入 32 位整数
+def _reading_code_space():
+    space = 1 << len(SPREAD_DECK_RANGES)
+    for _, size in SPREAD_DECK_RANGES:
+        space *= size
+    return space
+
+READING_CODE_SPACE = _reading_code_space()
+
+# 将牌阵编码为整数
+def encode_reading(reading):
+    """
+    将牌阵字典紧凑地编码为一个整数，可用作缓存键、数据库主键、传输格式或去重哈希。
+    高位按 1-5 号位置依次存放每张牌在所属牌组中的序号（混合进制），低 5 位存放各位置的逆位标记。
+    :param reading: 牌阵字典，键为位置 1-5，值为 Card 对象
+    :return: 0 到 READING_CODE_SPACE - 1 之间的整数
+    """
+    code = 0
+    reversed_bits = 0
+    for position, (start, size) in enumerate(SPREAD_DECK_RANGES, start=1):
+        card = reading[position]
+        rank = (card.id >> 1) - start
+        if not 0 <= rank < size:
+            raise ValueError(f"{position}号位置的牌不属于该位置的牌组: {card.name}")
+        code = code * size + rank
+        reversed_bits |= card.is_reversed << (position - 1)
+    return (code << len(SPREAD_DECK_RANGES)) | reversed_bits
+
+# 将整数解码为牌阵
+def decode_reading(code):
+    """
+    encode_reading 的逆运算，O(1) 地还原牌阵字典。
+    :param code: encode_reading 返回的整数
+    :return: 牌阵字典，键为位置 1-5，值为 Card 对象
+    """
+    if not 0 <= code < READING_CODE_SPACE:
+        raise ValueError(f"无效的牌阵编码: {code}")
+    positions = len(SPREAD_DECK_RANGES)
+    reversed_bits = code & ((1 << positions) - 1)
+    code >>= positions
+    reading = {}
+    for position in range(positions, 0, -1):
+        start, size = SPREAD_DECK_RANGES[position - 1]
+        code, rank = divmod(code, size)
+        is_reversed = (reversed_bits >> (position - 1)) & 1
+        reading[position] = CARD_TABLE[(start + rank) * 2 + is_reversed]
+    return dict(sorted(reading.items()))
+
+# 批量编码牌阵
+def encode_batch(cards, reversed_mask):
+    """
+    encode_reading 的向量化版本，用于 shuffle_and_draw_batch 的结果。
+    :param cards: (n, 5) 的全局卡牌编号数组
+    :param reversed_mask: (n, 5) 的逆位布尔数组
+    :return: 长度为 n 的 uint32 编码数组，与逐个调用 encode_reading 的结果一致
+    """
+    if np is None:
+        raise ImportError("批量编码需要安装numpy: pip install numpy")
+    codes = np.zeros(len(cards), dtype=np.uint32)
+    for column, (start, size) in enumerate(SPREAD_DECK_RANGES):
+        codes *= size
+        codes += cards[:, column] - np.uint8(start)
+    codes <<= len(SPREAD_DECK_RANGES)
+    weights = np.uint32(1) << np.arange(len(SPREAD_DECK_RANGES), dtype=np.uint32)
+    codes |= reversed_mask.astype(np.uint32) @ weights
+    return codes
+
 # 显示抽牌结果
-def display_reading():
+def display_reading(plan=FOUR_SEASONS):
     """
-    执行抽牌并以可读的格式打印出"四季牌阵"的结果。
-    按照正确的牌阵布局显示：
+    执行抽牌并按牌阵定义的布局以可读的格式打印结果。
+    四季牌阵的布局为：
           4
       1   5   3
           2
+    :param plan: 要抽取的牌阵，默认为四季牌阵
     """
-    reading = shuffle_and_draw()
+    reading = plan.draw()
     
-    print("\n=== 四季牌阵 ===")
-    print()
-    print(f"            4号位置 (事业财富)")
-    print(f"            {reading[4].name}")
-    print()
-    print(f"1号位置 (能量和能力)        5号位置 (灵性成长)        3号位置 (思考能力)")
-    print(f"{reading[1].name}        {reading[5].name}        {reading[3].name}")
-    print()  
-    print(f"            2号位置 (情感状况)")
-    print(f"            {reading[2].name}")
+    print(f"\n=== {plan.spread.title} ===")
+    for row in plan.spread.layout:
+        numbers = [number for number in row if number is not None]
+        indent = "" if len(numbers) > 1 else " " * 12
+        print()
+        print(indent + "        ".join(plan.position(number).title for number in numbers))
+        print(indent + "        ".join(reading[number].name for number in numbers))
 
 # 主程序入口
 if __name__ == "__main__":